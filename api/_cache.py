@@ -0,0 +1,230 @@
+"""
+Caché de respuestas por UPC + query normalizada para /api/search y /api/shopping.
+
+- TTL por endpoint y ventana stale-while-revalidate: pasado el TTL se sirve
+  la respuesta vieja y se refresca en segundo plano (hilo daemon). En Vercel
+  la instancia se congela al responder, así que el refresco puede quedar a
+  medias hasta la siguiente petición a esa instancia o perderse si la
+  reciclan; mientras tanto se sigue sirviendo la vieja, a lo más hasta
+  ttl + stale_ttl. Si eso importa, bajar el *_CACHE_STALE del endpoint.
+- LRU con tope de memoria (bytes UTF-8 del JSON guardado).
+- Backend intercambiable: dict en proceso (default) o archivo SQLite local.
+
+Configuración (env):
+    RESULT_CACHE_BACKEND    memory | sqlite      (default memory)
+    RESULT_CACHE_PATH       archivo SQLite       (default /tmp/upc_result_cache.sqlite3)
+    RESULT_CACHE_MAX_BYTES  tope total en bytes  (default 32 MB)
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from api._json import dumps_str
+
+RESULT_CACHE_BACKEND = os.environ.get('RESULT_CACHE_BACKEND', 'memory')
+RESULT_CACHE_PATH = os.environ.get('RESULT_CACHE_PATH', '/tmp/upc_result_cache.sqlite3')
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+
+def normalize_query(query: str) -> str:
+    """Minúsculas y espacios colapsados"""
+    return re.sub(r'\s+', ' ', (query or '').strip().lower())
+
+
+def cache_key(upc: str, query: str) -> str:
+    return f"{upc or ''}|{normalize_query(query)}"
+
+
+def _size(value_json: str) -> int:
+    """Bytes reales del JSON (len(str) cuenta caracteres: los acentos pesan 2)"""
+    return len(value_json.encode('utf-8'))
+
+
+class MemoryBackend:
+    """LRU en proceso; guarda el JSON serializado para medir y no compartir objetos"""
+
+    def __init__(self, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()   # key -> (json_text, stored_at, bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            self._items.move_to_end(key)
+            return item[:2]
+
+    def set(self, key, value_json: str, stored_at: float):
+        size = _size(value_json)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._items[key] = (value_json, stored_at, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted) = self._items.popitem(last=False)
+                self._bytes -= evicted
+
+    def delete(self, key):
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+
+
+class SQLiteBackend:
+    """Sustituto local persistente: un archivo SQLite con la misma política LRU"""
+
+    def __init__(self, path: str = RESULT_CACHE_PATH, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS result_cache ('
+            ' key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL,'
+            ' accessed_at REAL NOT NULL, size INTEGER NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS result_cache_lru ON result_cache (accessed_at)')
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, stored_at FROM result_cache WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute('UPDATE result_cache SET accessed_at = ? WHERE key = ?', (time.time(), key))
+            self._conn.commit()
+            return row[0], row[1]
+
+    def set(self, key, value_json: str, stored_at: float):
+        size = _size(value_json)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO result_cache (key, value, stored_at, accessed_at, size)'
+                ' VALUES (?, ?, ?, ?, ?)',
+                (key, value_json, stored_at, time.time(), size)
+            )
+            total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM result_cache').fetchone()[0]
+            while total > self.max_bytes:
+                row = self._conn.execute(
+                    'SELECT key, size FROM result_cache ORDER BY accessed_at LIMIT 1'
+                ).fetchone()
+                if row is None:
+                    break
+                self._conn.execute('DELETE FROM result_cache WHERE key = ?', (row[0],))
+                total -= row[1]
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute('DELETE FROM result_cache WHERE key = ?', (key,))
+            self._conn.commit()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Backend compartido por proceso según RESULT_CACHE_BACKEND"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if RESULT_CACHE_BACKEND == 'sqlite':
+                    _backend = SQLiteBackend()
+                else:
+                    _backend = MemoryBackend()
+    return _backend
+
+
+class ResultCache:
+    """
+    Caché de un endpoint. fetch() regresa (valor, info) donde info indica
+    status (hit | stale | miss | bypass) y age en segundos.
+    """
+
+    def __init__(self, name: str, ttl: float, stale_ttl: float = 0, backend=None):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._backend = backend
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        return self._backend or get_backend()
+
+    def get(self, key: str, compute=None, cacheable=None):
+        """
+        (valor, info) si key está vigente o en ventana stale; None si no está.
+        Con compute, una entrada stale se refresca en segundo plano.
+        """
+        full_key = f'{self.name}:{key}'
+        item = self.backend.get(full_key)
+        if item is None:
+            return None
+        value_json, stored_at = item
+        age = time.time() - stored_at
+        if age <= self.ttl:
+            return json.loads(value_json), {'status': 'hit', 'age': int(age)}
+        if age <= self.ttl + self.stale_ttl:
+            if compute is not None:
+                self._revalidate_async(full_key, compute, cacheable)
+            return json.loads(value_json), {'status': 'stale', 'age': int(age)}
+        self.backend.delete(full_key)
+        return None
+
+    def put(self, key: str, value, cacheable=None):
+        self._store(f'{self.name}:{key}', value, cacheable)
+
+    def fetch(self, key: str, compute, cacheable=None, bypass: bool = False):
+        """
+        Busca key; si no está (o expiró) llama compute() y guarda el resultado
+        cuando cacheable(resultado) es verdadero.
+        """
+        if not bypass:
+            cached = self.get(key, compute, cacheable)
+            if cached is not None:
+                return cached
+
+        value = compute()
+        self.put(key, value, cacheable)
+        return value, {'status': 'bypass' if bypass else 'miss', 'age': 0}
+
+    def _store(self, full_key, value, cacheable):
+        if cacheable is not None and not cacheable(value):
+            return
+        self.backend.set(full_key, dumps_str(value), time.time())
+
+    def _revalidate_async(self, full_key, compute, cacheable):
+        with self._lock:
+            if full_key in self._refreshing:
+                return
+            self._refreshing.add(full_key)
+
+        def run():
+            try:
+                self._store(full_key, compute(), cacheable)
+            except Exception as e:
+                print(f"Error refrescando caché {full_key}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(full_key)
+
+        threading.Thread(target=run, daemon=True).start()
@@ -0,0 +1,124 @@
+"""
+Deadline de punta a punta por petición.
+
+start_deadline(ms) fija el presupuesto de la petición (contextvar, como la
+traza; bind() de _trace lo lleva a los hilos de un pool). Cada etapa pide
+su timeout con stage_timeout(nombre, tope): recibe lo que quede del
+presupuesto (sin pasar de su tope) o None si ya no alcanza, y entonces la
+etapa se salta y el endpoint regresa lo que tenga (regex sin Gemini,
+orgánicos deduplicados, shopping_fallback...). Las etapas saltadas quedan
+en deadline_info() y la respuesta sale con partial: true.
+
+Sin deadline activo (ej. revalidación de caché en segundo plano) todo
+funciona como antes: stage_timeout regresa el tope.
+
+Configuración (env):
+    REQUEST_DEADLINE_MS      presupuesto por defecto           (9000)
+    REQUEST_MAX_DEADLINE_MS  tope que puede pedir el cliente   (25000)
+    DEADLINE_RESERVE_MS      se guarda para serializar/enviar  (150)
+    DEADLINE_MIN_STAGE_MS    mínimo para intentar una etapa    (300)
+"""
+import contextvars
+import os
+import threading
+import time
+
+from api._trace import note
+
+REQUEST_DEADLINE_MS = int(os.environ.get('REQUEST_DEADLINE_MS', 9000))
+REQUEST_MAX_DEADLINE_MS = int(os.environ.get('REQUEST_MAX_DEADLINE_MS', 25000))
+DEADLINE_RESERVE_MS = int(os.environ.get('DEADLINE_RESERVE_MS', 150))
+DEADLINE_MIN_STAGE_MS = int(os.environ.get('DEADLINE_MIN_STAGE_MS', 300))
+
+_current = contextvars.ContextVar('deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """No queda presupuesto ni para la etapa indispensable de la petición"""
+
+
+class Deadline:
+    def __init__(self, budget_ms: int):
+        self.budget_ms = budget_ms
+        self.started = time.monotonic()
+        self.expires = self.started + budget_ms / 1000
+        self.skipped = []
+        self._lock = threading.Lock()
+
+    def remaining(self) -> float:
+        """Segundos que quedan para etapas (ya sin la reserva final)"""
+        return max(0.0, self.expires - time.monotonic() - DEADLINE_RESERVE_MS / 1000)
+
+    def stage_timeout(self, name: str, cap: float, min_s: float = None):
+        left = self.remaining()
+        if left < (DEADLINE_MIN_STAGE_MS / 1000 if min_s is None else min_s):
+            self.skip(name)
+            return None
+        return min(cap, left) if cap else left
+
+    def skip(self, name: str):
+        with self._lock:
+            if name not in self.skipped:
+                self.skipped.append(name)
+        note(deadline_skipped=list(self.skipped))
+
+    def info(self) -> dict:
+        return {
+            'budget_ms': self.budget_ms,
+            'elapsed_ms': int((time.monotonic() - self.started) * 1000),
+            'skipped': list(self.skipped),
+        }
+
+
+def request_budget_ms(requested=None, default: int = REQUEST_DEADLINE_MS,
+                      maximum: int = REQUEST_MAX_DEADLINE_MS) -> int:
+    """deadline_ms pedido por el cliente, acotado; el default si no viene o no es válido"""
+    try:
+        value = int(requested) if requested else default
+    except (TypeError, ValueError):
+        value = default
+    return max(1, min(value, maximum))
+
+
+def start_deadline(budget_ms: int) -> Deadline:
+    deadline = Deadline(budget_ms)
+    _current.set(deadline)
+    return deadline
+
+
+def current():
+    return _current.get()
+
+
+def remaining(default: float = None):
+    deadline = _current.get()
+    return deadline.remaining() if deadline is not None else default
+
+
+def stage_timeout(name: str, cap: float, min_s: float = None):
+    """Timeout para la etapa: min(cap, lo que queda); None si ya no alcanza"""
+    deadline = _current.get()
+    if deadline is None:
+        return cap
+    return deadline.stage_timeout(name, cap, min_s)
+
+
+def expired() -> bool:
+    deadline = _current.get()
+    return deadline is not None and deadline.remaining() <= 0
+
+
+def skip(name: str):
+    deadline = _current.get()
+    if deadline is not None:
+        deadline.skip(name)
+
+
+def skipped() -> list:
+    deadline = _current.get()
+    return list(deadline.skipped) if deadline is not None else []
+
+
+def deadline_info():
+    deadline = _current.get()
+    return deadline.info() if deadline is not None else None
@@ -0,0 +1,80 @@
+"""
+Cliente de Gemini compartido por search.py, shopping.py y fetch.py.
+
+google.generativeai tarda en importarse (protobuf, grpc, google.api_core) y
+en un arranque en frío de Vercel ese costo caía en la primera petición,
+aunque no llegara a usar el modelo (fetch sólo con regex, search con
+precios de rich snippets, respuestas desde caché). Aquí:
+
+- El SDK se importa (y se configura la llave) la primera vez que se pide un
+  modelo; el tiempo de import queda en la traza de esa petición
+  (gemini_import_ms).
+- Un GenerativeModel por (nombre, configuración) por proceso; las
+  instancias calientes lo reutilizan entre peticiones.
+- prewarm() importa el SDK en un hilo de fondo al cargar el módulo del
+  endpoint (shopping casi siempre usa el modelo): el handler empieza a
+  atender sin esperarlo y la llamada al modelo lo encuentra listo o a
+  medias.
+
+Configuración (env):
+    GEMINI_API_KEY    llave de la API
+    GEMINI_PREWARM    1 | 0: prewarm() hace algo      (default 1)
+"""
+import json
+import os
+import threading
+import time
+
+from api._trace import note
+
+GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
+GEMINI_PREWARM = os.environ.get('GEMINI_PREWARM', '1') == '1'
+
+_genai = None
+_models = {}
+_lock = threading.Lock()
+# ms que tomó importar el SDK en este proceso (None: todavía no se importa)
+import_ms = None
+
+
+def genai():
+    """El módulo google.generativeai, importado y configurado una sola vez"""
+    global _genai, import_ms
+    if _genai is None:
+        with _lock:
+            if _genai is None:
+                t0 = time.perf_counter()
+                import google.generativeai as sdk
+                if GEMINI_API_KEY:
+                    sdk.configure(api_key=GEMINI_API_KEY)
+                import_ms = round((time.perf_counter() - t0) * 1000, 1)
+                _genai = sdk
+                note(gemini_import_ms=import_ms)
+    return _genai
+
+
+def get_model(name: str, **config):
+    """GenerativeModel reutilizable (uno por nombre + configuración por proceso)"""
+    key = (name, json.dumps(config, sort_keys=True))
+    model = _models.get(key)
+    if model is None:
+        sdk = genai()
+        with _lock:
+            model = _models.get(key)
+            if model is None:
+                model = _models[key] = sdk.GenerativeModel(name, **config)
+    return model
+
+
+def prewarm():
+    """Importa el SDK en un hilo de fondo (si hay llave y GEMINI_PREWARM=1)"""
+    if _genai is not None or not (GEMINI_PREWARM and GEMINI_API_KEY):
+        return
+
+    def _warm():
+        try:
+            genai()
+        except Exception as e:
+            print(f"⚠️ No se pudo precargar Gemini: {e}")
+
+    threading.Thread(target=_warm, name='gemini-prewarm', daemon=True).start()
@@ -0,0 +1,287 @@
+"""
+Gobernador de proveedores externos (SerpApi, Google Shopping, Gemini),
+compartido por los hilos del proceso.
+
+Por proveedor:
+- Token bucket adaptativo: ante un 429 / ResourceExhausted la tasa baja a la
+  mitad (hasta min_rate) y sube de a poco con cada éxito hasta la configurada.
+  Si no hay token en UPSTREAM_MAX_WAIT_S no se espera más: UpstreamUnavailable.
+- Circuit breaker por tasa de error en las últimas N llamadas: abierto, las
+  llamadas fallan al instante con UpstreamUnavailable y cada endpoint cae a
+  su fallback de siempre (dedupe manual, shopping_fallback, regex), que sale
+  marcado degraded y no se cachea. Pasado el cooldown deja pasar una llamada
+  de prueba (half_open).
+- Las respuestas en stream van por stream(): el resultado cuenta para el
+  breaker al terminar de leerlas, no al recibir el primer pedazo.
+
+upstream_wait(None) quita el tope de espera por token (lo usa el batch, que
+sí debe esperar su turno). governor_state() regresa el estado de todos para exponerlo en las respuestas.
+
+Configuración (env, <P> = SERPAPI | GOOGLE | GEMINI):
+    UPSTREAM_<P>_RPS             peticiones por segundo       (5 / 2 / 4)
+    UPSTREAM_<P>_TIMEOUT         timeout por llamada (s)      (20 / 10 / 25)
+    UPSTREAM_<P>_MIN_BUDGET_MS   mínimo del deadline para     (800 / 800 / 1500)
+                                 intentar la llamada
+    UPSTREAM_MAX_WAIT_S          espera máxima por token      (2)
+    UPSTREAM_BREAKER_WINDOW      llamadas observadas          (20)
+    UPSTREAM_BREAKER_MIN_CALLS   mínimo para evaluar          (5)
+    UPSTREAM_BREAKER_ERROR_RATE  tasa de error que lo abre    (0.5)
+    UPSTREAM_BREAKER_COOLDOWN_S  segundos abierto             (30)
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from api._ratelimit import TokenBucket
+from api._trace import count
+from api._deadline import remaining, stage_timeout, skip
+
+UPSTREAM_MAX_WAIT_S = float(os.environ.get('UPSTREAM_MAX_WAIT_S', 2))
+UPSTREAM_BREAKER_WINDOW = int(os.environ.get('UPSTREAM_BREAKER_WINDOW', 20))
+UPSTREAM_BREAKER_MIN_CALLS = int(os.environ.get('UPSTREAM_BREAKER_MIN_CALLS', 5))
+UPSTREAM_BREAKER_ERROR_RATE = float(os.environ.get('UPSTREAM_BREAKER_ERROR_RATE', 0.5))
+UPSTREAM_BREAKER_COOLDOWN_S = float(os.environ.get('UPSTREAM_BREAKER_COOLDOWN_S', 30))
+
+_max_wait = contextvars.ContextVar('upstream_max_wait', default=UPSTREAM_MAX_WAIT_S)
+
+
+class UpstreamUnavailable(Exception):
+    """El proveedor no se llamó: breaker abierto o sin token a tiempo"""
+
+    def __init__(self, provider: str, reason: str):
+        super().__init__(f'{provider}: {reason}')
+        self.provider = provider
+        self.reason = reason
+
+
+def _is_throttle(error: Exception) -> bool:
+    """429 de requests o ResourceExhausted / TooManyRequests de google-api-core"""
+    response = getattr(error, 'response', None)
+    if getattr(response, 'status_code', None) == 429 or getattr(error, 'code', None) == 429:
+        return True
+    return type(error).__name__ in ('ResourceExhausted', 'TooManyRequests')
+
+
+class CircuitBreaker:
+    """closed -> open (tasa de error alta) -> half_open (una prueba) -> closed"""
+
+    def __init__(self, window: int = UPSTREAM_BREAKER_WINDOW, min_calls: int = UPSTREAM_BREAKER_MIN_CALLS,
+                 error_rate: float = UPSTREAM_BREAKER_ERROR_RATE, cooldown: float = UPSTREAM_BREAKER_COOLDOWN_S):
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.opened_at = 0.0
+        self.last_error = None
+        self._results = deque(maxlen=window)   # True = error
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record(self, error: Exception = None):
+        with self._lock:
+            if self.state == 'half_open':
+                self._probing = False
+                if error is None:
+                    self.state = 'closed'
+                    self._results.clear()
+                else:
+                    self._open(error)
+                return
+            self._results.append(error is not None)
+            if error is not None:
+                self.last_error = str(error)[:200]
+            errors = sum(self._results)
+            if len(self._results) >= self.min_calls and errors / len(self._results) >= self.error_rate:
+                self._open(error)
+
+    def release_probe(self):
+        """Una prueba de half_open que al final no se hizo"""
+        with self._lock:
+            self._probing = False
+
+    def _open(self, error):
+        self.state = 'open'
+        self.opened_at = time.monotonic()
+        self._results.clear()
+        if error is not None:
+            self.last_error = str(error)[:200]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            calls = len(self._results)
+            info = {
+                'state': self.state,
+                'error_rate': round(sum(self._results) / calls, 2) if calls else 0.0,
+                'window_calls': calls,
+                'last_error': self.last_error,
+            }
+            if self.state != 'closed':
+                info['retry_in_s'] = round(max(0.0, self.cooldown - (time.monotonic() - self.opened_at)), 1)
+            return info
+
+
+class Upstream:
+    """Un proveedor: rate limit adaptativo + breaker + timeout sugerido"""
+
+    def __init__(self, name: str, rate: float, timeout: float, min_budget: float = 0, min_rate: float = None):
+        self.name = name
+        self.max_rate = rate
+        self.min_rate = min_rate if min_rate is not None else max(rate / 8, 0.1)
+        self.timeout = timeout
+        self.min_budget = min_budget
+        self.bucket = TokenBucket(rate)
+        self.breaker = CircuitBreaker()
+        self.stats = {'calls': 0, 'errors': 0, 'throttled': 0, 'short_circuited': 0}
+        self._lock = threading.Lock()
+
+    def budget(self):
+        """Timeout para la llamada dentro del deadline de la petición; None si no alcanza"""
+        return stage_timeout(self.name, self.timeout, self.min_budget)
+
+    def call(self, fn, *args, **kwargs):
+        """fn(*args, **kwargs) bajo el gobernador; UpstreamUnavailable si no se llamó"""
+        self._admit()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._failed(e)
+            raise
+        self._succeeded()
+        return result
+
+    def stream(self, fn, *args, read=None, **kwargs):
+        """
+        Como call, para respuestas que se leen por pedazos (stream=True de
+        Gemini): es un generador con los pedazos (read(pedazo) si se pasa,
+        ej. el .text de Gemini, que también puede fallar). Nada pasa hasta el
+        primer next(): ahí se toma el turno (y la prueba del breaker
+        semiabierto), y el éxito o error se registra al terminar de leerlo,
+        así un error a media lectura también cuenta para el breaker.
+        """
+        self._admit()
+        try:
+            for piece in fn(*args, **kwargs):
+                yield read(piece) if read else piece
+        except Exception as e:
+            self._failed(e)
+            raise
+        except GeneratorExit:
+            # Quien lee lo dejó a medias por su cuenta: no dice nada del proveedor
+            self.breaker.release_probe()
+            raise
+        self._succeeded()
+
+    def _admit(self):
+        if not self.breaker.allow():
+            self._short_circuit('breaker abierto')
+        wait = _max_wait.get()
+        left = remaining()
+        if left is not None:
+            # Tampoco se espera turno más allá del deadline de la petición
+            wait = left if wait is None else min(wait, left)
+        if not self.bucket.acquire(timeout=wait):
+            self._short_circuit('rate limit')
+        self._bump('calls')
+
+    def _failed(self, e: Exception):
+        self._bump('errors')
+        if _is_throttle(e):
+            self._bump('throttled')
+            self._adapt(throttled=True)
+        left = remaining()
+        if left is not None and left <= 0.05:
+            # Cortada por el deadline de la petición: etapa saltada, no
+            # es culpa del proveedor y no cuenta para el breaker
+            skip(self.name)
+            self.breaker.release_probe()
+        else:
+            self.breaker.record(e)
+
+    def _succeeded(self):
+        self.breaker.record()
+        self._adapt(throttled=False)
+
+    def _short_circuit(self, reason):
+        self._bump('short_circuited')
+        count(upstream_short_circuits=1)
+        if reason == 'rate limit':
+            self.breaker.release_probe()
+        raise UpstreamUnavailable(self.name, reason)
+
+    def _adapt(self, throttled: bool):
+        """AIMD: mitad ante throttle, +5% de la tasa máxima por éxito"""
+        if self.max_rate <= 0:
+            return
+        rate = self.bucket.rate
+        if throttled:
+            new_rate = max(self.min_rate, rate / 2)
+        elif rate < self.max_rate:
+            new_rate = min(self.max_rate, rate + self.max_rate * 0.05)
+        else:
+            return
+        if new_rate != rate:
+            self.bucket.set_rate(new_rate)
+
+    def _bump(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+        return {
+            **self.breaker.snapshot(),
+            'rate': round(self.bucket.rate, 2),
+            'max_rate': self.max_rate,
+            **stats,
+        }
+
+
+SERPAPI = Upstream(
+    'serpapi',
+    rate=float(os.environ.get('UPSTREAM_SERPAPI_RPS', 5)),
+    timeout=float(os.environ.get('UPSTREAM_SERPAPI_TIMEOUT', 20)),
+    min_budget=int(os.environ.get('UPSTREAM_SERPAPI_MIN_BUDGET_MS', 800)) / 1000,
+)
+GOOGLE = Upstream(
+    'google_shopping',
+    rate=float(os.environ.get('UPSTREAM_GOOGLE_RPS', 2)),
+    timeout=float(os.environ.get('UPSTREAM_GOOGLE_TIMEOUT', 10)),
+    min_budget=int(os.environ.get('UPSTREAM_GOOGLE_MIN_BUDGET_MS', 800)) / 1000,
+)
+GEMINI = Upstream(
+    'gemini',
+    rate=float(os.environ.get('UPSTREAM_GEMINI_RPS', 4)),
+    timeout=float(os.environ.get('UPSTREAM_GEMINI_TIMEOUT', 25)),
+    min_budget=int(os.environ.get('UPSTREAM_GEMINI_MIN_BUDGET_MS', 1500)) / 1000,
+)
+UPSTREAMS = {u.name: u for u in (SERPAPI, GOOGLE, GEMINI)}
+
+
+@contextmanager
+def upstream_wait(seconds):
+    """Espera máxima por token dentro del bloque (None: sin tope, ej. batch)"""
+    token = _max_wait.set(seconds)
+    try:
+        yield
+    finally:
+        _max_wait.reset(token)
+
+
+def governor_state() -> dict:
+    """Estado de breakers y tasas por proveedor"""
+    return {name: upstream.snapshot() for name, upstream in UPSTREAMS.items()}
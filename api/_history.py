@@ -0,0 +1,186 @@
+"""
+Historial de precios por página de producto (SQLite local), para no volver
+a extraer lo que no cambió.
+
+Por URL canónica (y UPC si se conoce) se guarda lo último extraído junto
+con ETag / Last-Modified y un hash del contenido leído:
+
+- /api/fetch manda If-None-Match / If-Modified-Since; con 304 regresa lo
+  guardado sin descargar ni extraer.
+- Con 200 y el mismo hash (misma página byte a byte) se reutiliza la
+  extracción guardada y se saltan datos estructurados y Gemini.
+- Cada precio distinto queda en prices (sólo se agrega, no se edita), así
+  last_price() / history() responden sin red.
+
+Configuración (env):
+    PRICE_HISTORY         1 | 0                     (default 1)
+    PRICE_HISTORY_PATH    archivo SQLite            (default /tmp/upc_price_history.sqlite3)
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+PRICE_HISTORY = os.environ.get('PRICE_HISTORY', '1') == '1'
+PRICE_HISTORY_PATH = os.environ.get('PRICE_HISTORY_PATH', '/tmp/upc_price_history.sqlite3')
+# Filas máximas que regresa history() (el "limit" del cliente se acota a esto)
+HISTORY_MAX_ROWS = 200
+
+# Parámetros que no cambian la página (campañas, clics de anuncios)
+_TRACKING_PARAM_RE = re.compile(r'^(?:utm_\w+|gclid|gclsrc|dclid|fbclid|msclkid|srsltid|mc_[ce]id|_ga|ref|ref_)$', re.I)
+
+
+def canonical_url(url: str) -> str:
+    """Esquema y host en minúsculas, sin fragmento, sin parámetros de tracking, query ordenada"""
+    parts = urlsplit((url or '').strip())
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if not _TRACKING_PARAM_RE.match(k))
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, urlencode(query), ''))
+
+
+class PriceHistory:
+    def __init__(self, path: str = PRICE_HISTORY_PATH, enabled: bool = PRICE_HISTORY):
+        self.path = path
+        self.enabled = enabled
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _db(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS pages ('
+                ' url TEXT PRIMARY KEY, upc TEXT, etag TEXT, last_modified TEXT, content_hash TEXT,'
+                ' result TEXT, checked_at REAL NOT NULL, changed_at REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS prices ('
+                ' url TEXT NOT NULL, upc TEXT, price REAL, currency TEXT, seller TEXT, observed_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS prices_url ON prices (url, observed_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS prices_upc ON prices (upc, observed_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS pages_upc ON pages (upc)')
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def page(self, url: str):
+        """Lo guardado de la URL: dict con etag, last_modified, content_hash, result...; None si no está"""
+        if not self.enabled:
+            return None
+        try:
+            with self._lock:
+                row = self._db().execute(
+                    'SELECT upc, etag, last_modified, content_hash, result, checked_at, changed_at'
+                    ' FROM pages WHERE url = ?', (canonical_url(url),)
+                ).fetchone()
+        except sqlite3.Error as e:
+            print(f"⚠️ Historial de precios no disponible: {e}")
+            return None
+        if row is None:
+            return None
+        upc, etag, last_modified, content_hash, result, checked_at, changed_at = row
+        return {
+            'upc': upc,
+            'etag': etag,
+            'last_modified': last_modified,
+            'content_hash': content_hash,
+            'result': json.loads(result) if result else None,
+            'checked_at': checked_at,
+            'changed_at': changed_at,
+        }
+
+    def record(self, url: str, result: dict, upc: str = None, etag: str = None,
+               last_modified: str = None, content_hash: str = None, changed: bool = True):
+        """
+        Guarda la extracción de la URL (changed=False: sólo se confirmó que
+        sigue igual) y agrega el precio a prices si es distinto al último.
+        """
+        if not self.enabled:
+            return
+        key = canonical_url(url)
+        now = time.time()
+        try:
+            with self._lock:
+                db = self._db()
+                old = db.execute('SELECT upc, changed_at FROM pages WHERE url = ?', (key,)).fetchone()
+                upc = upc or (old[0] if old else None)
+                changed_at = now if changed or old is None else old[1]
+                db.execute(
+                    'INSERT OR REPLACE INTO pages'
+                    ' (url, upc, etag, last_modified, content_hash, result, checked_at, changed_at)'
+                    ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (key, upc, etag, last_modified, content_hash,
+                     json.dumps(result, ensure_ascii=False), now, changed_at)
+                )
+                last = db.execute(
+                    'SELECT price, currency, seller FROM prices WHERE url = ? ORDER BY observed_at DESC LIMIT 1',
+                    (key,)
+                ).fetchone()
+                current = (result.get('price'), result.get('currency'), result.get('seller'))
+                if last is None or tuple(last) != current:
+                    db.execute(
+                        'INSERT INTO prices (url, upc, price, currency, seller, observed_at) VALUES (?, ?, ?, ?, ?, ?)',
+                        (key, upc) + current + (now,)
+                    )
+                db.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️ No se pudo guardar el historial de precios: {e}")
+
+    def touch(self, url: str):
+        """304: la página sigue igual"""
+        if not self.enabled:
+            return
+        try:
+            with self._lock:
+                db = self._db()
+                db.execute('UPDATE pages SET checked_at = ? WHERE url = ?', (time.time(), canonical_url(url)))
+                db.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️ No se pudo guardar el historial de precios: {e}")
+
+    def last_price(self, url: str = None, upc: str = None):
+        """
+        Último precio conocido de la URL, o de cada página del UPC (el más
+        reciente primero), sin red. None si no hay nada.
+        """
+        if not self.enabled or not (url or upc):
+            return None
+        if url:
+            where, arg = 'url = ?', canonical_url(url)
+        else:
+            where, arg = 'upc = ?', upc
+        with self._lock:
+            rows = self._db().execute(
+                'SELECT url, upc, price, currency, seller, MAX(observed_at) FROM prices'
+                f' WHERE {where} AND price IS NOT NULL GROUP BY url ORDER BY MAX(observed_at) DESC', (arg,)
+            ).fetchall()
+            checked = dict(self._db().execute(f'SELECT url, checked_at FROM pages WHERE {where}', (arg,)).fetchall())
+        offers = [{
+            'url': row[0], 'upc': row[1], 'price': row[2], 'currency': row[3], 'seller': row[4],
+            'observed_at': int(row[5]),
+            'checked_at': int(checked[row[0]]) if checked.get(row[0]) else None,
+        } for row in rows]
+        if not offers:
+            return None
+        return offers[0] if url else {'upc': upc, 'offers': offers,
+                                      'min_price': min(o['price'] for o in offers)}
+
+    def history(self, url: str = None, upc: str = None, limit: int = 50) -> list:
+        """Cambios de precio, el más reciente primero"""
+        if not self.enabled or not (url or upc):
+            return []
+        limit = max(1, min(limit, HISTORY_MAX_ROWS))
+        where, arg = ('url = ?', canonical_url(url)) if url else ('upc = ?', upc)
+        with self._lock:
+            rows = self._db().execute(
+                f'SELECT url, price, currency, seller, observed_at FROM prices WHERE {where}'
+                ' ORDER BY observed_at DESC LIMIT ?', (arg, limit)
+            ).fetchall()
+        return [{'url': r[0], 'price': r[1], 'currency': r[2], 'seller': r[3], 'observed_at': int(r[4])}
+                for r in rows]
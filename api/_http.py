@@ -0,0 +1,84 @@
+"""
+Cliente HTTP compartido por search.py, shopping.py y fetch.py.
+
+Una sola requests.Session por proceso: las instancias calientes de Vercel
+reutilizan conexiones keep-alive (DNS + TCP + TLS una sola vez por host).
+requests se importa al crear la sesión (primer GET), no al cargar el
+endpoint: las respuestas desde caché o historial no pagan ese import.
+"""
+import os
+import threading
+
+# Hosts distintos que se mantienen en el pool y conexiones keep-alive que se
+# guardan por host. No es un tope de concurrencia (pool_block=False): con más
+# peticiones simultáneas a un host se abren conexiones extra que se cierran
+# al regresar (urllib3 avisa "Connection pool is full"). Lo que acota las
+# peticiones por proveedor es el rate limit de api/_governor.py; un pool
+# bloqueante esperaría sin timeout (requests no pasa pool_timeout) y se
+# comería el deadline de la petición.
+HTTP_POOL_HOSTS = int(os.environ.get('HTTP_POOL_HOSTS', 16))
+HTTP_POOL_PER_HOST = int(os.environ.get('HTTP_POOL_PER_HOST', 8))
+# Timeouts por defecto (segundos); cada llamada puede pasar su propio read timeout
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 3.05))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', 10))
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=HTTP_POOL_HOSTS,
+                    pool_maxsize=HTTP_POOL_PER_HOST,
+                    pool_block=False,
+                    max_retries=0,
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                # Accept-Encoding por defecto de requests: gzip/deflate y br
+                # cuando el paquete brotli está instalado
+                _session = session
+    return _session
+
+
+def http_get(url: str, timeout: float = None, **kwargs):
+    """GET a través del pool compartido. timeout es el de lectura."""
+    read_timeout = timeout if timeout is not None else HTTP_READ_TIMEOUT
+    return _get_session().get(url, timeout=(HTTP_CONNECT_TIMEOUT, read_timeout), **kwargs)
+
+
+def pool_stats(per_host: bool = False) -> dict:
+    """
+    Conexiones nuevas (miss) vs peticiones que reutilizaron una conexión
+    abierta (hit). El detalle por host sólo se incluye con per_host=True.
+    """
+    hosts = {}
+    if _session is not None:
+        for adapter in set(_session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                hosts[f'{pool.scheme}://{pool.host}:{pool.port}'] = {
+                    'requests': pool.num_requests,
+                    'new_connections': pool.num_connections,
+                }
+
+    total_requests = sum(h['requests'] for h in hosts.values())
+    total_new = sum(h['new_connections'] for h in hosts.values())
+    stats = {
+        'requests': total_requests,
+        'pool_misses': total_new,
+        'pool_hits': max(total_requests - total_new, 0),
+    }
+    if per_host:
+        stats['hosts'] = hosts
+    return stats
@@ -0,0 +1,54 @@
+"""
+Serialización de respuestas (handlers, líneas NDJSON, caché).
+
+dumps(obj) da los bytes UTF-8 listos para el socket. Con orjson instalado
+(opcional, en C) el JSON sale directo a bytes sin el str intermedio de
+json.dumps(...).encode() y las Offer (api/_offers.py) se convierten sin
+pasar por el encoder de Python; si no, json de la biblioteca estándar con
+la misma salida lógica (orjson no deja espacios tras ':' y ',').
+
+Configuración (env):
+    JSON_ENCODER    auto | orjson | json      (default auto: orjson si está)
+"""
+import json
+import os
+
+from api._offers import jsonable
+
+JSON_ENCODER = os.environ.get('JSON_ENCODER', 'auto').lower()
+
+# orjson se carga con la primera respuesta, no en el import (~8 ms del
+# arranque en frío, ver bench/bench_coldstart.py)
+_orjson = None
+_resolved = False
+
+
+def encoder() -> str:
+    """'orjson' o 'json' (el que usa dumps)"""
+    global _orjson, _resolved
+    if not _resolved:
+        if JSON_ENCODER != 'json':
+            try:
+                import orjson as _orjson
+            except ImportError:
+                if JSON_ENCODER == 'orjson':
+                    print("⚠️ JSON_ENCODER=orjson pero orjson no está instalado, usando json")
+        _resolved = True
+    return 'orjson' if _orjson is not None else 'json'
+
+
+def dumps(obj) -> bytes:
+    if not _resolved:
+        encoder()
+    if _orjson is not None:
+        try:
+            return _orjson.dumps(obj, default=jsonable, option=_orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # Enteros de más de 64 bits y otros casos que orjson no acepta
+            pass
+    return json.dumps(obj, ensure_ascii=False, default=jsonable).encode('utf-8')
+
+
+def dumps_str(obj) -> str:
+    """Para quien guarda texto (backend de caché, archivos de single-flight)"""
+    return dumps(obj).decode('utf-8')
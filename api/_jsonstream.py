@@ -0,0 +1,103 @@
+"""
+Lectura incremental de la respuesta JSON del modelo mientras se genera.
+
+ItemStream recibe el texto por pedazos (stream=True de Gemini) y regresa
+cada elemento de la lista "offers" (u otra llave de primer nivel) en cuanto
+se cierra su objeto, sin esperar al resto de la respuesta. El texto fuera
+del objeto principal (```json ... ```) se ignora.
+
+Sólo se recorre lo nuevo de cada pedazo, saltando de un carácter
+estructural al siguiente con una regex (comillas, escapes, llaves,
+corchetes). Al final, parsed() da el objeto completo para el resto de los
+campos; si la respuesta vino cortada (max_output_tokens), items ya tiene
+todo lo que alcanzó a cerrarse.
+"""
+import json
+import re
+
+_STRUCTURAL_RE = re.compile(r'["\\{}\[\]]')
+_FENCE_RE = re.compile(r'^```(?:json)?\s*|\s*```$', re.I)
+
+
+class ItemStream:
+    def __init__(self, key: str = 'offers'):
+        self.key = key
+        self.items = []
+        self.invalid = 0     # elementos que cerraron pero no son JSON válido
+        self._buf = ''
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._string_start = 0
+        self._last_key = None
+        self._list_depth = None   # profundidad de la lista de key (None: aún no / ya cerró)
+        self._item_start = None
+
+    def feed(self, text: str) -> list:
+        """Agrega un pedazo; regresa los elementos que se completaron con él"""
+        self._buf += text
+        done = []
+        buf = self._buf
+        pos = self._pos
+        while True:
+            m = _STRUCTURAL_RE.search(buf, pos)
+            if m is None:
+                pos = len(buf)
+                break
+            ch, i = m.group(), m.start()
+            if self._in_string:
+                if ch == '\\':
+                    if i + 1 >= len(buf):
+                        # El escape sigue en el próximo pedazo
+                        pos = i
+                        break
+                    pos = i + 2
+                    continue
+                if ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_key = buf[self._string_start:i]
+                pos = i + 1
+                continue
+            pos = i + 1
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i + 1
+            elif ch in '{[':
+                if ch == '{' and self._list_depth is not None and self._depth == self._list_depth:
+                    self._item_start = i
+                self._depth += 1
+                if ch == '[' and self._depth == 2 and self._last_key == self.key:
+                    self._list_depth = 2
+            elif self._depth:
+                self._depth -= 1
+                if ch == '}' and self._item_start is not None and self._depth == self._list_depth:
+                    self._emit(buf[self._item_start:i + 1], done)
+                    self._item_start = None
+                elif ch == ']' and self._depth == 1 and self._list_depth is not None:
+                    self._list_depth = None
+                    self._last_key = None
+        self._pos = pos
+        return done
+
+    def _emit(self, raw: str, done: list):
+        try:
+            item = json.loads(raw)
+        except ValueError:
+            self.invalid += 1
+            return
+        if isinstance(item, dict):
+            self.items.append(item)
+            done.append(item)
+
+    @property
+    def text(self) -> str:
+        return self._buf
+
+    def parsed(self):
+        """El objeto completo (sin cercas de markdown); None si no es JSON válido"""
+        try:
+            parsed = json.loads(_FENCE_RE.sub('', self._buf.strip()))
+        except ValueError:
+            return None
+        return parsed if isinstance(parsed, dict) else None
@@ -0,0 +1,122 @@
+"""
+Registro de oferta compartido por search, shopping y product (y la caché).
+
+Una oferta pasaba por varios dicts (fila scrapeada, dict parseado de Gemini,
+copia validada) hasta el json.dumps de la respuesta. Offer usa __slots__:
+unos 110 bytes por oferta contra ~270 de un dict de 7 llaves, y sin
+copias intermedias.
+
+- Campos base (siempre en la respuesta): title, price, currency, seller,
+  link.
+- Opcionales (sólo si se asignaron, así la forma de la respuesta de cada
+  endpoint no cambia): origin, price_text, price_source, market. Lo que no
+  es campo conocido (el modelo a veces agrega llaves) va en extra.
+- Se lee también como dict (get, [], in, keys, **oferta) para el código que
+  ya trataba las ofertas así (product, jobs, ofertas que vienen de caché).
+- jsonable() la convierte para json / orjson (ver api/_json.py).
+"""
+
+CORE_FIELDS = ('title', 'price', 'currency', 'seller', 'link')
+OPTIONAL_FIELDS = ('origin', 'price_text', 'price_source', 'market')
+_FIELDS = frozenset(CORE_FIELDS + OPTIONAL_FIELDS)
+
+
+class _Unset:
+    """Opcional sin asignar (None sí es un valor). Sobrevive a copy.deepcopy
+    y pickle (single-flight copia los resultados para cada seguidor)"""
+    __slots__ = ()
+
+    def __reduce__(self):
+        return '_UNSET'
+
+    def __repr__(self):
+        return '_UNSET'
+
+
+_UNSET = _Unset()
+
+
+class Offer:
+    __slots__ = CORE_FIELDS + OPTIONAL_FIELDS + ('extra',)
+
+    def __init__(self, title=None, price=None, currency='MXN', seller=None, link=None,
+                 origin=_UNSET, price_text=_UNSET, price_source=_UNSET, market=_UNSET, **extra):
+        self.title = title
+        self.price = price
+        self.currency = currency
+        self.seller = seller
+        self.link = link
+        self.origin = origin
+        self.price_text = price_text
+        self.price_source = price_source
+        self.market = market
+        self.extra = extra or None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Offer':
+        offer = cls(**data)
+        if not offer.currency:
+            offer.currency = 'MXN'
+        return offer
+
+    def to_dict(self) -> dict:
+        data = {
+            'title': self.title,
+            'price': self.price,
+            'currency': self.currency,
+            'seller': self.seller,
+            'link': self.link,
+        }
+        if self.origin is not _UNSET:
+            data['origin'] = self.origin
+        if self.price_text is not _UNSET:
+            data['price_text'] = self.price_text
+        if self.price_source is not _UNSET:
+            data['price_source'] = self.price_source
+        if self.market is not _UNSET:
+            data['market'] = self.market
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    # ===================== Lectura tipo dict =====================
+    def get(self, key, default=None):
+        if key in _FIELDS:
+            value = getattr(self, key)
+            return default if value is _UNSET else value
+        return self.extra.get(key, default) if self.extra else default
+
+    def __getitem__(self, key):
+        value = self.get(key, _UNSET)
+        if value is _UNSET:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key in _FIELDS:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key):
+        return self.get(key, _UNSET) is not _UNSET
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def __eq__(self, other):
+        if isinstance(other, Offer):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __repr__(self):
+        return f'Offer({self.to_dict()!r})'
+
+
+def jsonable(obj):
+    """default= para json.dumps / orjson.dumps"""
+    if isinstance(obj, Offer):
+        return obj.to_dict()
+    raise TypeError(f'{type(obj).__name__} no es serializable a JSON')
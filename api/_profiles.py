@@ -0,0 +1,196 @@
+"""
+Perfiles de extracción por dominio para /api/fetch.
+
+Cada página se recorre con todos los PRICE_PATTERNS, pero en la práctica
+cada tienda siempre gana con el mismo (sellingPrice en Chedraui/VTEX,
+precioVenta en La Comer, itemprop en Amazon...). Por host se lleva la
+cuenta de qué patrón dio el precio; el que gana seguido se promueve y en
+las siguientes páginas de ese host se prueba primero, antes del recorrido
+general. Si deja de acertar (la tienda cambió su HTML) su tasa baja y se
+degrada.
+
+- Tasa de acierto = páginas donde ganó / páginas vistas del host. Los
+  conteos se parten a la mitad al pasar de PROFILE_WINDOW páginas, así que
+  pesa más lo reciente.
+- Promovido: tasa >= PROFILE_PROMOTE_RATE con al menos PROFILE_MIN_PAGES
+  páginas. Degradado: tasa < PROFILE_DEMOTE_RATE (histéresis para no
+  oscilar).
+- Sólo cuentan páginas recorridas completas. Un acierto del perfil no
+  prueba que el patrón sea el mejor de la página (el recorrido general
+  quizá habría encontrado uno de más prioridad más abajo), así que no suma
+  a la tasa; para que un perfil equivocado se pueda degradar, una de cada
+  PROFILE_AUDIT_EVERY páginas del host va sin perfil.
+- promotable decide qué patrones pueden promoverse (fetch.py sólo deja los
+  mismos de alta confianza que cortan la descarga: con uno de baja confianza
+  el corte dejaría fuera el JSON de más abajo).
+- Se guarda como JSON en PROFILE_PATH (escritura atómica, a lo más cada
+  PROFILE_SAVE_S segundos). Con varios procesos gana el último que escribe;
+  sólo se pierden unas cuantas observaciones.
+
+Las llaves de patrón son opacas para este módulo (fetch.py usa nombre +
+hash del patrón, así reordenar la lista no invalida los perfiles).
+
+Configuración (env):
+    FETCH_PROFILES           1 | 0                         (default 1)
+    PROFILE_PATH             archivo JSON                  (default /tmp/upc_fetch_profiles.json)
+    PROFILE_MIN_PAGES        páginas antes de promover     (3)
+    PROFILE_PROMOTE_RATE     tasa para promover            (0.6)
+    PROFILE_DEMOTE_RATE      tasa para degradar            (0.4)
+    PROFILE_WINDOW           páginas antes de decaer       (50)
+    PROFILE_AUDIT_EVERY      1 de cada N páginas sin perfil (10)
+    PROFILE_SAVE_S           segundos entre escrituras     (30)
+"""
+import json
+import os
+import threading
+import time
+import urllib.parse
+
+FETCH_PROFILES = os.environ.get('FETCH_PROFILES', '1') == '1'
+PROFILE_PATH = os.environ.get('PROFILE_PATH', '/tmp/upc_fetch_profiles.json')
+PROFILE_MIN_PAGES = int(os.environ.get('PROFILE_MIN_PAGES', 3))
+PROFILE_PROMOTE_RATE = float(os.environ.get('PROFILE_PROMOTE_RATE', 0.6))
+PROFILE_DEMOTE_RATE = float(os.environ.get('PROFILE_DEMOTE_RATE', 0.4))
+PROFILE_WINDOW = int(os.environ.get('PROFILE_WINDOW', 50))
+PROFILE_SAVE_S = float(os.environ.get('PROFILE_SAVE_S', 30))
+PROFILE_AUDIT_EVERY = int(os.environ.get('PROFILE_AUDIT_EVERY', 10))
+# Tope de hosts guardados (se descartan los vistos hace más tiempo)
+_MAX_HOSTS = 2000
+
+
+def host_key(url: str) -> str:
+    """Host en minúsculas, sin www. ni puerto"""
+    host = (urllib.parse.urlparse(url).hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+class ProfileStore:
+    """host -> {'pages': n, 'hits': {patrón: n}, 'promoted': [patrones]}"""
+
+    def __init__(self, path: str = PROFILE_PATH, enabled: bool = FETCH_PROFILES, promotable=None):
+        self.path = path
+        self.enabled = enabled
+        self.promotable = promotable   # llave -> bool (None: cualquiera)
+        self.stats = {'probes': 0, 'probe_hits': 0, 'promotions': 0, 'demotions': 0, 'audits': 0}
+        self._served = {}    # host -> páginas con perfil servidas (para la auditoría)
+        self._hosts = None   # se carga en el primer uso
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def preferred(self, host: str) -> list:
+        """Patrones promovidos del host, el de mayor tasa primero"""
+        if not self.enabled or not host:
+            return []
+        with self._lock:
+            profile = self._load().get(host)
+            if not profile:
+                return []
+            promoted = [k for k in profile['promoted'] if not self.promotable or self.promotable(k)]
+            if not promoted:
+                return []
+            served = self._served.get(host, 0) + 1
+            self._served[host] = served
+            if PROFILE_AUDIT_EVERY > 0 and served % PROFILE_AUDIT_EVERY == 0:
+                # Auditoría: esta página va con el recorrido general
+                self.stats['audits'] += 1
+                return []
+            hits = profile['hits']
+            return sorted(promoted, key=lambda k: -hits.get(k, 0))
+
+    def record(self, host: str, winner, probed=(), probe_hit: bool = False):
+        """
+        Una página del host: winner es la llave del patrón que dio el precio
+        (None si no hubo); probed, los patrones que se probaron primero. Si
+        el perfil acertó (probe_hit) la página no cuenta para la tasa.
+        """
+        if not self.enabled or not host:
+            return
+        with self._lock:
+            hosts = self._load()
+            profile = hosts.pop(host, None) or {'pages': 0, 'hits': {}, 'promoted': []}
+            hosts[host] = profile   # al final: el orden del dict es de uso
+            if probed:
+                self.stats['probes'] += 1
+                self.stats['probe_hits'] += probe_hit
+            if probe_hit:
+                return
+            profile['pages'] += 1
+            hits = profile['hits']
+            if winner is not None:
+                hits[winner] = hits.get(winner, 0) + 1
+            if profile['pages'] > PROFILE_WINDOW:
+                profile['pages'] //= 2
+                for key in list(hits):
+                    hits[key] //= 2
+                    if not hits[key]:
+                        del hits[key]
+            self._rerank(profile)
+            while len(hosts) > _MAX_HOSTS:
+                del hosts[next(iter(hosts))]
+            self._dirty = True
+            if time.monotonic() - self._saved_at >= PROFILE_SAVE_S:
+                self._save()
+
+    def _rerank(self, profile):
+        pages = profile['pages']
+        promoted = profile['promoted']
+        promotable = self.promotable or (lambda key: True)
+        for key in list(promoted):
+            if profile['hits'].get(key, 0) / pages < PROFILE_DEMOTE_RATE or not promotable(key):
+                promoted.remove(key)
+                self.stats['demotions'] += 1
+        if pages < PROFILE_MIN_PAGES:
+            return
+        for key, n in profile['hits'].items():
+            if key not in promoted and n / pages >= PROFILE_PROMOTE_RATE and promotable(key):
+                promoted.append(key)
+                self.stats['promotions'] += 1
+
+    def snapshot(self, host: str = None) -> dict:
+        with self._lock:
+            info = dict(self.stats, hosts=len(self._load()))
+            profile = self._hosts.get(host) if host else None
+            if profile:
+                info['host'] = {
+                    'pages': profile['pages'],
+                    'promoted': list(profile['promoted']),
+                    'hit_rate': {k: round(n / profile['pages'], 2) for k, n in profile['hits'].items()},
+                }
+            return info
+
+    def flush(self):
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    # ===================== Archivo =====================
+    def _load(self) -> dict:
+        if self._hosts is None:
+            self._hosts = {}
+            try:
+                with open(self.path, encoding='utf-8') as fh:
+                    data = json.load(fh)
+                for host, profile in data.get('hosts', {}).items():
+                    if isinstance(profile, dict) and profile.get('pages'):
+                        self._hosts[host] = {
+                            'pages': int(profile['pages']),
+                            'hits': {k: int(n) for k, n in profile.get('hits', {}).items()},
+                            'promoted': list(profile.get('promoted', [])),
+                        }
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, TypeError, AttributeError) as e:
+                print(f"⚠️ Perfiles de extracción ilegibles ({self.path}): {e}")
+        return self._hosts
+
+    def _save(self):
+        self._saved_at = time.monotonic()
+        self._dirty = False
+        try:
+            tmp = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp, 'w', encoding='utf-8') as fh:
+                json.dump({'saved_at': int(time.time()), 'hosts': self._hosts}, fh, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"⚠️ No se pudieron guardar los perfiles de extracción: {e}")
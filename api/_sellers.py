@@ -0,0 +1,176 @@
+"""
+Vendedor canónico a partir del nombre (Gemini, tarjeta de Shopping, página)
+y/o del link de la oferta; lo comparten search, shopping y fetch (y por
+ellos product) para deduplicar y para el campo seller.
+
+- Dominio: se reduce al dominio registrable con un índice de sufijos
+  públicos precalculado (super.walmart.com.mx -> walmart.com.mx,
+  articulo.mercadolibre.com.mx -> mercadolibre.com.mx).
+- Alias: dominios y variantes de nombre de cadenas y marketplaces ->
+  llave canónica + nombre para mostrar ("Walmart Súper", "walmart.com.mx",
+  super.walmart.com.mx -> walmart / "Walmart").
+- Un vendedor desconocido queda con su propio nombre; por dominio, la
+  etiqueta registrable capitalizada (como antes: "Tiendasjumbo").
+
+seller_key() / canonical_seller() son búsquedas en dict (memoizadas), O(1)
+por oferta.
+"""
+import functools
+import re
+import unicodedata
+from urllib.parse import urlparse
+
+UNKNOWN_SELLER = 'Desconocido'
+
+# Sufijos públicos (ICANN + algunos privados de plataformas de tiendas) que
+# aparecen en ofertas MX / LatAm / US. Un TLD que no esté aquí cuenta como
+# sufijo de una etiqueta (regla "*" de la public suffix list).
+PUBLIC_SUFFIXES = frozenset((
+    'mx', 'com.mx', 'org.mx', 'net.mx', 'gob.mx', 'edu.mx',
+    'com', 'net', 'org', 'shop', 'store', 'online', 'io', 'co', 'us',
+    'com.br', 'com.ar', 'com.co', 'com.pe', 'cl', 'com.gt', 'com.ec',
+    'es', 'co.uk', 'com.au', 'ca',
+    # Plataformas: cada tienda es su propio dominio
+    'myshopify.com', 'mitiendanube.com', 'mercadoshops.com.mx', 'vtexcommercestable.com.br',
+    'wixsite.com', 'blogspot.com', 'github.io',
+))
+
+# llave -> (nombre, dominios registrables, variantes de nombre)
+SELLERS = {
+    'walmart': ('Walmart', ('walmart.com.mx', 'walmart.com'),
+                ('Walmart Súper', 'Super Walmart', 'Walmart Supercenter', 'Walmart México', 'Walmart Express')),
+    'bodega aurrera': ('Bodega Aurrera', ('bodegaaurrera.com.mx',),
+                       ('Aurrera', 'Mi Bodega Aurrera', 'Bodega Aurrerá')),
+    'sams club': ("Sam's Club", ('sams.com.mx', 'samsclub.com'), ('Sams', "Sam's", 'Sams Club México')),
+    'amazon': ('Amazon', ('amazon.com.mx', 'amazon.com'), ('Amazon México', 'Amazon.com.mx', 'Amazon Mexico')),
+    'mercado libre': ('Mercado Libre', ('mercadolibre.com.mx', 'mercadolibre.com'), ('MercadoLibre', 'Meli')),
+    'chedraui': ('Chedraui', ('chedraui.com.mx',), ('Súper Chedraui', 'Super Chedraui')),
+    'soriana': ('Soriana', ('soriana.com',), ('Soriana Híper', 'Soriana Super', 'Tiendas Soriana')),
+    'la comer': ('La Comer', ('lacomer.com.mx',), ('City Market', 'Fresko', 'Sumesa')),
+    'heb': ('HEB', ('heb.com.mx', 'heb.com'), ('H-E-B', 'H E B')),
+    'costco': ('Costco', ('costco.com.mx', 'costco.com'), ('Costco México',)),
+    'city club': ('City Club', ('cityclub.com.mx',), ()),
+    'liverpool': ('Liverpool', ('liverpool.com.mx',), ('El Puerto de Liverpool',)),
+    'suburbia': ('Suburbia', ('suburbia.com.mx',), ()),
+    'coppel': ('Coppel', ('coppel.com',), ()),
+    'elektra': ('Elektra', ('elektra.com.mx',), ()),
+    'sanborns': ('Sanborns', ('sanborns.com.mx',), ()),
+    'office depot': ('Office Depot', ('officedepot.com.mx',), ()),
+    'home depot': ('The Home Depot', ('homedepot.com.mx',), ('Home Depot',)),
+    'farmacias del ahorro': ('Farmacias del Ahorro', ('fahorro.com',), ('Fahorro', 'Del Ahorro')),
+    'farmacias guadalajara': ('Farmacias Guadalajara', ('farmaciasguadalajara.com',), ()),
+    'farmacias benavides': ('Farmacias Benavides', ('benavides.com.mx',), ('Benavides',)),
+    'farmacia san pablo': ('Farmacia San Pablo', ('farmaciasanpablo.com.mx',), ('San Pablo',)),
+    '7-eleven': ('7-Eleven', ('7-eleven.com.mx',), ('7 Eleven', 'Seven Eleven')),
+    'oxxo': ('OXXO', ('oxxo.com',), ()),
+    'rappi': ('Rappi', ('rappi.com.mx',), ()),
+    'cornershop': ('Cornershop', ('cornershopapp.com',), ()),
+}
+
+# Prefijos de nombre que identifican a la cadena aunque traigan más texto
+# ("Walmart Supercenter Tlalpan"). Sólo marcas que no son prefijo de otra.
+_CHAIN_PREFIXES = ('walmart', 'bodegaaurrera', 'chedraui', 'soriana', 'mercadolibre', 'amazon', 'liverpool',
+                   'coppel', 'costco', 'fahorro', 'farmaciasdelahorro', 'farmaciasguadalajara', 'sanborns')
+
+
+def _name_key(text: str) -> str:
+    """'Walmart Súper' -> 'walmartsuper' (sin acentos, sólo letras y dígitos)"""
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]', '', text.lower())
+
+
+def _build_index():
+    by_domain, by_name = {}, {}
+    for key, (name, domains, variants) in SELLERS.items():
+        for domain in domains:
+            by_domain[domain] = key
+        for variant in (key, name) + domains + variants:
+            by_name[_name_key(variant)] = key
+    prefixes = {_name_key(p): by_name[_name_key(p)] for p in _CHAIN_PREFIXES}
+    return by_domain, by_name, prefixes
+
+
+_BY_DOMAIN, _BY_NAME, _BY_PREFIX = _build_index()
+_PREFIX_TUPLE = tuple(sorted(_BY_PREFIX, key=len, reverse=True))
+_IP_RE = re.compile(r'^[\d.]+$|:')
+_DOMAIN_LIKE_RE = re.compile(r'^(?:https?://)?(?:[a-z0-9-]+\.)+[a-z]{2,}(?:/.*)?$', re.I)
+
+
+def registrable_domain(host: str) -> str:
+    """super.walmart.com.mx -> walmart.com.mx (sufijo público más largo + 1 etiqueta)"""
+    host = (host or '').lower().strip('.')
+    if host.startswith('www.'):
+        host = host[4:]
+    labels = host.split('.')
+    for i in range(1, len(labels)):
+        if '.'.join(labels[i:]) in PUBLIC_SUFFIXES:
+            return '.'.join(labels[i - 1:])
+    # TLD desconocido: se toma como sufijo de una etiqueta
+    return '.'.join(labels[-2:])
+
+
+@functools.lru_cache(maxsize=4096)
+def _from_host(host: str):
+    """(llave, nombre) por dominio"""
+    if _IP_RE.match(host):
+        return host, host
+    domain = registrable_domain(host)
+    key = _BY_DOMAIN.get(domain)
+    if key is not None:
+        return key, SELLERS[key][0]
+    label = domain.split('.')[0]
+    if not label:
+        return _name_key(UNKNOWN_SELLER), UNKNOWN_SELLER
+    # Mismo dominio en otro país / subdominio con nombre de la cadena
+    key = _BY_NAME.get(_name_key(label))
+    if key is not None:
+        return key, SELLERS[key][0]
+    return _name_key(label), label.capitalize()
+
+
+@functools.lru_cache(maxsize=4096)
+def _from_name(seller: str):
+    """(llave, nombre) por nombre; None si el nombre viene vacío"""
+    seller = seller.strip()
+    if _DOMAIN_LIKE_RE.match(seller):
+        return _from_host(urlparse(seller if '//' in seller else '//' + seller).hostname or '')
+    key = _name_key(seller)
+    if not key:
+        return None
+    canonical = _BY_NAME.get(key)
+    if canonical is None and key.startswith(_PREFIX_TUPLE):
+        canonical = next(_BY_PREFIX[p] for p in _PREFIX_TUPLE if key.startswith(p))
+    if canonical is not None:
+        return canonical, SELLERS[canonical][0]
+    return key, seller
+
+
+def seller_info(seller=None, link=None):
+    """(llave, nombre) del vendedor; el nombre gana sobre el link si se conoce"""
+    if seller:
+        found = _from_name(str(seller))
+        if found is not None:
+            return found
+    if link:
+        try:
+            host = urlparse(link).hostname
+        except ValueError:
+            host = None
+        if host:
+            return _from_host(host)
+    return _name_key(UNKNOWN_SELLER), UNKNOWN_SELLER
+
+
+def seller_key(seller=None, link=None) -> str:
+    """Llave para deduplicar por tienda"""
+    return seller_info(seller, link)[0]
+
+
+def canonical_seller(seller=None, link=None) -> str:
+    """Nombre para mostrar"""
+    return seller_info(seller, link)[1]
+
+
+def seller_from_url(url) -> str:
+    """walmart.com.mx -> Walmart; dominio desconocido -> etiqueta capitalizada"""
+    return seller_info(None, url)[1]
@@ -0,0 +1,185 @@
+"""
+Parser de las tarjetas de resultados de Google Shopping.
+
+Antes se armaba el árbol completo de la página con BeautifulSoup/html.parser
+(Python puro) y se corrían cinco select_one por tarjeta. Ahora:
+
+1. grid_cards() recorta sólo las tarjetas div.sh-dgr__grid-result con un
+   escaneo de <div ...>/</div> (sin parsear el resto: barras, sugerencias,
+   scripts), y se parsean juntas en un documento chico.
+2. El parser es intercambiable (SHOPPING_PARSER): selectolax o lxml (en C)
+   o bs4 (el de siempre). 'auto' usa el primero instalado.
+
+parse_cards(html) regresa por tarjeta un dict con title, href, price_text y
+seller, ya con el mismo texto que daba get_text(strip=True); la limpieza del
+link y del precio se queda en shopping.py.
+"""
+import os
+import re
+
+SHOPPING_PARSER = os.environ.get('SHOPPING_PARSER', 'auto')
+
+# Selectores de siempre (primer match en orden del documento)
+CARD_SELECTOR = 'div.sh-dgr__grid-result'
+FIELD_SELECTORS = {
+    'title': 'h3, span.OSrXXb',
+    'href': 'a.shntl, a.eIuuYe',
+    'price_text': 'span.a8Pemb, span.dD8iuc',
+    'seller': 'div.aULzUe, span.aULzUe',
+}
+
+_CARD_START_RE = re.compile(
+    r'<div\b[^>]*\bclass\s*=\s*["\'][^"\']*(?<![\w-])sh-dgr__grid-result(?![\w-])', re.I
+)
+_DIV_TAG_RE = re.compile(r'<(/?)div\b', re.I)
+
+
+def grid_cards(html_text: str) -> str:
+    """Sólo el HTML de las tarjetas, una tras otra; '' si no hay ninguna"""
+    cards = []
+    pos = 0
+    while True:
+        m = _CARD_START_RE.search(html_text, pos)
+        if not m:
+            break
+        depth = 0
+        end = len(html_text)
+        for tag in _DIV_TAG_RE.finditer(html_text, m.start()):
+            depth += -1 if tag.group(1) else 1
+            if depth == 0:
+                end = html_text.find('>', tag.end()) + 1 or len(html_text)
+                break
+        cards.append(html_text[m.start():end])
+        pos = end
+    return ''.join(cards)
+
+
+# ===================== Backends =====================
+def _parse_bs4(html_text: str) -> list:
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html_text, 'html.parser')
+    cards = []
+    for item in soup.select(CARD_SELECTOR):
+        found = {field: item.select_one(sel) for field, sel in FIELD_SELECTORS.items()}
+        cards.append({
+            'title': found['title'].get_text(strip=True) if found['title'] else None,
+            'href': found['href'].get('href') if found['href'] else None,
+            'price_text': found['price_text'].get_text(strip=True) if found['price_text'] else None,
+            'seller': found['seller'].get_text(strip=True) if found['seller'] else None,
+            'has_link': found['href'] is not None,
+        })
+    return cards
+
+
+def _parse_selectolax(html_text: str) -> list:
+    from selectolax.parser import HTMLParser
+    tree = HTMLParser(html_text)
+    cards = []
+    for item in tree.css(CARD_SELECTOR):
+        found = {field: item.css_first(sel) for field, sel in FIELD_SELECTORS.items()}
+        text = {f: found[f].text(deep=True, separator='', strip=True) if found[f] else None
+                for f in ('title', 'price_text', 'seller')}
+        cards.append({
+            **text,
+            'href': found['href'].attributes.get('href') if found['href'] else None,
+            'has_link': found['href'] is not None,
+        })
+    return cards
+
+
+_LXML_XPATH = None
+
+
+def _lxml_xpaths():
+    """XPath compilados (sin cssselect) equivalentes a los selectores CSS"""
+    global _LXML_XPATH
+    if _LXML_XPATH is None:
+        from lxml import etree
+
+        def has_class(name):
+            return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+        _LXML_XPATH = {
+            'card': etree.XPath(f"//div[{has_class('sh-dgr__grid-result')}]"),
+            # (...)[1]: el primero en orden del documento, como select_one
+            'title': etree.XPath(f"(.//*[self::h3 or (self::span and {has_class('OSrXXb')})])[1]"),
+            'href': etree.XPath(f"(.//a[{has_class('shntl')} or {has_class('eIuuYe')}])[1]"),
+            'price_text': etree.XPath(f"(.//span[{has_class('a8Pemb')} or {has_class('dD8iuc')}])[1]"),
+            'seller': etree.XPath(f"(.//*[(self::div or self::span) and {has_class('aULzUe')}])[1]"),
+            # Como get_text() de bs4: sin texto de script/style ni comentarios
+            'text': etree.XPath('.//text()[not(parent::script or parent::style)]'),
+        }
+    return _LXML_XPATH
+
+
+def _parse_lxml(html_text: str) -> list:
+    import lxml.html
+    xp = _lxml_xpaths()
+    if not html_text.strip():
+        return []
+    root = lxml.html.document_fromstring(html_text)
+
+    def text(el):
+        return ''.join(s.strip() for s in xp['text'](el)) if el is not None else None
+
+    cards = []
+    for item in xp['card'](root):
+        found = {field: next(iter(xp[field](item)), None) for field in FIELD_SELECTORS}
+        cards.append({
+            'title': text(found['title']),
+            'href': found['href'].get('href') if found['href'] is not None else None,
+            'price_text': text(found['price_text']),
+            'seller': text(found['seller']),
+            'has_link': found['href'] is not None,
+        })
+    return cards
+
+
+BACKENDS = {
+    'selectolax': _parse_selectolax,
+    'lxml': _parse_lxml,
+    'bs4': _parse_bs4,
+}
+_AUTO_ORDER = ('selectolax', 'lxml', 'bs4')
+_MODULES = {'selectolax': 'selectolax.parser', 'lxml': 'lxml.html', 'bs4': 'bs4'}
+
+
+def available_backends() -> list:
+    found = []
+    for name in _AUTO_ORDER:
+        try:
+            __import__(_MODULES[name])
+            found.append(name)
+        except ImportError:
+            continue
+    return found
+
+
+def resolve_backend(name: str = None) -> str:
+    """'auto' -> primer backend instalado; un nombre no instalado cae a 'auto'"""
+    name = (name or SHOPPING_PARSER).lower()
+    installed = available_backends()
+    if name in installed:
+        return name
+    if name != 'auto':
+        print(f"⚠️ Parser '{name}' no disponible, usando {installed[0] if installed else 'bs4'}")
+    return installed[0] if installed else 'bs4'
+
+
+_DEFAULT = None
+
+
+def parse_cards(html_text: str, backend: str = None, grid_only: bool = True) -> list:
+    """Campos crudos de cada tarjeta; grid_only recorta antes las tarjetas"""
+    global _DEFAULT
+    if backend is None:
+        if _DEFAULT is None:
+            _DEFAULT = resolve_backend()
+        backend = _DEFAULT
+    else:
+        backend = resolve_backend(backend)
+    if grid_only:
+        html_text = grid_cards(html_text)
+        if not html_text:
+            return []
+    return BACKENDS[backend](html_text)
@@ -0,0 +1,232 @@
+"""
+Single-flight: llamadas idénticas y simultáneas a un proveedor (SerpApi,
+Google Shopping, Gemini) esperan una sola llamada real y comparten el
+resultado. Pensado para aperturas de tienda, cuando muchos escáneres piden
+el mismo UPC popular al mismo tiempo.
+
+- En el proceso: el primer hilo con una llave hace la llamada; los demás
+  esperan su resultado (o su excepción).
+- Entre procesos del mismo host (SINGLEFLIGHT=file): el hilo líder toma un
+  flock sobre <dir>/<hash>.lock y deja el resultado en <hash>.json. Quien
+  esperaba el lock en otro proceso usa ese archivo si se escribió después de
+  que empezó a esperar; si no (el líder falló), hace la llamada él mismo.
+
+Sólo se comparten llamadas en curso: no es una caché (para eso _cache.py).
+
+Configuración (env):
+    SINGLEFLIGHT         file | memory | off          (default file)
+    SINGLEFLIGHT_DIR     directorio de locks          (default /tmp/upc_singleflight)
+    SINGLEFLIGHT_WAIT_S  espera máxima por el líder   (default 30)
+"""
+import copy
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+
+from api._trace import stage, count
+from api._deadline import remaining, skip, skipped
+from api._json import dumps_str
+
+try:
+    import fcntl
+except ImportError:  # Windows: sólo dentro del proceso
+    fcntl = None
+
+SINGLEFLIGHT = os.environ.get('SINGLEFLIGHT', 'file')
+SINGLEFLIGHT_DIR = os.environ.get('SINGLEFLIGHT_DIR', '/tmp/upc_singleflight')
+SINGLEFLIGHT_WAIT_S = float(os.environ.get('SINGLEFLIGHT_WAIT_S', 30))
+# Resultados y locks más viejos que esto se borran al escribir uno nuevo
+_RESULT_MAX_AGE_S = 300
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+        self.skipped = ()   # etapas que el deadline del líder dejó fuera
+
+
+class SingleFlight:
+    """Coordinador de un proveedor; do(key, fn, *args) hace o espera la llamada"""
+
+    def __init__(self, name: str, mode: str = SINGLEFLIGHT, lock_dir: str = SINGLEFLIGHT_DIR):
+        self.name = name
+        self.mode = mode if (mode != 'file' or fcntl is not None) else 'memory'
+        self.lock_dir = lock_dir
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {'calls': 0, 'shared': 0, 'shared_file': 0}
+
+    def do(self, key: str, fn, *args, **kwargs):
+        if self.mode == 'off':
+            return self._call(fn, args, kwargs)
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if not leader:
+            with stage(f'{self.name}_wait'):
+                finished = call.done.wait(timeout=remaining())
+            if not finished:
+                # El deadline de esta petición vence antes que la llamada del
+                # líder: fn corre con lo que queda (y cae a su fallback)
+                return fn(*args, **kwargs)
+            with self._lock:
+                self.stats['shared'] += 1
+            count(singleflight_shared=1)
+            # El resultado compartido es tan parcial como el del líder
+            for name in call.skipped:
+                skip(name)
+            if call.error is not None:
+                raise call.error
+            # Copia: cada petición puede modificar su resultado
+            return copy.deepcopy(call.result)
+
+        before = set(skipped())
+        try:
+            if self.mode == 'file':
+                call.result = self._across_processes(key, fn, args, kwargs)
+            else:
+                call.result = self._call(fn, args, kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            call.skipped = tuple(n for n in skipped() if n not in before)
+            with self._lock:
+                # Fuera del mapa antes de decidir la copia: ya nadie se puede
+                # unir a esta llamada
+                del self._calls[key]
+                shared = call.waiters > 0
+            call.done.set()
+        # Con seguidores el líder también se lleva una copia: ellos copian
+        # call.result mientras el llamador del líder modifica la suya
+        return copy.deepcopy(call.result) if shared else call.result
+
+    def _call(self, fn, args, kwargs):
+        with self._lock:
+            self.stats['calls'] += 1
+        return fn(*args, **kwargs)
+
+    # ===================== Entre procesos =====================
+    def _paths(self, key):
+        digest = hashlib.sha1(f'{self.name}:{key}'.encode('utf-8')).hexdigest()
+        base = os.path.join(self.lock_dir, digest)
+        return base + '.lock', base + '.json'
+
+    def _across_processes(self, key, fn, args, kwargs):
+        try:
+            os.makedirs(self.lock_dir, exist_ok=True)
+            lock_path, result_path = self._paths(key)
+            fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError as e:
+            print(f"⚠️ Single-flight sin lock de archivo ({self.name}): {e}")
+            return self._call(fn, args, kwargs)
+
+        try:
+            started = time.time()
+            waited = not self._try_lock(fd)
+            if waited:
+                with stage(f'{self.name}_wait'):
+                    locked = self._wait_lock(fd)
+                if not locked:
+                    # El líder de otro proceso tarda demasiado: llamada propia
+                    return self._call(fn, args, kwargs)
+                shared = self._read_result(result_path, started)
+                if shared is not None:
+                    with self._lock:
+                        self.stats['shared_file'] += 1
+                    count(singleflight_shared=1)
+                    return shared[0]
+
+            result = self._call(fn, args, kwargs)
+            self._write_result(result_path, result)
+            return result
+        finally:
+            os.close(fd)  # también libera el flock
+
+    @staticmethod
+    def _try_lock(fd) -> bool:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def _wait_lock(self, fd) -> bool:
+        left = remaining()
+        deadline = time.monotonic() + min(SINGLEFLIGHT_WAIT_S, left if left is not None else SINGLEFLIGHT_WAIT_S)
+        delay = 0.005
+        while time.monotonic() < deadline:
+            if self._try_lock(fd):
+                return True
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+        return False
+
+    @staticmethod
+    def _read_result(path, since):
+        """(resultado,) si el archivo se escribió después de since; None si no"""
+        try:
+            if os.path.getmtime(path) < since:
+                return None
+            with open(path, encoding='utf-8') as fh:
+                return (json.load(fh),)
+        except (OSError, ValueError):
+            return None
+
+    def _write_result(self, path, result):
+        try:
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'w', encoding='utf-8') as fh:
+                fh.write(dumps_str(result))
+            os.replace(tmp, path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"⚠️ Single-flight no pudo guardar resultado ({self.name}): {e}")
+            return
+        self._sweep()
+
+    def _sweep(self):
+        """
+        Borra resultados y locks viejos de vez en cuando (1 de cada 50
+        escrituras). Borrar un lock en uso sólo provoca una llamada duplicada.
+        """
+        if self.stats['calls'] % 50:
+            return
+        cutoff = time.time() - _RESULT_MAX_AGE_S
+        try:
+            for name in os.listdir(self.lock_dir):
+                path = os.path.join(self.lock_dir, name)
+                if name.endswith(('.json', '.lock')) and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+        except OSError:
+            pass
+
+
+def flight_key(*args, **kwargs) -> str:
+    """Llave estable a partir de los argumentos (hash del JSON)"""
+    raw = json.dumps([args, kwargs], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def single_flight(name: str):
+    """Decorador: llamadas simultáneas con los mismos argumentos comparten resultado"""
+    def wrap(fn):
+        flight = SingleFlight(name)
+
+        @functools.wraps(fn)
+        def call(*args, **kwargs):
+            return flight.do(flight_key(*args, **kwargs), fn, *args, **kwargs)
+
+        call.flight = flight
+        return call
+    return wrap
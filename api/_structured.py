@@ -0,0 +1,291 @@
+"""
+Datos estructurados de páginas de producto, parseados con json (no regex):
+
+- <script type="application/ld+json"> (schema.org Product / Offer)
+- Estado embebido: __NEXT_DATA__ (Next.js, ej. Walmart) y __STATE__ (VTEX,
+  ej. Chedraui)
+- Microdata (itemprop) y OpenGraph / product:* en <meta>
+
+extract_structured(html) regresa los campos que encuentre: title, price,
+currency, seller, brand, category, availability, rating, review_count,
+description, más 'field_sources' con el origen de cada campo
+(json-ld, vtex_state, next_data, microdata).
+"""
+import html
+import json
+import re
+from collections import deque
+
+FIELDS = ('title', 'price', 'currency', 'seller', 'brand', 'category',
+          'availability', 'rating', 'review_count', 'description')
+
+_LDJSON_RE = re.compile(
+    r'<script\b[^>]*type\s*=\s*["\']application/ld\+json["\'][^>]*>(.*?)</script>', re.I | re.S
+)
+_NEXT_DATA_RE = re.compile(
+    r'<script\b[^>]*id\s*=\s*["\']__NEXT_DATA__["\'][^>]*>(.*?)</script>', re.I | re.S
+)
+_VTEX_STATE_RE = re.compile(r'__STATE__\s*=\s*(?=\{)|data-varname="__STATE__"[^>]*>\s*<script[^>]*>\s*(?=\{)')
+_PROP_TAG_RE = re.compile(r'<(?:meta|link|span|div|p|a|strong|b|data)\b[^>]*?\b(?:itemprop|property)\s*=[^>]*>', re.I)
+_ATTR_RE = re.compile(r'([\w:-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+_TAG_TEXT_RE = re.compile(r'\s*([^<]{1,200})<')
+
+_AVAILABILITY = {
+    'instock': 'in_stock',
+    'instoreonly': 'in_stock',
+    'onlineonly': 'in_stock',
+    'limitedavailability': 'in_stock',
+    'outofstock': 'out_of_stock',
+    'soldout': 'out_of_stock',
+    'discontinued': 'out_of_stock',
+    'preorder': 'preorder',
+    'backorder': 'preorder',
+}
+
+_decoder = json.JSONDecoder()
+
+
+# ===================== Normalización =====================
+def _to_number(value):
+    """'1,299.00' / '1.299,00' / 89 / '$ 89.90' -> float (None si no se puede)"""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+    s = re.sub(r'[^\d.,]', '', value)
+    if not s:
+        return None
+    if ',' in s and '.' in s:
+        # El separador que aparece al último es el decimal
+        if s.rfind(',') > s.rfind('.'):
+            s = s.replace('.', '').replace(',', '.')
+        else:
+            s = s.replace(',', '')
+    elif ',' in s:
+        s = s.replace(',', '.') if re.search(r',\d{1,2}$', s) else s.replace(',', '')
+    elif s.count('.') > 1:
+        s = s.replace('.', '')
+    try:
+        return float(s)
+    except ValueError:
+        return None
+
+def _to_int(value):
+    n = _to_number(value)
+    return int(n) if n is not None else None
+
+def _text(value):
+    """Cadena limpia desde str, {'name': ...} o lista"""
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if isinstance(value, dict):
+        value = value.get('name') or value.get('@id')
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = str(value)
+    if not isinstance(value, str):
+        return None
+    value = html.unescape(value).strip()
+    return value or None
+
+def _availability(value):
+    value = _text(value)
+    if not value:
+        return None
+    key = value.rstrip('/').rsplit('/', 1)[-1].replace('_', '').replace(' ', '').lower()
+    return _AVAILABILITY.get(key, key)
+
+def _has_type(node, type_name):
+    t = node.get('@type')
+    if isinstance(t, list):
+        return type_name in t
+    return t == type_name
+
+def _merge(target, sources, name, values):
+    """Llena los campos faltantes de target con values (prioridad al primero)"""
+    for field, value in values.items():
+        if value is not None and target.get(field) is None:
+            target[field] = value
+            sources[field] = name
+
+
+# ===================== JSON-LD =====================
+def _iter_nodes(data):
+    """Nodos dict de un documento JSON-LD (listas y @graph incluidos)"""
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(reversed(node))
+        elif isinstance(node, dict):
+            yield node
+            if '@graph' in node:
+                stack.append(node['@graph'])
+
+def _offer_fields(offers):
+    if isinstance(offers, list):
+        offers = next((o for o in offers if isinstance(o, dict)), None)
+    if not isinstance(offers, dict):
+        return {}
+    price = offers.get('price')
+    if price is None:
+        price = offers.get('lowPrice')
+    if price is None and isinstance(offers.get('priceSpecification'), dict):
+        price = offers['priceSpecification'].get('price')
+    inner = offers.get('offers')
+    values = {
+        'price': _to_number(price),
+        'currency': _text(offers.get('priceCurrency')),
+        'availability': _availability(offers.get('availability')),
+        'seller': _text(offers.get('seller')),
+    }
+    if values['price'] is None and inner:
+        nested = _offer_fields(inner)
+        for k, v in values.items():
+            if v is None:
+                values[k] = nested.get(k)
+    return values
+
+def _category(value):
+    if isinstance(value, list):
+        value = ' > '.join(_text(v) for v in value if _text(v))
+    return _text(value)
+
+def _from_ldjson(html_text):
+    for m in _LDJSON_RE.finditer(html_text):
+        try:
+            data = json.loads(m.group(1).strip())
+        except ValueError:
+            continue
+        for node in _iter_nodes(data):
+            if not (_has_type(node, 'Product') or _has_type(node, 'ProductGroup')):
+                continue
+            rating = node.get('aggregateRating') if isinstance(node.get('aggregateRating'), dict) else {}
+            values = {
+                'title': _text(node.get('name')),
+                'brand': _text(node.get('brand')),
+                'category': _category(node.get('category')),
+                'description': _text(node.get('description')),
+                'rating': _to_number(rating.get('ratingValue')),
+                'review_count': _to_int(rating.get('reviewCount') or rating.get('ratingCount')),
+            }
+            values.update(_offer_fields(node.get('offers')))
+            return values
+    return {}
+
+
+# ===================== Estado embebido =====================
+def _walk(data, max_nodes=20000):
+    """Recorre dicts anidados (en anchura) con un tope de nodos"""
+    queue = deque([data])
+    seen = 0
+    while queue and seen < max_nodes:
+        node = queue.popleft()
+        seen += 1
+        if isinstance(node, dict):
+            yield node
+            queue.extend(v for v in node.values() if isinstance(v, (dict, list)))
+        elif isinstance(node, list):
+            queue.extend(v for v in node if isinstance(v, (dict, list)))
+
+def _from_next_data(html_text):
+    m = _NEXT_DATA_RE.search(html_text)
+    if not m:
+        return {}
+    try:
+        data = json.loads(m.group(1))
+    except ValueError:
+        return {}
+    values = {}
+    for node in _walk(data):
+        current = node.get('currentPrice')
+        if values.get('price') is None and current is not None:
+            values['price'] = _to_number(current.get('price') if isinstance(current, dict) else current)
+            if isinstance(current, dict):
+                values['currency'] = _text(current.get('currencyUnit') or current.get('currency'))
+        for key, field, conv in (
+            ('brand', 'brand', _text),
+            ('category', 'category', _category),
+            ('sellerName', 'seller', _text),
+            ('sellerDisplayName', 'seller', _text),
+            ('averageRating', 'rating', _to_number),
+            ('numberOfReviews', 'review_count', _to_int),
+            ('availabilityStatus', 'availability', _availability),
+        ):
+            if values.get(field) is None and node.get(key) is not None:
+                values[field] = conv(node[key])
+    return values
+
+def _from_vtex_state(html_text):
+    m = _VTEX_STATE_RE.search(html_text)
+    if not m:
+        return {}
+    try:
+        state, _ = _decoder.raw_decode(html_text, m.end())
+    except ValueError:
+        return {}
+    if not isinstance(state, dict):
+        return {}
+    values = {}
+    for key, node in state.items():
+        if not isinstance(node, dict):
+            continue
+        if key.endswith('commertialOffer') and values.get('price') is None:
+            values['price'] = _to_number(node.get('Price') if node.get('Price') is not None else node.get('sellingPrice'))
+            qty = node.get('AvailableQuantity')
+            if qty is not None:
+                values['availability'] = 'in_stock' if _to_number(qty) else 'out_of_stock'
+            values['seller'] = _text(node.get('seller'))
+        elif key.startswith('Product:') and values.get('title') is None:
+            values['title'] = _text(node.get('productName'))
+            values['brand'] = _text(node.get('brand'))
+            values['category'] = _category(node.get('categories'))
+    return values
+
+
+# ===================== Microdata / OpenGraph =====================
+_META_FIELDS = {
+    'price': ('price', 'og:price:amount', 'product:price:amount'),
+    'currency': ('pricecurrency', 'og:price:currency', 'product:price:currency'),
+    'title': ('og:title',),
+    'brand': ('brand', 'og:brand', 'product:brand'),
+    'availability': ('availability', 'og:availability', 'product:availability'),
+    'rating': ('ratingvalue',),
+    'review_count': ('reviewcount', 'ratingcount'),
+    'category': ('product:category',),
+    'description': ('og:description',),
+}
+_META_LOOKUP = {name: field for field, names in _META_FIELDS.items() for name in names}
+_META_CONVERT = {'price': _to_number, 'rating': _to_number, 'review_count': _to_int,
+                 'availability': _availability}
+
+def _from_meta(html_text):
+    values = {}
+    for m in _PROP_TAG_RE.finditer(html_text):
+        attrs = {a.group(1).lower(): a.group(2) if a.group(2) is not None else a.group(3)
+                 for a in _ATTR_RE.finditer(m.group(0))}
+        name = (attrs.get('itemprop') or attrs.get('property') or '').lower()
+        field = _META_LOOKUP.get(name)
+        if field is None or values.get(field) is not None:
+            continue
+        raw = attrs.get('content') or attrs.get('href')
+        if raw is None and not m.group(0).startswith(('<meta', '<link')):
+            t = _TAG_TEXT_RE.match(html_text, m.end())
+            raw = t.group(1) if t else None
+        if raw is None:
+            continue
+        values[field] = _META_CONVERT.get(field, _text)(raw)
+    return values
+
+
+def extract_structured(html_text: str) -> dict:
+    """Campos del producto desde datos estructurados; prioridad JSON-LD > estado > meta"""
+    result = {}
+    sources = {}
+    _merge(result, sources, 'json-ld', _from_ldjson(html_text))
+    _merge(result, sources, 'vtex_state', _from_vtex_state(html_text))
+    _merge(result, sources, 'next_data', _from_next_data(html_text))
+    _merge(result, sources, 'microdata', _from_meta(html_text))
+    result['field_sources'] = sources
+    return result
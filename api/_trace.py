@@ -0,0 +1,180 @@
+"""
+Trazas por petición para todos los endpoints.
+
+- start_trace(endpoint) abre la traza de la petición (contextvar del hilo).
+- stage('nombre') mide una etapa (lap() para etapas seguidas sin bloque
+  with); note()/count() agregan datos (bytes, tamaño de prompt/respuesta,
+  status de caché...). Fuera de una petición no hacen nada, así que se
+  pueden usar en cualquier helper.
+- trace.header() arma el header Server-Timing y trace.finish() escribe una
+  línea JSON en el log con duraciones y datos.
+- bind(fn) lleva la traza a hilos de un pool (los executors no copian
+  contextvars por sí solos).
+- Perfil opcional con cProfile (sale en la línea de log): por petición
+  (header X-Profile: 1 o "profile": true en el body, si
+  TRACE_PROFILE_ENABLED=1) o por muestreo con TRACE_PROFILE_SAMPLE (0-1).
+"""
+import contextvars
+import io
+import json
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+TRACE_LOG = os.environ.get('TRACE_LOG', '1') == '1'
+TRACE_PROFILE_ENABLED = os.environ.get('TRACE_PROFILE_ENABLED', '0') == '1'
+TRACE_PROFILE_SAMPLE = float(os.environ.get('TRACE_PROFILE_SAMPLE', 0))
+TRACE_PROFILE_TOP = int(os.environ.get('TRACE_PROFILE_TOP', 25))
+
+_current = contextvars.ContextVar('trace', default=None)
+_TOKEN_RE = re.compile(r'[^\w.-]')
+
+
+class Trace:
+    def __init__(self, endpoint: str, profile: bool = False):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.stages = {}    # nombre -> [ms acumulados, veces]
+        self.fields = {}
+        self._lock = threading.Lock()
+        self._token = _current.set(self)
+        self._profiler = None
+        if profile:
+            self.start_profile()
+
+    def start_profile(self):
+        if self._profiler is not None:
+            return
+        # cProfile / pstats sólo cuando se pide un perfil (no en el arranque)
+        import cProfile
+        try:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        except ValueError:
+            # Ya hay otro profiler activo en el proceso
+            self._profiler = None
+
+    def request_profile(self, requested):
+        """Perfil pedido en el body de la petición"""
+        if requested and TRACE_PROFILE_ENABLED:
+            self.start_profile()
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - t0) * 1000)
+
+    def add(self, name: str, ms: float):
+        with self._lock:
+            entry = self.stages.setdefault(name, [0.0, 0])
+            entry[0] += ms
+            entry[1] += 1
+
+    def note(self, **fields):
+        with self._lock:
+            self.fields.update(fields)
+
+    def count(self, **fields):
+        with self._lock:
+            for key, value in fields.items():
+                self.fields[key] = self.fields.get(key, 0) + value
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def header(self) -> str:
+        """Server-Timing: etapa;dur=ms (con desc="xN" si se repitió) + total"""
+        parts = []
+        with self._lock:
+            for name, (ms, n) in self.stages.items():
+                desc = f';desc="x{n}"' if n > 1 else ''
+                parts.append(f'{_TOKEN_RE.sub("_", name)};dur={ms:.1f}{desc}')
+        parts.append(f'total;dur={self.elapsed_ms():.1f}')
+        return ', '.join(parts)
+
+    def finish(self, status: int, **fields) -> str:
+        """Cierra la traza y escribe el log; regresa el perfil (texto) si hubo"""
+        profile = None
+        if self._profiler is not None:
+            self._profiler.disable()
+            import pstats
+            out = io.StringIO()
+            pstats.Stats(self._profiler, stream=out).sort_stats('cumulative').print_stats(TRACE_PROFILE_TOP)
+            profile = out.getvalue()
+            self._profiler = None
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            _current.set(None)
+        if TRACE_LOG:
+            line = {
+                'endpoint': self.endpoint,
+                'status': status,
+                'total_ms': round(self.elapsed_ms(), 1),
+                'stages': {name: round(ms, 1) for name, (ms, _) in self.stages.items()},
+                **self.fields,
+                **fields,
+            }
+            if profile:
+                line['profile'] = profile
+            print(json.dumps(line, ensure_ascii=False, default=str))
+        return profile
+
+
+def start_trace(endpoint: str, headers=None) -> Trace:
+    """Traza de la petición; headers permite pedir perfil con X-Profile: 1"""
+    requested = headers is not None and headers.get('X-Profile') == '1'
+    profile = (TRACE_PROFILE_ENABLED and requested) or (
+        TRACE_PROFILE_SAMPLE > 0 and random.random() < TRACE_PROFILE_SAMPLE
+    )
+    return Trace(endpoint, profile)
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def stage(name: str):
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    with trace.stage(name):
+        yield
+
+
+def lap(name: str, since: float) -> float:
+    """Registra la etapa name desde since (perf_counter); regresa el tiempo actual"""
+    now = time.perf_counter()
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, (now - since) * 1000)
+    return now
+
+
+def bind(fn):
+    """fn que corre con el contexto (y la traza) de quien la envolvió"""
+    ctx = contextvars.copy_context()
+    def call(*args, **kwargs):
+        return ctx.copy().run(fn, *args, **kwargs)
+    return call
+
+
+def note(**fields):
+    trace = _current.get()
+    if trace is not None:
+        trace.note(**fields)
+
+
+def count(**fields):
+    trace = _current.get()
+    if trace is not None:
+        trace.count(**fields)
+
@@ -0,0 +1,188 @@
+"""
+Recorte del HTML para el prompt de Gemini.
+
+En vez de los primeros N caracteres (casi todo <head>, scripts y CSS):
+1. Se guardan los bloques JSON-LD (compactados) y, de los demás scripts,
+   los pares "clave": valor de precio (estado de VTEX / Next.js).
+2. Se quitan script/style/svg/nav/noscript, comentarios y atributos que no
+   ayudan (se conservan itemprop, content, property y clases de precio/título).
+3. Se eligen ventanas alrededor de candidatos: itemprop, <title>/<h1>, palabras de
+   precio y montos con $; se empacan por prioridad hasta el presupuesto de
+   tokens y se devuelven en orden del documento.
+
+html_windows() regresa (texto, stats) con la razón de compresión.
+"""
+import json
+import os
+import re
+
+# Presupuesto de tokens del HTML en el prompt (~4 caracteres por token)
+GEMINI_HTML_TOKENS = int(os.environ.get('GEMINI_HTML_TOKENS', 1500))
+CHARS_PER_TOKEN = 4
+# Caracteres de HTML (antes de limpiar) a cada lado de un candidato
+WINDOW_RADIUS = 600
+# Tope por bloque JSON-LD
+LDJSON_MAX_CHARS = 1500
+# Pares de precio tomados de scripts (estado embebido)
+SCRIPT_MAX_SNIPPETS = 4
+
+_LDJSON_RE = re.compile(
+    r'<script\b[^>]*type\s*=\s*["\']application/ld\+json["\'][^>]*>(.*?)</script>', re.I | re.S
+)
+_NOISE_RE = re.compile(
+    r'<(script|style|svg|nav|noscript|template|iframe)\b[^>]*>.*?</\1\s*>|<!--.*?-->|<!doctype[^>]*>',
+    re.I | re.S
+)
+_SCRIPT_PRICE_RE = re.compile(
+    r'"(?:price|sellingPrice|currentPrice|salePrice|precioVenta|ListPrice)"\s*:\s*(?:\{[^{}]{0,80}\}|[^,}\]]{1,30})',
+    re.I
+)
+_TAG_RE = re.compile(r'<(/?)([a-zA-Z][\w:-]*)([^>]*)>')
+_ATTR_RE = re.compile(r'([\w:-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+_KEEP_CLASS_RE = re.compile(r'price|precio|title|titulo|product|brand|marca|stock', re.I)
+_KEEP_TAGS = {'title', 'h1', 'h2', 'meta'}
+_LDJSON_TYPE_RE = re.compile(r'application/ld\+json', re.I)
+_SPACE_RE = re.compile(r'\s+')
+
+# (patrón, prioridad): mayor prioridad entra primero al presupuesto.
+# Sin re.I a propósito: con prefijo literal sre busca ~20x más rápido en
+# páginas de MB, y las variantes de mayúsculas van como patrones aparte
+_CANDIDATES = (
+    (re.compile(r'itemprop='), 4),
+    (re.compile(r'<(?:h1|title|H1|TITLE)\b'), 3),
+    (re.compile(r'<meta property="(?:og|product):'), 3),
+    (re.compile(r'pr(?:ecio|ice)'), 2),
+    (re.compile(r'Pr(?:ecio|ice)'), 2),
+    (re.compile(r'PR(?:ECIO|ICE)'), 2),
+    (re.compile(r'\$\s?\d'), 1),
+)
+
+
+def _compact_ldjson(raw: str) -> str:
+    try:
+        text = json.dumps(json.loads(raw), ensure_ascii=False, separators=(',', ':'))
+    except ValueError:
+        text = _SPACE_RE.sub(' ', raw).strip()
+    return text[:LDJSON_MAX_CHARS]
+
+
+def _prune_tag(m) -> str:
+    closing, name, attrs = m.groups()
+    name = name.lower()
+    if closing:
+        return ' '
+    kept = []
+    for a in _ATTR_RE.finditer(attrs):
+        key = a.group(1).lower()
+        value = a.group(2) if a.group(2) is not None else a.group(3)
+        if key in ('itemprop', 'content', 'property') or (key == 'class' and _KEEP_CLASS_RE.search(value)):
+            kept.append(f'{key}="{value[:120]}"')
+    if not kept and (name not in _KEEP_TAGS or name == 'meta'):
+        return ' '
+    return f"<{name}{' ' if kept else ''}{' '.join(kept)}>"
+
+
+def clean_html(html_text: str) -> str:
+    """HTML sin ruido: sin scripts/estilos/nav y con atributos mínimos"""
+    return _clean_fragment(_NOISE_RE.sub(' ', html_text))
+
+
+def _clean_fragment(fragment: str) -> str:
+    """Atributos mínimos y espacios colapsados (el ruido ya se quitó)"""
+    return _SPACE_RE.sub(' ', _TAG_RE.sub(_prune_tag, fragment)).strip()
+
+
+def _snap(text: str, start: int, end: int):
+    """Ajusta (inicio, fin) para no cortar una etiqueta a la mitad"""
+    gt = text.find('>', start, end)
+    if gt != -1 and text.find('<', start, gt) == -1:
+        start = gt + 1
+    lt = text.rfind('<', start, end)
+    if lt != -1 and text.find('>', lt, end) == -1:
+        end = lt
+    return start, end
+
+
+def _pick_windows(text: str, budget: int) -> list:
+    """
+    Fragmentos limpios (inicio, texto) por prioridad hasta llenar budget
+    caracteres. Las ventanas se toman del HTML sin ruido y sólo ellas se
+    limpian, para no procesar etiqueta por etiqueta la página completa.
+    """
+    candidates = []
+    for pattern, priority in _CANDIDATES:
+        for m in pattern.finditer(text):
+            candidates.append((-priority, m.start()))
+    candidates.sort()
+
+    chosen = []
+    covered = []
+    used = 0
+    for _, pos in candidates:
+        if used >= budget:
+            break
+        if any(s <= pos < e for s, e in covered):
+            continue
+        # Recortada para no encimarse con las ventanas vecinas
+        start = max([pos - WINDOW_RADIUS, 0] + [e for s, e in covered if e <= pos])
+        end = min([pos + WINDOW_RADIUS, len(text)] + [s for s, e in covered if s > pos])
+        covered.append((start, end))
+        fragment = _clean_fragment(text[slice(*_snap(text, start, end))])[:budget - used]
+        if len(fragment) < 40:
+            continue
+        chosen.append((start, fragment))
+        used += len(fragment)
+    return sorted(chosen)
+
+
+def html_windows(html_text: str, max_tokens: int = GEMINI_HTML_TOKENS):
+    """
+    Fragmentos relevantes del HTML dentro de max_tokens.
+    Regresa (texto, stats) con stats = original_chars, prompt_chars,
+    tokens_est, windows, compression_ratio.
+    """
+    budget = max_tokens * CHARS_PER_TOKEN
+    parts = []
+
+    for m in _LDJSON_RE.finditer(html_text):
+        if budget <= 0:
+            break
+        block = _compact_ldjson(m.group(1))[:budget]
+        parts.append(f'[JSON-LD] {block}')
+        budget -= len(block)
+
+    snippets = []
+    for m in _SCRIPT_PRICE_RE.finditer(html_text):
+        # Sólo dentro de un <script> que no sea JSON-LD (ése ya va completo)
+        opened = html_text.rfind('<script', 0, m.start())
+        if opened == -1 or html_text.rfind('</script', opened, m.start()) != -1:
+            continue
+        if _LDJSON_TYPE_RE.search(html_text, opened, html_text.find('>', opened)):
+            continue
+        snippets.append(m.group(0))
+        if len(snippets) >= SCRIPT_MAX_SNIPPETS:
+            break
+    if snippets and budget > 0:
+        block = ', '.join(snippets[:SCRIPT_MAX_SNIPPETS])[:budget]
+        parts.append(f'[script] {block}')
+        budget -= len(block)
+
+    windows = []
+    if budget > 0:
+        text = _NOISE_RE.sub(' ', html_text)
+        windows = _pick_windows(text, budget)
+        if not windows:
+            # Sin candidatos: el inicio del texto limpio
+            head = _clean_fragment(text[:budget * 4])[:budget]
+            windows = [(0, head)] if head else []
+        parts.extend(fragment for _, fragment in windows)
+
+    prompt_text = '\n…\n'.join(parts)
+    stats = {
+        'original_chars': len(html_text),
+        'prompt_chars': len(prompt_text),
+        'tokens_est': len(prompt_text) // CHARS_PER_TOKEN,
+        'windows': len(windows),
+        'compression_ratio': round(len(html_text) / max(1, len(prompt_text)), 1),
+    }
+    return prompt_text, stats
@@ -1,22 +1,45 @@
 from http.server import BaseHTTPRequestHandler
 import json
-import urllib.request
 import urllib.parse
-import urllib.error
 import re
 import html
 import os
-import google.generativeai as genai
-
-# Configurar Gemini
-GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+import codecs
+import atexit
+import hashlib
+import threading
+import time
+from api._http import http_get, pool_stats
+from api._structured import extract_structured
+from api._windowing import html_windows
+from api._trace import start_trace, stage, lap, note, count
+from api._governor import GEMINI, governor_state
+from api._deadline import (start_deadline, request_budget_ms, stage_timeout, expired, skip, skipped,
+                           DeadlineExceeded)
+from api._profiles import ProfileStore, host_key
+from api._sellers import canonical_seller
+from api._history import PriceHistory
+from api._gemini import GEMINI_API_KEY, get_model
+from api._json import dumps
 
 # Límites de validación (ajustados para productos baratos MX)
 PRICE_MIN = 1
 PRICE_MAX = 200000
 
+# Tope de bytes por página; el request puede pedir menos con "max_bytes"
+FETCH_MAX_BYTES = int(os.environ.get('FETCH_MAX_BYTES', 3 * 1024 * 1024))
+FETCH_CHUNK_SIZE = 64 * 1024
+# Margen al final del búfer que no se escanea hasta tener más texto, para no
+# cortar una coincidencia a la mitad
+_SCAN_MARGIN = 8192
+
+FETCH_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                  '(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36',
+    'Accept-Language': 'es-MX,es;q=0.9,en;q=0.8'
+}
+FETCH_TIMEOUT = 12
+
 PRICE_PATTERNS = [
     # JSON estructurado (alta prioridad)
     r'"offers"\s*:\s*\{[^}]*?"price"\s*:\s*"?([0-9.,]+)"?',
@@ -43,6 +66,74 @@ PRICE_PATTERNS = [
     r'(?:precio|price)["\s:]*\$?\s*([0-9.,]+)'
 ]
 
+# Origen y confianza (0-1) de cada patrón de PRICE_PATTERNS, en el mismo orden
+PRICE_PATTERN_SOURCES = [
+    ('json_offers', 0.95),
+    ('json_priceAmount', 0.9),
+    ('json_currentPrice', 0.9),
+    ('json_salePrice', 0.85),
+    ('json_sellingPrice', 0.9),
+    ('json_lowPrice', 0.8),
+    ('json_precioVenta', 0.85),
+    ('json_precio', 0.7),
+    ('attr_data_price', 0.75),
+    ('attr_data_product_price', 0.75),
+    ('itemprop_price', 0.9),
+    ('itemprop_price', 0.9),
+    ('css_product_price', 0.6),
+    ('css_precio', 0.55),
+    ('currency_symbol', 0.4),
+    ('price_keyword', 0.3),
+]
+
+# Precio estructurado de alta confianza: al encontrarlo se deja de descargar.
+# json_precio / data-price / salePrice... no cortan la descarga: un banner
+# con "desde $15" arriba taparía el JSON-LD de más abajo (y extract_structured
+# sólo vería lo leído)
+EARLY_STOP_SOURCES = ('json_offers', 'json_priceAmount', 'json_currentPrice', 'json_sellingPrice',
+                      'itemprop_price')
+_EARLY_STOP = frozenset(i for i, (name, _) in enumerate(PRICE_PATTERN_SOURCES) if name in EARLY_STOP_SOURCES)
+
+# Llave estable de cada patrón para los perfiles por dominio (api/_profiles.py):
+# nombre + hash del patrón, así reordenar o editar la lista no confunde perfiles
+PRICE_PATTERN_KEYS = tuple(
+    f"{name}:{hashlib.sha1(p.encode('utf-8')).hexdigest()[:6]}"
+    for (name, _), p in zip(PRICE_PATTERN_SOURCES, PRICE_PATTERNS)
+)
+_PATTERN_INDEX = {key: i for i, key in enumerate(PRICE_PATTERN_KEYS)}
+# Patrones promovidos que se prueban antes del recorrido general. Sólo los
+# mismos de alta confianza que cortan la descarga (_EARLY_STOP): un acierto
+# del perfil también la corta, y con data-price o "precio" se perdería el
+# JSON de más abajo
+PROFILE_MAX_PROBES = 2
+PROFILES = ProfileStore(promotable=lambda key: _PATTERN_INDEX.get(key) in _EARLY_STOP)
+atexit.register(PROFILES.flush)
+
+# Confianza del precio tomado de datos estructurados (parseados con json),
+# según de dónde salió
+STRUCTURED_SCORES = {
+    'json-ld': 0.98,
+    'vtex_state': 0.95,
+    'next_data': 0.95,
+    'microdata': 0.9,
+}
+
+# Política por niveles: Gemini sólo se usa si el precio de regex tiene
+# confianza menor a este umbral o si se piden campos opcionales
+GEMINI_MIN_SCORE = float(os.environ.get('GEMINI_MIN_SCORE', 0.75))
+OPTIONAL_FIELDS = ('brand', 'category', 'availability', 'rating', 'review_count', 'description')
+
+# Conteo por proceso de qué nivel respondió (para medir llamadas ahorradas)
+_TIER_STATS = {'regex': 0, 'gemini': 0, 'regex_fallback': 0, 'llm_skipped': 0, 'history': 0}
+_tier_lock = threading.Lock()
+
+# Última extracción por URL (api/_history.py): peticiones condicionales y
+# reutilización si la página no cambió
+HISTORY = PriceHistory()
+# Campos de la extracción que se guardan y se reutilizan
+HISTORY_FIELDS = ('title', 'price', 'currency', 'seller', 'price_source', 'price_score', 'extraction_method',
+                  'extraction_tier', 'confidence', 'structured_sources', 'message') + OPTIONAL_FIELDS
+
 def _normalize_price(s):
     """Normaliza precios a formato decimal"""
     if not s: return None
@@ -56,42 +147,264 @@ def _normalize_price(s):
     except: 
         return None
 
-def _extract_with_regex(html_text: str) -> dict:
-    """Extrae información usando regex (método original)"""
-    result = {}
-    
-    # Title
-    mtitle = re.search(r'<title[^>]*>(.*?)</title>', html_text, re.I|re.S)
-    result['title'] = html.unescape(mtitle.group(1)).strip() if mtitle else None
-    
-    # Seller
-    mseller = re.search(r'"seller"\s*:\s*"?([^",}{]+)"?', html_text, re.I)
-    result['seller'] = mseller.group(1).strip() if mseller else None
-    
-    # Currency
-    mcurr = re.search(r'"priceCurrency"\s*:\s*"?([A-Z]{3})"?', html_text, re.I)
-    result['currency'] = (mcurr.group(1).strip() if mcurr else None) or 'MXN'
-    
-    # Price
-    price = None
-    for p in PRICE_PATTERNS:
-        for m in re.finditer(p, html_text, re.I):
-            price = _normalize_price(m.group(1))
-            if price: break
-        if price: break
-    result['price'] = price
-    
-    return result
+# ===================== Extractor de un solo recorrido =====================
+# Cada patrón se compila una sola vez al cargar el módulo.
+_PRICE_RES = tuple(re.compile(p, re.I) for p in PRICE_PATTERNS)
+_TITLE_RE = re.compile(r'<title[^>]*>(.*?)</title>', re.I | re.S)
+_SELLER_RE = re.compile(r'"seller"\s*:\s*"?([^",}{]+)"?', re.I)
+_CURRENCY_RE = re.compile(r'"priceCurrency"\s*:\s*"?([A-Z]{3})"?', re.I)
+
+# Anclas literales (sobre el texto en minúsculas) donde puede empezar algún
+# patrón. Sin grupos: así `re` conserva la búsqueda rápida por primer carácter.
+_ANCHOR_RE = re.compile(
+    r'"(?:offers"|priceamount"|currentprice"|saleprice"|sellingprice"|lowprice"'
+    r'|precio|seller"|pricecurrency")'
+    r'|data-p|itemprop="price"|content="[0-9.,]'
+    r'|class="[^"]*(?:product-price|precio)'
+    r'|\$|price|precio|<title'
+)
+# Ancla -> índices de PRICE_PATTERNS a probar en esa posición (en orden), o
+# el nombre del campo. Las anclas variables se resuelven por sus 7 primeros
+# caracteres.
+_ANCHOR_KINDS = {
+    '"offers"': (0,),
+    '"priceamount"': (1,),
+    '"currentprice"': (2,),
+    '"saleprice"': (3,),
+    '"sellingprice"': (4,),
+    '"lowprice"': (5,),
+    '"precio': (6, 7),
+    'data-p': (8, 9),
+    'itemprop="price"': (10,),
+    'content': (11,),
+    'class="': (12, 13),
+    '$': (14,),
+    'price': (15,),
+    'precio': (15,),
+    '"seller"': 'seller',
+    '"pricecurrency"': 'currency',
+    '<title': 'title',
+}
+
+
+def _fold_case(text: str) -> str:
+    """Minúsculas conservando posiciones (mismas equivalencias que re.I)"""
+    if text.isascii():
+        return text.lower()
+    # Únicos caracteres que re.I empata con letras ASCII y que lower() no
+    # resuelve 1 a 1
+    text = text.replace('\u0130', 'i').replace('\u0131', 'i').replace('\u017f', 's')
+    return text.lower()
+
+
+class PriceScanner:
+    """
+    Recorre el HTML una sola vez buscando anclas literales y sólo en esas
+    posiciones prueba los patrones compilados. Devuelve el mismo resultado que
+    aplicar PRICE_PATTERNS uno por uno (prioridad por orden de la lista).
+    """
+
+    def __init__(self):
+        self.title = None
+        self.seller = None
+        self.currency = None
+        self.price = None
+        self.priority = len(PRICE_PATTERNS)   # índice del patrón ganador
+        self.done = False
+        self._pos = 0
+        self._last_end = [0] * len(PRICE_PATTERNS)
+        self._title_found = False
+        self._probe_pos = 0
+        self.probe_hit = False   # el precio salió de un patrón del perfil del dominio
+
+    def probe(self, text: str, probes, end: int = None) -> bool:
+        """
+        Prueba primero los patrones promovidos del dominio (índices de
+        PRICE_PATTERNS, en orden) sobre lo que empieza en
+        text[self._probe_pos:end]. Si uno da precio se toma y se terminan los
+        campos, sin el recorrido general. Se puede llamar por bloques, como scan.
+        """
+        if self.done:
+            return self.probe_hit
+        if end is None:
+            end = len(text)
+        pos = self._probe_pos
+        for idx in probes:
+            start = pos
+            while True:
+                m = _PRICE_RES[idx].search(text, start)
+                if m is None or m.start() >= end:
+                    break
+                price = _normalize_price(m.group(1))
+                if price:
+                    self.price = price
+                    self.priority = idx
+                    self.probe_hit = True
+                    self._finish_fields(text, 0)
+                    return True
+                start = m.start() + 1
+        self._probe_pos = max(pos, end)
+        return False
+
+    def scan(self, text: str, folded: str = None, end: int = None) -> 'PriceScanner':
+        """
+        Escanea las anclas que empiezan en text[self._pos:end]. Se puede llamar
+        varias veces con el texto creciendo (lectura por bloques): cada llamada
+        continúa donde terminó la anterior. `folded` es _fold_case(text).
+        """
+        if self.done:
+            return self
+        if folded is None:
+            folded = _fold_case(text)
+        if end is None:
+            end = len(text)
+
+        search = _ANCHOR_RE.search
+        pos = self._pos
+        while pos < end:
+            a = search(folded, pos)
+            if a is None:
+                pos = end
+                break
+            start = a.start()
+            if start >= end:
+                # Se revisa en la siguiente llamada, con más texto disponible
+                pos = start
+                break
+            pos = start + 1
+            token = a.group()
+            kind = _ANCHOR_KINDS.get(token) or _ANCHOR_KINDS[token[:7]]
+
+            if kind == 'title':
+                if not self._title_found:
+                    m = _TITLE_RE.match(text, start)
+                    if m:
+                        self.title = html.unescape(m.group(1)).strip()
+                        self._title_found = True
+            elif kind == 'seller':
+                if self.seller is None:
+                    m = _SELLER_RE.match(text, start)
+                    if m:
+                        self.seller = m.group(1).strip()
+            elif kind == 'currency':
+                if self.currency is None:
+                    m = _CURRENCY_RE.match(text, start)
+                    if m:
+                        self.currency = m.group(1).strip()
+            else:
+                for idx in kind:
+                    # Un patrón de igual o menor prioridad ya no puede ganar
+                    if idx >= self.priority:
+                        break
+                    # Emula finditer: no se traslapan coincidencias del mismo patrón
+                    if start < self._last_end[idx]:
+                        continue
+                    m = _PRICE_RES[idx].match(text, start)
+                    if not m:
+                        continue
+                    self._last_end[idx] = m.end()
+                    price = _normalize_price(m.group(1))
+                    if price:
+                        self.price = price
+                        self.priority = idx
+                        break
+
+            if self.priority == 0:
+                # Ya no hay precio mejor: los campos faltantes se buscan
+                # directo con su patrón (búsqueda por prefijo literal)
+                self._finish_fields(text, pos)
+                break
+
+        self._pos = pos
+        return self
+
+    def _finish_fields(self, text: str, pos: int):
+        if not self._title_found:
+            m = _TITLE_RE.search(text, pos)
+            if m:
+                self.title = html.unescape(m.group(1)).strip()
+                self._title_found = True
+        if self.seller is None:
+            m = _SELLER_RE.search(text, pos)
+            if m:
+                self.seller = m.group(1).strip()
+        if self.currency is None:
+            m = _CURRENCY_RE.search(text, pos)
+            if m:
+                self.currency = m.group(1).strip()
+        self.done = True
+
+    def result(self) -> dict:
+        source, score = (PRICE_PATTERN_SOURCES[self.priority]
+                         if self.price is not None else (None, None))
+        return {
+            'title': self.title,
+            'seller': self.seller,
+            'currency': self.currency or 'MXN',
+            'price': self.price,
+            'price_source': source,
+            'price_score': score,
+        }
+
+
+def _extract_with_regex(html_text: str, probes=()) -> dict:
+    """Extrae título, vendedor, moneda y precio en un solo recorrido del HTML"""
+    return _scan_page(html_text, probes).result()
+
+def _scan_page(html_text: str, probes=()) -> PriceScanner:
+    scanner = PriceScanner()
+    if probes and scanner.probe(html_text, probes):
+        return scanner
+    # Atajo: el bloque "offers" (máxima prioridad) se localiza por prefijo
+    # literal, mucho más rápido que el recorrido general
+    for m in _PRICE_RES[0].finditer(html_text):
+        price = _normalize_price(m.group(1))
+        if price:
+            scanner.price = price
+            scanner.priority = 0
+            scanner._finish_fields(html_text, 0)
+            return scanner
+    scanner._last_end[0] = len(html_text)
+    return scanner.scan(html_text)
+
+def _apply_structured(regex_result: dict, structured: dict) -> dict:
+    """
+    Combina el resultado de regex con los datos estructurados: el precio
+    estructurado gana si su confianza es igual o mayor, y los campos
+    opcionales se llenan sin llamar al modelo.
+    """
+    sources = structured.get('field_sources', {})
+    price = structured.get('price')
+    if price is not None and PRICE_MIN <= price <= PRICE_MAX:
+        score = STRUCTURED_SCORES[sources['price']]
+        if score >= (regex_result.get('price_score') or 0):
+            regex_result['price'] = price
+            regex_result['price_source'] = f"structured_{sources['price']}"
+            regex_result['price_score'] = score
+            if structured.get('currency'):
+                regex_result['currency'] = structured['currency'].upper()
+    for field in ('title', 'seller'):
+        if regex_result.get(field) is None and structured.get(field):
+            regex_result[field] = structured[field]
+    for field in OPTIONAL_FIELDS:
+        regex_result[field] = structured.get(field)
+    regex_result['structured_sources'] = sources
+    return regex_result
 
 def _enhance_with_gemini(html_text: str, url: str, regex_result: dict) -> dict:
     """
     Usa Gemini para mejorar la extracción de información del producto
     """
     try:
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
+        timeout = GEMINI.budget()
+        if timeout is None:
+            raise ValueError('Sin tiempo para Gemini (deadline)')
+        model = get_model('gemini-2.0-flash-exp')
         
-        # Truncar HTML si es muy largo
-        html_preview = html_text[:8000] if len(html_text) > 8000 else html_text
+        # Sólo las ventanas relevantes del HTML, dentro del presupuesto de tokens
+        with stage('windows'):
+            html_preview, prompt_stats = html_windows(html_text)
+        t = time.perf_counter()
         
         prompt = f"""Analiza el siguiente HTML de una página de producto y extrae información estructurada.
 
@@ -100,7 +413,7 @@ URL: {url}
 Información ya extraída con regex:
 {json.dumps(regex_result, indent=2, ensure_ascii=False)}
 
-HTML (primeros 8000 caracteres):
+Fragmentos relevantes del HTML (sin scripts ni estilos; "…" separa fragmentos):
 {html_preview}
 
 Tu tarea:
@@ -138,8 +451,11 @@ IMPORTANTE:
 - confidence puede ser: "high", "medium", "low"
 - Si no estás seguro de un campo, déjalo como null"""
 
-        response = model.generate_content(prompt)
+        t = lap('prompt', t)
+        response = GEMINI.call(model.generate_content, prompt, request_options={'timeout': timeout})
         result_text = response.text.strip()
+        t = lap('gemini', t)
+        note(prompt_chars=len(prompt), response_chars=len(result_text))
         
         # Limpiar markdown
         result_text = result_text.replace('```json', '').replace('```', '').strip()
@@ -173,9 +489,11 @@ IMPORTANTE:
             'review_count': gemini_result.get('review_count'),
             'description': gemini_result.get('description'),
             'extraction_method': 'gemini_enhanced',
-            'confidence': gemini_result.get('confidence', 'medium')
+            'confidence': gemini_result.get('confidence', 'medium'),
+            'prompt_stats': prompt_stats
         }
         
+        lap('json_repair', t)
         return final_result
         
     except Exception as e:
@@ -185,6 +503,281 @@ IMPORTANTE:
         regex_result['confidence'] = 'low' if not regex_result.get('price') else 'medium'
         return regex_result
 
+def _response_charset(content_type: str) -> str:
+    """Charset del header Content-Type (utf-8 si no viene)"""
+    m = re.search(r'charset=["\']?([\w.:-]+)', content_type or '', re.I)
+    return m.group(1) if m else 'utf-8'
+
+def _stream_extract(chunks, encoding: str = 'utf-8', max_bytes: int = FETCH_MAX_BYTES,
+                    early_stop: bool = True, probes=()):
+    """
+    Consume el cuerpo por bloques (iterable de bytes) y extrae mientras llega.
+    Deja de leer al encontrar un precio estructurado confiable o al llegar a
+    max_bytes. Regresa (html_text, regex_result, fetch_info).
+
+    Con probes (patrones del perfil del dominio) sólo se buscan esos mientras
+    llega la página; si ninguno acierta, el recorrido general corre al final
+    sobre lo leído (y ya no hay corte temprano por él).
+    """
+    try:
+        decoder = codecs.getincrementaldecoder(encoding)(errors='ignore')
+    except LookupError:
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+
+    scanner = PriceScanner()
+    text = folded = ''
+    bytes_read = 0
+    truncated = stopped_early = deadline_cut = False
+
+    chunks = iter(chunks)
+    while True:
+        chunk = next(chunks, b'')[:max_bytes - bytes_read]
+        bytes_read += len(chunk)
+        final = not chunk or bytes_read >= max_bytes
+        piece = decoder.decode(chunk, final=final)
+        text += piece
+
+        end = len(text) if final else len(text) - _SCAN_MARGIN
+        if probes:
+            if end > 0:
+                scanner.probe(text, probes, end)
+        else:
+            folded += _fold_case(piece)
+            if end > 0:
+                scanner.scan(text, folded, end)
+
+        if early_stop and scanner.priority in _EARLY_STOP:
+            stopped_early = not final
+            break
+        if final:
+            truncated = bool(chunk)
+            break
+        if expired():
+            # Se acabó el presupuesto: se extrae de lo que ya llegó
+            deadline_cut = stopped_early = True
+            skip('download')
+            break
+
+    if probes and not scanner.probe_hit:
+        # El perfil no acertó en esta página: recorrido general
+        scanner.scan(text)
+    elif stopped_early:
+        # Lo que quedó en el margen también se revisa antes de cerrar
+        scanner.scan(text, folded)
+
+    fetch_info = {
+        'bytes_read': bytes_read,
+        'stopped_early': stopped_early,
+        'truncated': truncated,
+        'deadline_cut': deadline_cut,
+    }
+    _profile_info(scanner, probes, fetch_info)
+    return text, scanner.result(), fetch_info
+
+def _profile_info(scanner: PriceScanner, probes, fetch_info: dict):
+    """Patrón ganador y si acertó el perfil del dominio, en fetch_info"""
+    fetch_info['pattern'] = PRICE_PATTERN_KEYS[scanner.priority] if scanner.price is not None else None
+    fetch_info['probed'] = [PRICE_PATTERN_KEYS[i] for i in probes]
+    fetch_info['probe_hit'] = scanner.probe_hit
+
+class FetchHTTPError(Exception):
+    """La tienda respondió con un status HTTP de error"""
+    def __init__(self, code):
+        super().__init__(f'Fetch HTTPError {code}')
+        self.code = code
+
+def _count_tier(tier: str, llm_skipped: bool = False) -> dict:
+    with _tier_lock:
+        _TIER_STATS[tier] += 1
+        if llm_skipped:
+            _TIER_STATS['llm_skipped'] += 1
+        return dict(_TIER_STATS)
+
+def _reusable(result, gemini_available: bool, fields) -> bool:
+    """¿La extracción guardada responde esta petición si la página no cambió?"""
+    if not result:
+        return False
+    tier = result.get('extraction_tier')
+    if not gemini_available or tier == 'gemini':
+        return True
+    if tier != 'regex':
+        # regex_fallback: Gemini falló esa vez, se vuelve a intentar
+        return False
+    wants_details = any(f in OPTIONAL_FIELDS and result.get(f) is None for f in (fields or ()))
+    return not wants_details and (result.get('price_score') or 0) >= GEMINI_MIN_SCORE
+
+def _hashed(chunks, hasher):
+    for chunk in chunks:
+        hasher.update(chunk)
+        yield chunk
+
+def _finish_result(final_result: dict, url: str, fetch_info: dict) -> dict:
+    """Campos comunes de la respuesta (extracción nueva o del historial)"""
+    # Si no se encontró precio, informar
+    if final_result.get('price') is None:
+        final_result['message'] = 'No se pudo extraer el precio de esta página'
+
+    # Vendedor con el mismo nombre canónico que search / shopping (por dominio si la página no lo trae)
+    final_result['seller'] = canonical_seller(final_result.get('seller'), url)
+
+    # NUEVO: Agregar información de validación
+    final_result['url'] = url
+    final_result['powered_by'] = 'gemini-2.0-flash' if final_result.get('extraction_tier') == 'gemini' else 'regex'
+    final_result['fetch'] = fetch_info
+    final_result['upstreams'] = {'gemini': governor_state()['gemini']}
+    final_result['validation'] = {
+        'price_range_filter': f'{PRICE_MIN}-{PRICE_MAX} MXN',
+        'price_valid': final_result.get('price') is not None
+    }
+    return final_result
+
+def _from_history(stored: dict, url: str, status: str, fetch_info: dict) -> dict:
+    """Respuesta con la extracción guardada (304 o mismo contenido)"""
+    count(history_reused=1)
+    result = dict(stored['result'])
+    result['tier_stats'] = _count_tier('history')
+    result['history'] = {
+        'status': status,
+        'checked_at': int(stored['checked_at']),
+        'changed_at': int(stored['changed_at']),
+    }
+    return _finish_result(result, url, fetch_info)
+
+def _fetch_product(url: str, use_gemini: bool = True, stream: bool = True,
+                   max_bytes: int = FETCH_MAX_BYTES, fields=None, upc: str = None) -> dict:
+    """
+    Descarga la página del producto y extrae precio/título/vendedor.
+    fields: campos opcionales pedidos explícitamente (brand, rating, ...);
+    si alguno no salió de los datos estructurados, se usa Gemini aunque el
+    precio sea confiable.
+    Si la página no cambió desde la última vez (304 o mismo hash) se regresa
+    la extracción guardada en el historial.
+    """
+    gemini_available = bool(GEMINI_API_KEY and use_gemini)
+    stored = HISTORY.page(url)
+    reusable = stored is not None and _reusable(stored['result'], gemini_available, fields)
+    headers = FETCH_HEADERS
+    if reusable:
+        headers = dict(FETCH_HEADERS)
+        if stored['etag']:
+            headers['If-None-Match'] = stored['etag']
+        if stored['last_modified']:
+            headers['If-Modified-Since'] = stored['last_modified']
+
+    # Patrones que ya ganaron en este dominio: se prueban primero
+    host = host_key(url)
+    probes = [_PATTERN_INDEX[k] for k in PROFILES.preferred(host) if k in _PATTERN_INDEX][:PROFILE_MAX_PROBES]
+
+    # Fetch HTML (pool keep-alive compartido), con lo que quede del deadline
+    timeout = stage_timeout('download', FETCH_TIMEOUT)
+    if timeout is None:
+        raise DeadlineExceeded('Sin tiempo para descargar la página')
+    t = time.perf_counter()
+    hasher = hashlib.sha1()
+    with http_get(url, headers=headers, timeout=timeout, stream=True) as resp:
+        if resp.status_code == 304 and reusable:
+            lap('download', t)
+            HISTORY.touch(url)
+            return _from_history(stored, url, 'not_modified', {'bytes_read': 0, 'not_modified': True,
+                                                                 'http_pool': pool_stats()})
+        if resp.status_code >= 400:
+            raise FetchHTTPError(resp.status_code)
+        etag = resp.headers.get('ETag')
+        last_modified = resp.headers.get('Last-Modified')
+        encoding = _response_charset(resp.headers.get('Content-Type'))
+        if stream:
+            # 1. Descarga y extracción con regex por bloques
+            html_text, regex_result, fetch_info = _stream_extract(
+                _hashed(resp.iter_content(FETCH_CHUNK_SIZE), hasher), encoding, max_bytes, probes=probes
+            )
+            lap('download_extract', t)
+        else:
+            # Página completa, pero con el mismo tope de bytes
+            parts, bytes_read = [], 0
+            for chunk in resp.iter_content(FETCH_CHUNK_SIZE):
+                parts.append(chunk[:max_bytes - bytes_read])
+                bytes_read += len(parts[-1])
+                if bytes_read >= max_bytes:
+                    break
+            html_bytes = b''.join(parts)
+            hasher.update(html_bytes)
+            html_text = html_bytes.decode(encoding, errors='ignore')
+            fetch_info = {'bytes_read': bytes_read, 'stopped_early': False, 'truncated': bytes_read >= max_bytes,
+                          'deadline_cut': False}
+            regex_result = None
+            lap('download', t)
+
+    # Mismos bytes que la última vez: la extracción guardada sigue valiendo
+    content_hash = f"{fetch_info['bytes_read']}:{hasher.hexdigest()}"
+    if reusable and content_hash == stored['content_hash'] and not fetch_info['deadline_cut']:
+        HISTORY.record(url, stored['result'], upc, etag, last_modified, content_hash, changed=False)
+        fetch_info['http_pool'] = pool_stats()
+        return _from_history(stored, url, 'unchanged', fetch_info)
+
+    if regex_result is None:
+        # 1. Extracción con regex sobre la página completa
+        t = time.perf_counter()
+        scanner = _scan_page(html_text, probes)
+        regex_result = scanner.result()
+        _profile_info(scanner, probes, fetch_info)
+        lap('regex', t)
+    if not fetch_info['deadline_cut']:
+        # Una página cortada por el deadline no dice nada del dominio
+        PROFILES.record(host, fetch_info['pattern'], probes, fetch_info['probe_hit'])
+    fetch_info['profile'] = PROFILES.snapshot(host)
+    if probes:
+        count(profile_probe_hit=int(fetch_info['probe_hit']))
+    fetch_info['http_pool'] = pool_stats()
+    count(bytes_fetched=fetch_info['bytes_read'])
+
+    # 2. JSON-LD / estado embebido / microdata: precio y campos opcionales sin modelo
+    with stage('structured'):
+        regex_result = _apply_structured(regex_result, extract_structured(html_text))
+
+    # 3. Gemini sólo si el precio no es confiable o faltan campos opcionales pedidos
+    wants_details = any(f in OPTIONAL_FIELDS and regex_result.get(f) is None for f in (fields or ()))
+    regex_score = regex_result.get('price_score') or 0
+    if gemini_available and (regex_score < GEMINI_MIN_SCORE or wants_details):
+        regex_price = regex_result.get('price')
+        final_result = _enhance_with_gemini(html_text, url, regex_result)
+        if final_result.get('extraction_method') == 'gemini_enhanced':
+            tier = 'gemini'
+            # Lo que vino de datos estructurados tiene prioridad sobre el modelo
+            for field in OPTIONAL_FIELDS:
+                if regex_result.get(field) is not None:
+                    final_result[field] = regex_result[field]
+            final_result['structured_sources'] = regex_result.get('structured_sources')
+            if final_result.get('price') is not None and final_result['price'] != regex_price:
+                final_result['price_source'], final_result['price_score'] = 'gemini', None
+            else:
+                final_result['price_source'] = regex_result.get('price_source')
+                final_result['price_score'] = regex_result.get('price_score')
+        else:
+            tier = 'regex_fallback'
+        tier_stats = _count_tier(tier)
+    else:
+        regex_result['extraction_method'] = 'regex_only'
+        if gemini_available:
+            regex_result['confidence'] = 'high'
+        final_result = regex_result
+        tier = 'regex'
+        tier_stats = _count_tier(tier, llm_skipped=gemini_available)
+    final_result['extraction_tier'] = tier
+    final_result['tier_stats'] = tier_stats
+    _finish_result(final_result, url, fetch_info)
+
+    if HISTORY.enabled:
+        changed = stored is None or stored['content_hash'] != content_hash
+        if not skipped():
+            # Una extracción recortada por el deadline no se guarda para reutilizar
+            HISTORY.record(url, {k: final_result.get(k) for k in HISTORY_FIELDS}, upc,
+                           etag, last_modified, content_hash, changed=changed)
+        final_result['history'] = {
+            'status': 'new' if stored is None else ('changed' if changed else 'refreshed'),
+            'previous_price': stored['result'].get('price') if stored and stored['result'] else None,
+        }
+    return final_result
+
 class handler(BaseHTTPRequestHandler):
 
     def do_OPTIONS(self):
@@ -195,71 +788,71 @@ class handler(BaseHTTPRequestHandler):
         self.end_headers()
 
     def do_POST(self):
+        self._trace = start_trace('fetch', self.headers)
         try:
             content_length = int(self.headers.get('Content-Length', 0))
             body = self.rfile.read(content_length)
             data = json.loads(body.decode('utf-8'))
+            self._trace.request_profile(data.get('profile'))
 
             url = (data.get('url') or '').strip()
+            upc = re.sub(r'\D+', '', str(data.get('upc') or '')) or None
+            if data.get('last_known'):
+                # Último precio guardado de la URL o del UPC, sin red
+                known = HISTORY.last_price(url or None, upc)
+                if known is None:
+                    return self._send_error(404, 'Sin precio guardado para esa url / upc')
+                try:
+                    limit = int(data.get('limit') or 20)
+                except (TypeError, ValueError):
+                    return self._send_error(400, "'limit' debe ser entero")
+                known['history'] = HISTORY.history(url or None, upc, limit=limit)
+                return self._send_success(known)
+
             use_gemini = data.get('use_gemini', True)
+            stream = data.get('stream', True)
+            try:
+                max_bytes = max(1, min(int(data.get('max_bytes') or FETCH_MAX_BYTES), FETCH_MAX_BYTES))
+            except (TypeError, ValueError):
+                return self._send_error(400, "'max_bytes' debe ser entero")
             
             if not url:
                 return self._send_error(400, 'url requerida')
 
-            # Fetch HTML
-            req = urllib.request.Request(
-                url, headers={
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
-                                  '(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36',
-                    'Accept-Language': 'es-MX,es;q=0.9,en;q=0.8'
-                }
-            )
-            with urllib.request.urlopen(req, timeout=12) as resp:
-                html_bytes = resp.read()
-                encoding = resp.headers.get_content_charset() or 'utf-8'
-                html_text = html_bytes.decode(encoding, errors='ignore')
+            fields = data.get('fields') or []
+            if not isinstance(fields, list):
+                fields = [fields]
 
-            # 1. Extracción con regex (método original)
-            regex_result = _extract_with_regex(html_text)
-            
-            # 2. Si hay Gemini configurado y use_gemini=True, mejorar extracción
-            if GEMINI_API_KEY and use_gemini:
-                final_result = _enhance_with_gemini(html_text, url, regex_result)
-            else:
-                regex_result['extraction_method'] = 'regex_only'
-                final_result = regex_result
-            
-            # Si no se encontró precio, informar
-            if final_result.get('price') is None:
-                final_result['message'] = 'No se pudo extraer el precio de esta página'
-            
-            # NUEVO: Agregar información de validación
-            final_result['url'] = url
-            final_result['powered_by'] = 'gemini-2.0-flash' if (GEMINI_API_KEY and use_gemini) else 'regex'
-            final_result['validation'] = {
-                'price_range_filter': f'{PRICE_MIN}-{PRICE_MAX} MXN',
-                'price_valid': final_result.get('price') is not None
-            }
-            
+            deadline = start_deadline(request_budget_ms(data.get('deadline_ms')))
+            final_result = _fetch_product(url, use_gemini, stream, max_bytes, fields, upc)
+            # Parcial: el deadline cortó la descarga o dejó fuera a Gemini
+            final_result['partial'] = bool(deadline.skipped)
+            final_result['deadline'] = deadline.info()
+            note(extraction_tier=final_result['extraction_tier'], price_source=final_result.get('price_source'))
             return self._send_success(final_result)
 
         except json.JSONDecodeError:
             return self._send_error(400, 'JSON invalido')
-        except urllib.error.HTTPError as e:
-            return self._send_error(e.code, f'Fetch HTTPError {e.code}')
+        except FetchHTTPError as e:
+            return self._send_error(e.code, str(e))
+        except DeadlineExceeded as e:
+            return self._send_error(504, str(e))
         except Exception as e:
             return self._send_error(500, f'Error: {str(e)}')
 
     def _send_success(self, data):
-        self.send_response(200)
-        self.send_header('Content-type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.end_headers()
-        self.wfile.write(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+        self._send_json(200, data)
 
     def _send_error(self, code, message):
+        self._send_json(code, {'error': message}, error=message)
+
+    def _send_json(self, code, data, **log_fields):
+        with self._trace.stage('serialize'):
+            body = dumps(data)
         self.send_response(code)
         self.send_header('Content-type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Server-Timing', self._trace.header())
         self.end_headers()
-        self.wfile.write(json.dumps({'error': message}, ensure_ascii=False).encode('utf-8'))
+        self.wfile.write(body)
+        self._trace.finish(code, response_bytes=len(body), **log_fields)
\ No newline at end of file
@@ -0,0 +1,206 @@
+from http.server import BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import json
+import os
+import re
+
+from api._cache import cache_key
+from api.search import SEARCH_CACHE, _clean_upc, _run_search, _is_cacheable as _search_cacheable
+from api.shopping import SHOPPING_CACHE, _run_shopping, _is_cacheable as _shopping_cacheable
+from api.fetch import _fetch_product
+from api._trace import start_trace, bind, note
+from api._deadline import start_deadline, request_budget_ms
+from api._json import dumps
+
+# ===================== Configuración =====================
+# Presupuesto total de la petición (ms) y tope que puede pedir el cliente
+PRODUCT_DEADLINE_MS = int(os.environ.get('PRODUCT_DEADLINE_MS', 9000))
+PRODUCT_MAX_DEADLINE_MS = int(os.environ.get('PRODUCT_MAX_DEADLINE_MS', 25000))
+# Links de ofertas que se descargan para extraer precio de la página
+PRODUCT_MAX_LINKS = int(os.environ.get('PRODUCT_MAX_LINKS', 5))
+# Lo más que puede pedir el cliente con "max_links" (cada link es una descarga)
+PRODUCT_MAX_LINKS_CAP = int(os.environ.get('PRODUCT_MAX_LINKS_CAP', 20))
+# Tope de bytes por página en esta ruta (sólo se busca el precio)
+PRODUCT_FETCH_MAX_BYTES = int(os.environ.get('PRODUCT_FETCH_MAX_BYTES', 1024 * 1024))
+
+# Executor propio: las llamadas que exceden el deadline siguen en su hilo pero
+# no bloquean el cierre del event loop (el executor por defecto sí lo haría)
+_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.environ.get('PRODUCT_WORKERS', 16)))
+
+# ===================== Helpers =====================
+def _search(upc, query, no_cache):
+    return SEARCH_CACHE.fetch(cache_key(upc, query), lambda: _run_search(upc, query),
+                              cacheable=_search_cacheable, bypass=no_cache)
+
+def _shopping(upc, query, no_cache):
+    return SHOPPING_CACHE.fetch(cache_key(upc, query), lambda: _run_shopping(query, upc),
+                                cacheable=_shopping_cacheable, bypass=no_cache)
+
+def _fetch_page(url, upc=None):
+    return _fetch_product(url, use_gemini=False, max_bytes=PRODUCT_FETCH_MAX_BYTES, upc=upc)
+
+def _link_key(link):
+    return re.sub(r'#.*$', '', link).rstrip('/').lower()
+
+def _merge_offers(search_payload, shopping_payload):
+    """Ofertas de SerpApi y Google Shopping, sin links repetidos"""
+    merged = []
+    seen = set()
+    sources = (
+        ('serpapi_organic', (search_payload or {}).get('organic_results') or []),
+        ('google_shopping', (shopping_payload or {}).get('offers') or []),
+    )
+    for origin, offers in sources:
+        for offer in offers:
+            link = offer.get('link')
+            if not link:
+                continue
+            key = _link_key(link)
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append({**offer, 'origin': offer.get('origin') or origin})
+    return merged
+
+async def _gather_product(upc, query, max_links, deadline_s, no_cache):
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    deadline = started + deadline_s
+    timing = {}
+    timed_out = []
+
+    def remaining():
+        return max(0.0, deadline - loop.time())
+
+    async def timed(name, fn, *args):
+        t0 = loop.time()
+        try:
+            return await loop.run_in_executor(_EXECUTOR, bind(fn), *args)
+        finally:
+            timing[name] = int((loop.time() - t0) * 1000)
+
+    async def run_all(tasks):
+        """Espera hasta el deadline; regresa {nombre: resultado | Exception}"""
+        if not tasks:
+            return {}
+        done, pending = await asyncio.wait(tasks.values(), timeout=remaining())
+        for task in pending:
+            task.cancel()
+        results = {}
+        for name, task in tasks.items():
+            if task in done:
+                results[name] = task.exception() or task.result()
+            else:
+                timed_out.append(name)
+        return results
+
+    # 1. SerpApi y Google Shopping en paralelo
+    stage1 = await run_all({
+        'search': asyncio.ensure_future(timed('search', _search, upc, query, no_cache)),
+        'shopping': asyncio.ensure_future(timed('shopping', _shopping, upc, query, no_cache)),
+    })
+    cache = {}
+    errors = {}
+    payloads = {}
+    for name, result in stage1.items():
+        if isinstance(result, Exception):
+            errors[name] = str(result)
+        else:
+            payloads[name], cache[name] = result
+
+    offers = _merge_offers(payloads.get('search'), payloads.get('shopping'))
+
+    # 2. Páginas de las primeras N ofertas en paralelo, con el extractor de fetch.py
+    targets = [o for o in offers if o['link'].startswith(('http://', 'https://'))][:max_links]
+    stage2 = await run_all({
+        f'fetch:{i}': asyncio.ensure_future(timed(f'fetch:{i}', _fetch_page, offer['link'], upc))
+        for i, offer in enumerate(targets)
+    })
+    for i, offer in enumerate(targets):
+        page = stage2.get(f'fetch:{i}')
+        if page is None:
+            continue
+        if isinstance(page, Exception):
+            offer['page'] = {'error': str(page)}
+            continue
+        offer['page'] = {k: page.get(k) for k in ('price', 'currency', 'title', 'seller', 'extraction_method')}
+        if offer.get('price') is None and page.get('price') is not None:
+            offer['price'] = page['price']
+            offer['price_source'] = 'page'
+
+    timing['total'] = int((loop.time() - started) * 1000)
+    return {
+        'upc': upc,
+        'query': query,
+        'offers': offers,
+        'total_offers': len(offers),
+        'search_summary': (payloads.get('search') or {}).get('gemini_summary'),
+        'cache': cache,
+        'errors': errors,
+        'timing_ms': timing,
+        'timed_out': timed_out,
+        'partial': bool(timed_out or errors),
+        'powered_by': 'serpapi+google_shopping+fetch',
+    }
+
+# ===================== Handler =====================
+class handler(BaseHTTPRequestHandler):
+
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.end_headers()
+
+    def do_POST(self):
+        self._trace = start_trace('product', self.headers)
+        try:
+            content_len = int(self.headers.get('Content-Length', 0))
+            data = json.loads(self.rfile.read(content_len).decode('utf-8') or '{}')
+            self._trace.request_profile(data.get('profile'))
+
+            query = (data.get('query') or '').strip()
+            upc = _clean_upc(data.get('upc', ''))
+            if not query and not upc:
+                return self._send_error(400, 'Se requiere query o upc')
+
+            try:
+                max_links = max(0, min(int(data.get('max_links', PRODUCT_MAX_LINKS)), PRODUCT_MAX_LINKS_CAP))
+            except (TypeError, ValueError):
+                return self._send_error(400, "'max_links' debe ser entero")
+            deadline_ms = request_budget_ms(data.get('deadline_ms'), PRODUCT_DEADLINE_MS, PRODUCT_MAX_DEADLINE_MS)
+            # Las etapas internas (SerpApi, Google, Gemini, páginas) ven el mismo deadline
+            deadline = start_deadline(deadline_ms)
+
+            result = asyncio.run(_gather_product(
+                upc, query, max_links, deadline_ms / 1000, bool(data.get('no_cache'))
+            ))
+            result['deadline'] = deadline.info()
+            result['partial'] = result['partial'] or bool(deadline.skipped)
+            note(offers=result['total_offers'], partial=result['partial'], timed_out=result['timed_out'])
+            return self._send_success(result)
+
+        except json.JSONDecodeError:
+            return self._send_error(400, 'JSON inválido')
+        except Exception as e:
+            print(f"Error en handler product: {e}")
+            return self._send_error(500, f'Error: {str(e)}')
+
+    def _send_success(self, data):
+        self._send_json(200, data)
+
+    def _send_error(self, code, message):
+        self._send_json(code, {'error': message}, error=message)
+
+    def _send_json(self, code, data, **log_fields):
+        with self._trace.stage('serialize'):
+            body = dumps(data)
+        self.send_response(code)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Server-Timing', self._trace.header())
+        self.end_headers()
+        self.wfile.write(body)
+        self._trace.finish(code, response_bytes=len(body), **log_fields)
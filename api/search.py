@@ -2,56 +2,72 @@ from http.server import BaseHTTPRequestHandler
 import json
 import os
 import re
-import requests
-import google.generativeai as genai
-from urllib.parse import urlparse
+import time
+from api._http import http_get, pool_stats
+from api._cache import ResultCache, cache_key
+from api._trace import start_trace, stage, lap, note, count
+from api._singleflight import single_flight
+from api._governor import SERPAPI, GEMINI, UpstreamUnavailable, governor_state
+from api._deadline import start_deadline, request_budget_ms, skipped
+from api._sellers import seller_info, seller_from_url
+from api._gemini import GEMINI_API_KEY, get_model
+from api._offers import Offer
+from api._json import dumps
 
 # ===================== Configuración =====================
 SERPAPI_KEY = os.environ.get('SERPAPI_KEY', '')
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "")
 
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+# Caché de respuestas (SerpApi es de pago): TTL y ventana stale en segundos
+SEARCH_CACHE = ResultCache(
+    'search',
+    ttl=int(os.environ.get('SEARCH_CACHE_TTL', 6 * 3600)),
+    stale_ttl=int(os.environ.get('SEARCH_CACHE_STALE', 24 * 3600)),
+)
 
 # ===================== Helpers =====================
 def _clean_upc(s):
     return re.sub(r"\D+", "", s or "")
 
 def _extract_domain(url):
-    try:
-        netloc = urlparse(url).netloc.lower().replace('www.', '')
-        # Extraer nombre principal (ej: walmart.com.mx -> walmart)
-        return netloc.split('.')[0].capitalize()
-    except: return "Desconocido"
+    """Vendedor por dominio (ej: super.walmart.com.mx -> Walmart), ver api/_sellers.py"""
+    return seller_from_url(url)
 
 def _deduplicate_by_domain(items):
     """
     Filtro matemático: Asegura que solo haya 1 item por tienda.
     Si hay repetidos (ej: 3 links de Amazon), se queda con el primero (el más relevante).
+    El seller queda con el nombre canónico ("Walmart Súper" -> "Walmart").
     """
     seen_domains = set()
     unique_items = []
     
     for item in items:
-        # Normalizar el vendedor o dominio
-        seller = item.get('seller') or _extract_domain(item.get('link', ''))
-        seller_key = seller.lower().strip()
-        
-        # Corrección manual para variantes (ej: "Super" vs "Walmart")
-        if 'walmart' in seller_key: seller_key = 'walmart'
-        if 'aurrera' in seller_key: seller_key = 'bodega aurrera'
+        # Llave canónica por nombre del vendedor o, si no viene, por dominio
+        seller_key, seller = seller_info(item.seller, item.link)
         
         if seller_key not in seen_domains:
+            item.seller = seller
             unique_items.append(item)
             seen_domains.add(seller_key)
             
     return unique_items
 
+def _serpapi_get(params, timeout):
+    resp = http_get('https://serpapi.com/search.json', params=params, timeout=timeout)
+    resp.raise_for_status()
+    return resp
+
+@single_flight('serpapi')
 def _fetch_serpapi_organic(query):
     if not SERPAPI_KEY:
         print("⚠️ Falta SERPAPI_KEY")
         return []
 
+    timeout = SERPAPI.budget()
+    if timeout is None:
+        print("⏱️ Sin tiempo para SerpApi")
+        return []
+
     print(f"🌎 SerpApi Query: {query}")
     params = {
         'engine': 'google',
@@ -65,15 +81,20 @@ def _fetch_serpapi_organic(query):
     
     results = []
     try:
-        resp = requests.get('https://serpapi.com/search.json', params=params, timeout=20)
-        data = resp.json()
+        with stage('serpapi'):
+            resp = SERPAPI.call(_serpapi_get, params, timeout)
+            data = resp.json()
+        count(bytes_fetched=len(resp.content))
         
         for r in data.get('organic_results', []):
+            top = r.get('rich_snippet', {}).get('top', {})
             results.append({
                 'title': r.get('title'),
                 'link': r.get('link'),
                 'snippet': r.get('snippet', ''),
-                'rich_snippet': r.get('rich_snippet', {}).get('top', {}).get('detected_extensions', {})
+                'source': r.get('source'),
+                'rich_snippet': top.get('detected_extensions', {}),
+                'extensions': top.get('extensions', [])
             })
             
     except Exception as e:
@@ -81,39 +102,135 @@ def _fetch_serpapi_organic(query):
         
     return results
 
+# ===================== Ofertas sin modelo =====================
+# Mismo rango de precios válido que fetch / shopping
+PRICE_MIN = 1
+PRICE_MAX = 200000
+# Resultados orgánicos que se consideran (los que antes veía Gemini)
+MAX_RAW_ITEMS = 20
+
+_TEXT_PRICE_RE = re.compile(r'(?:\$|\bMXN)\s?([0-9]{1,3}(?:,[0-9]{3})+(?:\.[0-9]{1,2})?|[0-9]+(?:\.[0-9]{1,2})?)', re.I)
+# Texto con pinta de precio que no se pudo leer como uno solo
+_PRICE_HINT_RE = re.compile(r'\$\s*\d|\d\s*(?:mxn|pesos)\b|\bmxn\s*\d', re.I)
+_CURRENCIES = {'$': 'MXN', 'MX$': 'MXN', 'MXN': 'MXN', 'US$': 'USD', 'USD': 'USD'}
+
+def _to_price(value):
+    try:
+        v = float(str(value).replace(',', '')) if not isinstance(value, (int, float)) else float(value)
+    except (TypeError, ValueError):
+        return None
+    return v if PRICE_MIN <= v <= PRICE_MAX else None
+
+def _result_price(item):
+    """
+    (precio, moneda, origen, ambiguo) de un orgánico: detected_extensions
+    primero; si no, un único precio en extensions / snippet / título.
+    ambiguo: hay texto de precio pero no uno solo claro (varios precios...).
+    """
+    ext = item.get('rich_snippet') or {}
+    price = _to_price(ext.get('price') if ext.get('price') is not None else ext.get('extracted_price'))
+    if price is not None:
+        currency = _CURRENCIES.get(str(ext.get('currency') or '$').strip().upper(), 'MXN')
+        return price, currency, 'rich_snippet', False
+
+    texts = [str(t) for t in item.get('extensions') or []] + [item.get('snippet') or '', item.get('title') or '']
+    found = {p for text in texts for m in _TEXT_PRICE_RE.finditer(text)
+             for p in (_to_price(m.group(1)),) if p is not None}
+    if len(found) == 1:
+        return found.pop(), 'MXN', 'snippet', False
+    unclear = len(found) > 1 or any(_PRICE_HINT_RE.search(text) for text in texts)
+    return None, 'MXN', None, unclear
+
+def _build_offers(raw_items):
+    """
+    Ofertas sin modelo: precio de rich snippet / texto, vendedor canónico y
+    1 por tienda (el primero, el más relevante). Regresa (offers, ambiguous);
+    ambiguous son los orgánicos de ofertas cuyo precio no quedó claro, lo
+    único que vale la pena mandarle a Gemini.
+    """
+    offers = []
+    unclear_links = set()
+    for item in raw_items[:MAX_RAW_ITEMS]:
+        link = item.get('link')
+        if not link:
+            continue
+        price, currency, origin, unclear = _result_price(item)
+        offers.append(Offer(item.get('title'), price, currency, item.get('source') or _extract_domain(link), link,
+                            price_source=origin))
+        if unclear:
+            unclear_links.add(link)
+    offers = _deduplicate_by_domain(offers)
+    kept = {o.link for o in offers}
+    ambiguous = [item for item in raw_items[:MAX_RAW_ITEMS]
+                 if item.get('link') in unclear_links and item['link'] in kept]
+    return offers, ambiguous
+
+def _apply_model_prices(offers, model_offers):
+    """Precios que Gemini encontró para las ofertas ambiguas (por link)"""
+    by_link = {o.get('link'): o for o in model_offers or [] if isinstance(o, dict) and o.get('link')}
+    for offer in offers:
+        found = by_link.get(offer.link)
+        if offer.price is not None or found is None:
+            continue
+        price = _to_price(found.get('price')) if found.get('price') is not None else None
+        if price is not None:
+            offer.price = price
+            offer.currency = found.get('currency') or offer.currency
+            offer.price_source = 'gemini'
+    return offers
+
+def _offers_summary(offers):
+    priced = sum(1 for o in offers if o.price is not None)
+    return f"{len(offers)} tiendas, {priced} con precio (rich snippets, sin IA)"
+
+def _manual_fallback(raw_items):
+    """Ofertas sin modelo, deduplicadas; los precios ambiguos quedan en null"""
+    return _build_offers(raw_items)[0]
+
+def _get_model():
+    """GenerativeModel compartido del proceso (api/_gemini.py)"""
+    return get_model("gemini-1.5-flash", generation_config={"response_mime_type": "application/json"})
+
+_OFFER_RULES = """
+        1. Devuelve una lista "offers" con UNA oferta por resultado recibido, con el mismo "link".
+        2. Extrae el precio de venta actual si es visible (formato numérico). Si hay varios, usa el del producto, no precios por unidad ni tachados. Si no, null.
+        3. Estandariza "seller" (ej: amazon.com.mx -> Amazon)."""
+
+@single_flight('gemini_search')
 def _analyze_with_gemini(raw_items, upc):
-    if not raw_items: return [], "Sin resultados brutos"
-    
+    """
+    Ofertas de los orgánicos: lo que tiene precio claro sale sin modelo y
+    Gemini sólo ve los resultados ambiguos. Regresa (offers, summary, degraded);
+    degraded: Gemini falló o el breaker está abierto (no se cachea).
+    """
+    if not raw_items: return [], "Sin resultados brutos", False
+
+    offers, ambiguous = _build_offers(raw_items)
+    note(deterministic_offers=len(offers), ambiguous_items=len(ambiguous))
+    if not ambiguous:
+        return offers, _offers_summary(offers), False
+
     # 1. FALLBACK MANUAL (Si no hay IA)
     if not GEMINI_API_KEY: 
-        fallback = []
-        for r in raw_items:
-            fallback.append({
-                "title": r['title'],
-                "price": None, 
-                "currency": "MXN",
-                "seller": _extract_domain(r['link']),
-                "link": r['link']
-            })
-        # Aplicar deduplicación manual
-        return _deduplicate_by_domain(fallback), "Sin API Key (Crudos Deduplicados)"
+        return offers, "Sin API Key (Precios de rich snippets)", False
 
-    # 2. INTENTO CON IA
+    # Sin presupuesto para el modelo: sólo los precios claros
+    timeout = GEMINI.budget()
+    if timeout is None:
+        return offers, "Sin tiempo para IA (Precios de rich snippets)", False
+
+    # 2. IA SÓLO PARA LOS AMBIGUOS
     try:
-        model = genai.GenerativeModel("gemini-1.5-flash", generation_config={"response_mime_type": "application/json"})
+        model = _get_model()
         
+        t = time.perf_counter()
         prompt = f"""
-        Analiza estos resultados de búsqueda para UPC: {upc}.
+        Analiza estos resultados de búsqueda para UPC: {upc}. No traen un precio claro (varios precios o formato raro).
         
         DATOS:
-        {json.dumps(raw_items[:20], ensure_ascii=False)}
+        {json.dumps(ambiguous, ensure_ascii=False)}
 
-        INSTRUCCIONES:
-        1. Devuelve una lista "offers".
-        2. IMPORTANTE: ELIMINA DUPLICADOS. Si ves 3 resultados de Amazon, quédate SOLO CON EL MEJOR (el que parezca ser el producto principal).
-        3. Solo 1 resultado por Dominio/Tienda.
-        4. Extrae precio si es visible (formato numérico). Si no, null.
-        5. Estandariza "seller" (ej: amazon.com.mx -> Amazon).
+        INSTRUCCIONES:{_OFFER_RULES}
 
         OUTPUT JSON:
         {{
@@ -124,75 +241,199 @@ def _analyze_with_gemini(raw_items, upc):
         }}
         """
         
-        resp = model.generate_content(prompt)
+        t = lap('prompt', t)
+        resp = GEMINI.call(model.generate_content, prompt, request_options={"timeout": timeout})
+        t = lap('gemini', t)
+        count(prompt_chars=len(prompt), response_chars=len(resp.text))
         data = json.loads(resp.text)
         
-        # Doble seguridad: Pasamos el filtro matemático también a lo que devolvió Gemini
-        # por si la IA alucinó y mandó duplicados de todas formas.
-        cleaned_offers = _deduplicate_by_domain(data.get("offers", []))
+        _apply_model_prices(offers, data.get("offers"))
+        lap('json_dedupe', t)
         
-        return cleaned_offers, data.get("summary", "")
+        return offers, data.get("summary") or _offers_summary(offers), False
 
+    except UpstreamUnavailable as e:
+        # Breaker abierto / sin cupo: directo al fallback sin esperar al modelo
+        return offers, f"Gemini no disponible ({e.reason}): Precios de rich snippets", True
     except Exception as e:
         print(f"⚠️ Error Gemini: {e}")
         # FALLBACK POR ERROR
-        fallback = []
-        for r in raw_items:
-            fallback.append({
-                "title": r['title'],
-                "price": None,
-                "currency": "MXN",
-                "seller": _extract_domain(r['link']),
-                "link": r['link']
-            })
-        return _deduplicate_by_domain(fallback), "Error IA (Fallback Deduplicado)"
+        return offers, "Error IA (Precios de rich snippets)", True
+
+@single_flight('gemini_search_batch')
+def _analyze_batch_with_gemini(raw_by_upc):
+    """
+    Varios UPCs en una sola llamada al modelo, sólo con sus resultados ambiguos.
+    raw_by_upc: {upc: raw_items}. Regresa {upc: (offers, summary, degraded)}.
+    Los UPCs que falten en la respuesta (o todos, si no se puede parsear)
+    se analizan uno por uno con _analyze_with_gemini.
+    """
+    results = {}
+    pending = {}
+    for upc, raw_items in raw_by_upc.items():
+        if not raw_items:
+            results[upc] = ([], "Sin resultados brutos", False)
+            continue
+        offers, ambiguous = _build_offers(raw_items)
+        if ambiguous:
+            pending[upc] = (raw_items, offers, ambiguous)
+        else:
+            results[upc] = (offers, _offers_summary(offers), False)
+
+    if not pending:
+        return results
+    timeout = GEMINI.budget() if GEMINI_API_KEY else None
+    if timeout is None or len(pending) == 1:
+        # Uno solo, sin llave o sin tiempo: la ruta individual (con sus fallbacks)
+        for upc, (raw_items, _, _) in pending.items():
+            results[upc] = _analyze_with_gemini(raw_items, upc)
+        return results
+
+    try:
+        model = _get_model()
+        t = time.perf_counter()
+        products = [{"upc": upc, "results": ambiguous} for upc, (_, _, ambiguous) in pending.items()]
+
+        prompt = f"""
+        Analiza los resultados de búsqueda de VARIOS productos. Cada producto trae su UPC y sus resultados, que no traen un precio claro.
+        
+        DATOS:
+        {json.dumps(products, ensure_ascii=False)}
+
+        INSTRUCCIONES (para CADA producto por separado):{_OFFER_RULES}
+        4. Incluye TODOS los UPCs recibidos, con el mismo valor de "upc".
+
+        OUTPUT JSON:
+        {{
+            "products": [
+                {{
+                    "upc": "...",
+                    "offers": [
+                        {{ "title": "...", "price": 100.00, "currency": "MXN", "seller": "Amazon", "link": "..." }}
+                    ],
+                    "summary": "Resumen"
+                }}
+            ]
+        }}
+        """
+
+        t = lap('prompt', t)
+        resp = GEMINI.call(model.generate_content, prompt, request_options={"timeout": timeout})
+        t = lap('gemini', t)
+        count(prompt_chars=len(prompt), response_chars=len(resp.text))
+        data = json.loads(resp.text)
+
+        for product in data.get("products", []):
+            upc = _clean_upc(str(product.get("upc", "")))
+            if upc in pending and upc not in results:
+                model_offers = product.get("offers")
+                if not isinstance(model_offers, list):
+                    continue
+                offers = _apply_model_prices(pending[upc][1], model_offers)
+                results[upc] = (offers, product.get("summary") or _offers_summary(offers), False)
+
+    except Exception as e:
+        print(f"⚠️ Error Gemini batch: {e}")
+
+    # Lo que no vino en la respuesta del batch se analiza individualmente
+    for upc, (raw_items, _, _) in pending.items():
+        if upc not in results:
+            results[upc] = _analyze_with_gemini(raw_items, upc)
+    return results
+
+def _build_search_query(upc, query):
+    # Query Híbrida
+    forced_sites = "site:walmart.com.mx OR site:bodegaaurrera.com.mx OR site:super.walmart.com.mx"
+    
+    if query:
+        search_query = f"{upc} {query} (precio OR {forced_sites})"
+    else:
+        search_query = f"{upc} (precio OR {forced_sites})"
+    
+    return search_query.strip()
+
+def _search_payload(raw_results, verified_items, summary, degraded=False):
+    if not raw_results:
+        msg = "SerpApi no devolvió resultados"
+        print(msg)
+        return {"organic_results": [], "gemini_summary": msg}
+    payload = {
+        "organic_results": verified_items,
+        "gemini_summary": summary,
+        "powered_by": "serpapi-organic-deduplicated"
+    }
+    if degraded:
+        payload["degraded"] = True
+    return payload
+
+def _mark_partial(payload):
+    # Etapas que el deadline dejó fuera: la respuesta es parcial
+    if {"serpapi", "gemini"} & set(skipped()):
+        payload["partial"] = True
+    return payload
+
+def _is_cacheable(payload):
+    # Sólo se guardan respuestas con resultados (un vacío puede ser transitorio)
+    # y completas: una parcial por deadline o una degradada (Gemini falló o
+    # breaker abierto) se recalcula la próxima vez en lugar de quedarse horas
+    return (bool(payload.get("organic_results")) and not payload.get("partial")
+            and not payload.get("degraded"))
+
+def _run_search(upc, query, fetch=_fetch_serpapi_organic, analyze=_analyze_with_gemini):
+    """
+    SerpApi + Gemini para un UPC; regresa el payload de respuesta.
+    fetch/analyze permiten envolver las llamadas (ej. rate limit en batch).
+    """
+    # 1. Traer datos
+    raw_results = fetch(_build_search_query(upc, query))
+    
+    if not raw_results:
+        payload = _search_payload(raw_results, [], "")
+    else:
+        # 2. Procesar y Limpiar
+        verified_items, summary, degraded = analyze(raw_results, upc)
+        payload = _search_payload(raw_results, verified_items, summary, degraded)
+
+    return _mark_partial(payload)
 
 # ===================== Handler =====================
 class handler(BaseHTTPRequestHandler):
     def do_POST(self):
+        trace = start_trace('search', self.headers)
         try:
             length = int(self.headers.get("Content-Length", "0"))
             data = json.loads(self.rfile.read(length))
+            trace.request_profile(data.get("profile"))
             
             query = data.get("query", "").strip()
             upc = _clean_upc(data.get("upc", ""))
+            deadline = start_deadline(request_budget_ms(data.get("deadline_ms")))
             
-            # Query Híbrida
-            forced_sites = "site:walmart.com.mx OR site:bodegaaurrera.com.mx OR site:super.walmart.com.mx"
-            
-            if query:
-                search_query = f"{upc} {query} (precio OR {forced_sites})"
-            else:
-                search_query = f"{upc} (precio OR {forced_sites})"
-            
-            search_query = search_query.strip()
-            
-            # 1. Traer datos
-            raw_results = _fetch_serpapi_organic(search_query)
-            
-            if not raw_results:
-                msg = "SerpApi no devolvió resultados"
-                print(msg)
-                self.send_response(200)
-                self.end_headers()
-                self.wfile.write(json.dumps({"organic_results": [], "gemini_summary": msg}).encode("utf-8"))
-                return
-
-            # 2. Procesar y Limpiar
-            verified_items, summary = _analyze_with_gemini(raw_results, upc)
-            
-            payload = {
-                "organic_results": verified_items,
-                "gemini_summary": summary,
-                "powered_by": "serpapi-organic-deduplicated"
-            }
+            payload, cache_info = SEARCH_CACHE.fetch(
+                cache_key(upc, query),
+                lambda: _run_search(upc, query),
+                cacheable=_is_cacheable,
+                bypass=bool(data.get("no_cache")),
+            )
+            payload["cache"] = cache_info
+            payload["http_pool"] = pool_stats()
+            payload["upstreams"] = governor_state()
+            payload["partial"] = bool(payload.get("partial"))
+            payload["deadline"] = deadline.info()
+            note(cache=cache_info["status"], offers=len(payload.get("organic_results") or []))
 
+            with trace.stage("serialize"):
+                body = dumps(payload)
             self.send_response(200)
             self.send_header("Content-Type", "application/json")
+            self.send_header("Server-Timing", trace.header())
             self.end_headers()
-            self.wfile.write(json.dumps(payload).encode("utf-8"))
+            self.wfile.write(body)
+            trace.finish(200, response_bytes=len(body))
 
         except Exception as e:
             self.send_response(500)
+            self.send_header("Server-Timing", trace.header())
             self.end_headers()
-            self.wfile.write(json.dumps({"error": str(e)}).encode("utf-8"))
\ No newline at end of file
+            self.wfile.write(json.dumps({"error": str(e)}).encode("utf-8"))
+            trace.finish(500, error=str(e))
@@ -0,0 +1,221 @@
+from http.server import BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import json
+import os
+import time
+
+from api.search import (
+    SEARCH_CACHE, _clean_upc, _fetch_serpapi_organic,
+    _analyze_batch_with_gemini, _build_search_query, _search_payload, _run_search,
+    _mark_partial, _is_cacheable
+)
+from api._cache import cache_key
+from api._governor import upstream_wait
+from api._deadline import start_deadline, request_budget_ms
+from api._trace import start_trace, bind
+from api._json import dumps
+
+# ===================== Configuración =====================
+BATCH_MAX_UPCS = int(os.environ.get('BATCH_MAX_UPCS', 500))
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', 8))
+# UPCs por llamada a Gemini (1 = una llamada por UPC)
+GEMINI_BATCH_SIZE = int(os.environ.get('GEMINI_BATCH_SIZE', 5))
+
+# Los límites por proveedor (UPSTREAM_*_RPS) y los breakers viven en
+# api/_governor.py y se comparten con /api/search y /api/shopping
+
+# ===================== Helpers =====================
+
+def _dedupe_upcs(raw_upcs):
+    """Limpia y quita repetidos conservando el orden; regresa (upcs, inválidos, repetidos)"""
+    seen = set()
+    upcs = []
+    invalid = duplicates = 0
+    for raw in raw_upcs:
+        upc = _clean_upc(str(raw) if raw is not None else '')
+        if not upc:
+            invalid += 1
+        elif upc in seen:
+            duplicates += 1
+        else:
+            seen.add(upc)
+            upcs.append(upc)
+    return upcs, invalid, duplicates
+
+def _compute(upc, query):
+    """Ruta individual de /api/search (revalidación de caché)"""
+    return _run_search(upc, query)
+
+def _fetch_raw(upc, query):
+    return upc, _fetch_serpapi_organic(_build_search_query(upc, query))
+
+def _analyze_group(raw_by_upc):
+    """
+    Una llamada a Gemini para varios UPCs; regresa {upc: payload}. Si el
+    deadline dejó fuera al modelo los payloads van parciales (no se cachean).
+    """
+    analyzed = _analyze_batch_with_gemini(raw_by_upc)
+    return {
+        upc: _mark_partial(_search_payload(raw_by_upc[upc], *analyzed[upc]))
+        for upc in raw_by_upc
+    }
+
+def _run_pipeline(upcs, query, no_cache, workers, emit):
+    """
+    1. Caché: los hits se emiten de inmediato.
+    2. SerpApi concurrente por UPC.
+    3. Los resultados crudos se agrupan de GEMINI_BATCH_SIZE en GEMINI_BATCH_SIZE
+       y cada grupo va al modelo en una sola llamada.
+    emit(upc, payload) se llama en cuanto cada UPC queda listo.
+    """
+    misses = []
+    for upc in upcs:
+        cached = None if no_cache else SEARCH_CACHE.get(
+            cache_key(upc, query), lambda u=upc: _compute(u, query), _is_cacheable
+        )
+        if cached is not None:
+            payload, cache_info = cached
+            payload["cache"] = cache_info
+            emit(upc, payload)
+        else:
+            misses.append(upc)
+
+    miss_status = 'bypass' if no_cache else 'miss'
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        running = {pool.submit(bind(_fetch_raw), upc, query): ('fetch', [upc]) for upc in misses}
+        pending_raw = {}
+
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, group = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    for upc in group:
+                        emit(upc, None, error=str(e))
+                    continue
+
+                if stage == 'fetch':
+                    upc, raw = result
+                    if raw:
+                        pending_raw[upc] = raw
+                    else:
+                        emit(upc, {**_mark_partial(_search_payload(raw, [], "")),
+                                   "cache": {'status': miss_status, 'age': 0}})
+                else:
+                    for upc, payload in result.items():
+                        SEARCH_CACHE.put(cache_key(upc, query), payload, _is_cacheable)
+                        payload["cache"] = {'status': miss_status, 'age': 0}
+                        emit(upc, payload)
+
+            # Se manda un grupo lleno, o lo que haya si ya no quedan búsquedas en curso
+            fetching = any(stage == 'fetch' for stage, _ in running.values())
+            while pending_raw and (len(pending_raw) >= GEMINI_BATCH_SIZE or not fetching):
+                group = dict(list(pending_raw.items())[:GEMINI_BATCH_SIZE])
+                for upc in group:
+                    del pending_raw[upc]
+                running[pool.submit(bind(_analyze_group), group)] = ('analyze', list(group))
+
+# ===================== Handler =====================
+class handler(BaseHTTPRequestHandler):
+
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.end_headers()
+
+    def do_POST(self):
+        self._trace = start_trace('search_batch', self.headers)
+        try:
+            length = int(self.headers.get("Content-Length", "0"))
+            data = json.loads(self.rfile.read(length))
+        except (ValueError, json.JSONDecodeError):
+            return self._send_error(400, "JSON inválido")
+        if not isinstance(data, dict):
+            return self._send_error(400, "Se espera un objeto JSON")
+
+        raw_upcs = data.get("upcs")
+        if not isinstance(raw_upcs, list) or not raw_upcs:
+            return self._send_error(400, "Se requiere una lista 'upcs'")
+
+        upcs, invalid, duplicates = _dedupe_upcs(raw_upcs)
+        if len(upcs) > BATCH_MAX_UPCS:
+            return self._send_error(400, f"Máximo {BATCH_MAX_UPCS} UPCs por batch")
+
+        query = data.get("query") or ""
+        if not isinstance(query, str):
+            return self._send_error(400, "'query' debe ser texto")
+        query = query.strip()
+        no_cache = bool(data.get("no_cache"))
+        try:
+            workers = max(1, min(int(data.get("max_workers") or BATCH_WORKERS), BATCH_WORKERS))
+        except (TypeError, ValueError):
+            return self._send_error(400, "'max_workers' debe ser entero")
+        # Deadline sólo si el cliente lo pide: al vencer, los UPCs que falten
+        # salen con orgánicos deduplicados o vacíos en vez de esperar
+        deadline = start_deadline(request_budget_ms(data["deadline_ms"])) if data.get("deadline_ms") else None
+        self._trace.request_profile(data.get("profile"))
+
+        # NDJSON: una línea por UPC en cuanto termina, sin esperar al más lento
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        started = time.time()
+        counts = {"ok": 0, "errors": 0}
+
+        def emit(upc, payload, error=None):
+            if error is None:
+                line = {"upc": upc, "status": "ok", **payload}
+                counts["ok"] += 1
+            else:
+                line = {"upc": upc, "status": "error", "error": error}
+                counts["errors"] += 1
+            self._write_line(line)
+
+        status = 200
+        try:
+            # El batch espera su turno en el rate limit en vez de caer al fallback
+            with upstream_wait(None):
+                _run_pipeline(upcs, query, no_cache, workers, emit)
+
+            self._write_line({
+                "done": True,
+                "total": len(upcs),
+                "ok": counts["ok"],
+                "errors": counts["errors"],
+                "invalid": invalid,
+                "duplicates": duplicates,
+                "elapsed_ms": int((time.time() - started) * 1000),
+                "deadline": deadline.info() if deadline else None,
+            })
+        except (BrokenPipeError, ConnectionResetError):
+            # El cliente cerró a medio batch: lo que falte ya no tiene a quién llegar
+            status = 499
+        except Exception as e:
+            print(f"Error en handler search_batch: {e}")
+            status = 500
+            try:
+                self._write_line({"done": True, "error": "Error interno del servidor"})
+            except OSError:
+                pass
+        # Los encabezados ya salieron: sin Server-Timing, sólo la línea de log
+        self._trace.finish(status, upcs=len(upcs), ok=counts["ok"], errors=counts["errors"])
+
+    def _write_line(self, obj):
+        self.wfile.write(dumps(obj) + b"\n")
+        self.wfile.flush()
+
+    def _send_error(self, code, message):
+        self.send_response(code)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Server-Timing', self._trace.header())
+        self.end_headers()
+        self.wfile.write(dumps({'error': message}))
+        self._trace.finish(code, error=message)
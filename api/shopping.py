@@ -1,20 +1,69 @@
 from http.server import BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import json
+import math
 import os
 import re
-import requests
-from bs4 import BeautifulSoup
-import google.generativeai as genai
+import time
+from api._http import http_get, pool_stats
+from api._cache import ResultCache, cache_key
+from api._trace import start_trace, stage, lap, note, count, bind
+from api._shopping_parse import parse_cards
+from api._singleflight import single_flight
+from api._governor import GOOGLE, GEMINI, governor_state
+from api._deadline import start_deadline, request_budget_ms, skipped, remaining
+from api._sellers import canonical_seller, seller_key
+from api._gemini import GEMINI_API_KEY, get_model, prewarm
+from api._jsonstream import ItemStream
+from api._offers import Offer
+from api._structured import _to_number
+from api._json import dumps
 
-# Configurar Gemini
-GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+# Casi toda petición termina en Gemini: el SDK se importa en segundo plano
+prewarm()
 
 # Límites de validación (más flexibles)
 PRICE_MIN = 1
 PRICE_MAX = 200000
 
+# Varias páginas / mercados por petición ("pages", "markets" en el body):
+# se piden en paralelo y se juntan sin repetidos hasta SHOPPING_TARGET_RESULTS
+# resultados o SHOPPING_SCRAPE_BUDGET_MS (lo que pase primero)
+SHOPPING_MAX_PAGES = int(os.environ.get('SHOPPING_MAX_PAGES', 5))
+SHOPPING_MAX_MARKETS = int(os.environ.get('SHOPPING_MAX_MARKETS', 4))
+SHOPPING_PAGE_STEP = int(os.environ.get('SHOPPING_PAGE_STEP', 20))
+SHOPPING_TARGET_RESULTS = int(os.environ.get('SHOPPING_TARGET_RESULTS', 90))
+SHOPPING_SCRAPE_BUDGET_MS = int(os.environ.get('SHOPPING_SCRAPE_BUDGET_MS', 4000))
+SHOPPING_PAGE_WORKERS = int(os.environ.get('SHOPPING_PAGE_WORKERS', 6))
+# Resultados que ve el modelo con una sola página (más páginas: hasta el target)
+SHOPPING_PROMPT_RESULTS = 30
+
+# gl -> (hl, moneda)
+MARKETS = {
+    'mx': ('es', 'MXN'),
+    'us': ('en', 'USD'),
+    'ca': ('en', 'CAD'),
+    'co': ('es', 'COP'),
+    'ar': ('es', 'ARS'),
+    'cl': ('es', 'CLP'),
+    'pe': ('es', 'PEN'),
+    'br': ('pt-BR', 'BRL'),
+    'es': ('es', 'EUR'),
+}
+DEFAULT_MARKETS = (('es', 'mx'),)
+# Mercados que escriben los miles con punto y los decimales con coma
+# ("$ 1.299,00"); en los demás el punto es decimal ("$1,299.00")
+DECIMAL_COMMA_MARKETS = frozenset({'co', 'ar', 'cl', 'br', 'es'})
+
+_PAGE_EXECUTOR = ThreadPoolExecutor(max_workers=SHOPPING_PAGE_WORKERS)
+
+# Caché de respuestas: TTL y ventana stale en segundos
+SHOPPING_CACHE = ResultCache(
+    'shopping',
+    ttl=int(os.environ.get('SHOPPING_CACHE_TTL', 3600)),
+    stale_ttl=int(os.environ.get('SHOPPING_CACHE_STALE', 6 * 3600)),
+)
+
 def _validate_price(price) -> bool:
     """Valida que el precio esté en rango razonable"""
     if price is None:
@@ -25,16 +74,41 @@ def _validate_price(price) -> bool:
     except:
         return False
 
-def _scrape_google_shopping(query: str, hl: str = 'es', gl: str = 'mx') -> list:
-    """Scrapea resultados de Google Shopping"""
+def _google_get(url, headers, params, timeout):
+    response = http_get(url, headers=headers, params=params, timeout=timeout)
+    response.raise_for_status()
+    # Bloqueo de Google: redirige a /sorry/ (captcha) en vez de dar resultados
+    if '/sorry/' in response.url:
+        raise RuntimeError(f'Google bloqueó el scraping ({response.url[:80]})')
+    return response
+
+def _parse_price(price_text: str, gl: str = 'mx'):
+    """
+    Número del texto de precio de la tarjeta. El separador que va al último
+    es el decimal (_structured._to_number); "1.299" sin decimales sólo se lee
+    como miles en DECIMAL_COMMA_MARKETS.
+    """
+    m = re.search(r'\d[\d.,]*', price_text)
+    if not m:
+        return None
+    raw = m.group(0).rstrip('.,')
+    if gl in DECIMAL_COMMA_MARKETS and re.fullmatch(r'\d{1,3}(?:\.\d{3})+', raw):
+        return float(raw.replace('.', ''))
+    return _to_number(raw)
+
+@single_flight('google_shopping')
+def _scrape_google_shopping(query: str, hl: str = 'es', gl: str = 'mx', start: int = 0) -> list:
+    """Scrapea una página de resultados de Google Shopping (start: offset)"""
+    timeout = GOOGLE.budget()
+    if timeout is None:
+        print("⏱️ Sin tiempo para Google Shopping")
+        return []
     try:
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
             'Accept-Language': f'{hl},{hl[:2]};q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
             'DNT': '1',
-            'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1'
         }
         
@@ -44,77 +118,159 @@ def _scrape_google_shopping(query: str, hl: str = 'es', gl: str = 'mx') -> list:
             'gl': gl,
             'tbm': 'shop'
         }
+        if start:
+            params['start'] = start
         
         url = "https://www.google.com/search"
-        response = requests.get(url, headers=headers, params=params, timeout=10)
-        response.raise_for_status()
+        with stage('google_fetch'):
+            response = GOOGLE.call(_google_get, url, headers, params, timeout)
+            count(bytes_fetched=len(response.content))
         
-        soup = BeautifulSoup(response.text, 'html.parser')
+        t = time.perf_counter()
         results = []
         
-        # Google Shopping blocks
-        for item in soup.select('div.sh-dgr__grid-result'):
-            title_elem = item.select_one('h3, span.OSrXXb')
-            link_elem = item.select_one('a.shntl, a.eIuuYe')
-            price_elem = item.select_one('span.a8Pemb, span.dD8iuc')
-            seller_elem = item.select_one('div.aULzUe, span.aULzUe')
-            
-            if not title_elem or not link_elem:
+        # Google Shopping blocks (sólo las tarjetas del grid, ver api/_shopping_parse.py)
+        for card in parse_cards(response.text):
+            if card['title'] is None or not card['has_link']:
                 continue
             
-            title = title_elem.get_text(strip=True)
-            link = link_elem.get('href')
+            title = card['title']
+            link = card['href']
             if link and link.startswith('/url?'):
                 # Quitar prefijo /url?q=...
                 m = re.search(r'/url\?q=([^&]+)', link)
                 if m:
                     link = m.group(1)
             
-            price_text = price_elem.get_text(strip=True) if price_elem else ''
-            seller = seller_elem.get_text(strip=True) if seller_elem else ''
+            price_text = card['price_text'] or ''
+            seller = card['seller'] or ''
             
-            # Intentar extraer número de precio
-            price_value = None
-            if price_text:
-                m_price = re.search(r'([\d.,]+)', price_text)
-                if m_price:
-                    try:
-                        raw = m_price.group(1).replace('.', '').replace(',', '.')
-                        price_value = float(raw)
-                    except:
-                        price_value = None
+            price_value = _parse_price(price_text, gl) if price_text else None
             
-            results.append({
-                'title': title,
-                'link': link,
-                'price_text': price_text,
-                'price': price_value,
-                'currency': 'MXN',
-                'seller': seller
-            })
+            results.append(Offer(title, price_value, 'MXN', seller, link, price_text=price_text))
         
+        lap('parse', t)
+        note(scraped_results=len(results))
         return results
     except Exception as e:
         print(f"Error scraping Google Shopping: {e}")
         return []
 
-def _analyze_with_gemini(query: str, upc: str, shopping_results: list) -> dict:
-    """Envía resultados de Google Shopping a Gemini para estructurarlos"""
-    try:
-        if not GEMINI_API_KEY:
-            raise ValueError("Gemini API key no configurada")
-        
-        model = genai.GenerativeModel(
-            'gemini-1.5-flash',
-            generation_config={
-                "temperature": 0.25,
-                "top_p": 0.8,
-                "top_k": 40,
-                "max_output_tokens": 1024,
-            }
-        )
-        
-        context = f"""Eres un asistente experto en análisis de resultados de Google Shopping.
+def _parse_markets(value):
+    """
+    "markets" del body: ["mx", "us"] o [{"gl": "us", "hl": "en"}].
+    Regresa tupla de (hl, gl); ValueError si el mercado no está en MARKETS.
+    """
+    if not value:
+        return DEFAULT_MARKETS
+    if isinstance(value, (str, dict)):
+        value = [value]
+    if not isinstance(value, list):
+        raise ValueError('markets debe ser una lista')
+    markets = []
+    for item in value:
+        gl = (item.get('gl') if isinstance(item, dict) else item) or ''
+        gl = str(gl).strip().lower()
+        if gl not in MARKETS:
+            raise ValueError(f'Mercado no soportado: {gl or "(vacío)"}')
+        hl = (item.get('hl') if isinstance(item, dict) else None) or MARKETS[gl][0]
+        if (hl, gl) not in markets:
+            markets.append((hl, gl))
+    if len(markets) > SHOPPING_MAX_MARKETS:
+        raise ValueError(f'Máximo {SHOPPING_MAX_MARKETS} mercados por petición')
+    return tuple(markets)
+
+def _merge_pages(pages: list, multi_market: bool, target: int) -> list:
+    """
+    Junta las páginas en el orden del plan sin repetidos: mismo link, o mismo
+    vendedor + título en el mismo mercado. Con varios mercados cada resultado
+    lleva su mercado y moneda.
+    """
+    seen_links = set()
+    seen_offers = set()
+    merged = []
+    for (hl, gl, start), results in pages:
+        for r in results:
+            offer_key = (seller_key(r.get('seller'), r.get('link')), ' '.join(r['title'].lower().split()), gl)
+            if r['link'] in seen_links or offer_key in seen_offers:
+                continue
+            seen_links.add(r['link'])
+            seen_offers.add(offer_key)
+            if multi_market:
+                if isinstance(r, dict):
+                    # Filas que llegan de otro proceso (single-flight por archivo)
+                    r = Offer.from_dict(r)
+                r.market = gl
+                r.currency = MARKETS[gl][1]
+            merged.append(r)
+            if len(merged) >= target:
+                return merged
+    return merged
+
+def _scrape_shopping_pages(query: str, markets=DEFAULT_MARKETS, pages: int = 1,
+                           target: int = SHOPPING_TARGET_RESULTS) -> list:
+    """
+    Varias páginas (start = 0, SHOPPING_PAGE_STEP, ...) de uno o más mercados.
+    Se piden en paralelo por el pool HTTP compartido (primero la página 1 de
+    cada mercado) y se deja de esperar al juntar target resultados únicos o al
+    acabarse SHOPPING_SCRAPE_BUDGET_MS / el deadline; lo que no alcanzó a
+    empezar se cancela. Con una sola página y un mercado es la llamada de
+    siempre.
+    """
+    plan = [(hl, gl, page * SHOPPING_PAGE_STEP) for page in range(pages) for hl, gl in markets]
+    if len(plan) == 1:
+        hl, gl, _ = plan[0]
+        return _scrape_google_shopping(query, hl, gl)
+
+    t = time.perf_counter()
+    budget = SHOPPING_SCRAPE_BUDGET_MS / 1000
+    left = remaining()
+    if left is not None:
+        budget = min(budget, left)
+    ends_at = time.monotonic() + budget
+
+    running = {_PAGE_EXECUTOR.submit(bind(_scrape_google_shopping), query, hl, gl, start): i
+               for i, (hl, gl, start) in enumerate(plan)}
+    done_pages = {}
+    links = set()
+    while running:
+        done, _ = wait(running, timeout=max(0.0, ends_at - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            i = running.pop(future)
+            try:
+                done_pages[i] = future.result()
+            except Exception as e:
+                print(f"⚠️ Página de Google Shopping falló {plan[i]}: {e}")
+                done_pages[i] = []
+            links.update(r['link'] for r in done_pages[i])
+        if len(links) >= target:
+            break
+    for future in running:
+        future.cancel()
+
+    merged = _merge_pages([(plan[i], done_pages[i]) for i in sorted(done_pages)], len(markets) > 1, target)
+    lap('pages', t)
+    note(pages_planned=len(plan), pages_fetched=len(done_pages), pages_dropped=len(running),
+         merged_results=len(merged))
+    return merged
+
+_MODEL_NAME = 'gemini-1.5-flash'
+_GENERATION_CONFIG = {
+    "temperature": 0.25,
+    "top_p": 0.8,
+    "top_k": 40,
+    "max_output_tokens": 1024,
+}
+
+def _generation_config(limit: int) -> dict:
+    """1024 tokens de salida por cada SHOPPING_PROMPT_RESULTS resultados"""
+    blocks = max(1, math.ceil(limit / SHOPPING_PROMPT_RESULTS))
+    return dict(_GENERATION_CONFIG, max_output_tokens=_GENERATION_CONFIG['max_output_tokens'] * blocks)
+
+# Instrucciones fijas del prompt (se arman una vez al cargar el módulo)
+_PROMPT_HEADER = f"""Eres un asistente experto en análisis de resultados de Google Shopping.
 
 Recibirás:
 1. Un término de búsqueda (query)
@@ -184,27 +340,119 @@ Ejemplo de respuesta válida:
 
 Productos encontrados:
 """
-        for idx, result in enumerate(shopping_results[:30], 1):
-            context += f"\n{idx}. Producto: {result['title']}\n"
-            if result.get('price_text'):
-                context += f"   Precio mencionado: {result['price_text']}\n"
-            if result.get('price') is not None:
-                context += f"   Precio numérico detectado: {result['price']}\n"
-            if result.get('seller'):
-                context += f"   Vendedor: {result['seller']}\n"
-            context += f"   Link: {result['link']}\n"
-        
-        prompt = f"""{context}
+
+def _build_prompt(query: str, upc: str, shopping_results: list, limit: int = SHOPPING_PROMPT_RESULTS) -> str:
+    """Prompt de análisis; las líneas de cada resultado se juntan con join"""
+    parts = [_PROMPT_HEADER]
+    add = parts.append
+    for idx, result in enumerate(shopping_results[:limit], 1):
+        add(f"\n{idx}. Producto: {result['title']}\n")
+        if result.get('price_text'):
+            add(f"   Precio mencionado: {result['price_text']}\n")
+        if result.get('price') is not None:
+            add(f"   Precio numérico detectado: {result['price']}\n")
+        if result.get('seller'):
+            add(f"   Vendedor: {result['seller']}\n")
+        if result.get('market'):
+            add(f"   Mercado: {result['market']} ({result['currency']})\n")
+        add(f"   Link: {result['link']}\n")
+    add(f"""
 
 Ahora, analiza estos resultados de Google Shopping para la búsqueda:
 - Query: "{query}"
 - UPC (si se proporcionó): "{upc or 'N/A'}"
 
 Devuelve ÚNICAMENTE el JSON especificado, sin explicación adicional, sin comentarios y sin markdown.
-"""
+""")
+    return ''.join(parts)
+
+def _markets_by_link(shopping_results: list) -> dict:
+    """link -> mercado (sólo con varios mercados)"""
+    return {r['link']: r['market'] for r in shopping_results if r.get('market')}
+
+def _validate_offer(offer, market_of=None):
+    """La oferta lista para responder, o None si le faltan campos mínimos"""
+    # Solo validar campos mínimos obligatorios
+    if not isinstance(offer, dict) or not offer.get('title') or not offer.get('link'):
+        return None
+    currency = offer.get('currency')
+    offer = Offer.from_dict(offer)
+
+    if offer.price is not None and not _validate_price(offer.price):
+        # Conservamos la oferta pero anulamos el precio dudoso
+        offer.price = None
+
+    # Mismo nombre de tienda que /api/search ("Walmart Súper" -> "Walmart")
+    offer.seller = canonical_seller(offer.seller, offer.link)
+    market = (market_of or {}).get(offer.link)
+    if market:
+        offer.market = market
+        offer.currency = currency or MARKETS[market][1]
+    return offer
+
+def _finish_analysis(parsed: dict, validated_offers: list) -> dict:
+    parsed['offers'] = validated_offers
+    parsed['total_offers'] = len(validated_offers)
+    
+    # Recalcular price_range
+    if validated_offers:
+        valid_prices = [o['price'] for o in validated_offers if o.get('price') is not None]
+        if valid_prices:
+            parsed['price_range'] = {
+                'min': min(valid_prices),
+                'max': max(valid_prices)
+            }
+    return parsed
+
+def _fallback_analysis(query: str, shopping_results: list, limit: int = SHOPPING_PROMPT_RESULTS) -> dict:
+    """
+    Lo scrapeado en formato estándar (sin modelo). Con llave de Gemini es un
+    resultado degradado (el modelo falló o el breaker está abierto) y no se
+    cachea; sin llave es la respuesta normal.
+    """
+    fallback_offers = []
+    for r in shopping_results[:max(40, limit)]:
+        offer = Offer(r['title'], r.get('price'), r.get('currency', 'MXN'),
+                      canonical_seller(r.get('seller'), r.get('link')), r.get('link'),
+                      origin='shopping_fallback', price_text=r.get('price_text', ''))
+        if r.get('market'):
+            offer['market'] = r['market']
+        fallback_offers.append(offer)
+    
+    analysis = {
+        'offers': fallback_offers,
+        'total_offers': len(fallback_offers),
+        'query_type': 'shopping',
+        'summary': f'Se encontraron {len(shopping_results)} productos para "{query}"'
+    }
+    if GEMINI_API_KEY:
+        analysis['degraded'] = True
+    return analysis
+
+def _model_timeout():
+    if not GEMINI_API_KEY:
+        raise ValueError("Gemini API key no configurada")
+    timeout = GEMINI.budget()
+    if timeout is None:
+        raise ValueError("Sin tiempo para Gemini (deadline)")
+    return timeout
+
+@single_flight('gemini_shopping')
+def _analyze_with_gemini(query: str, upc: str, shopping_results: list,
+                         limit: int = SHOPPING_PROMPT_RESULTS) -> dict:
+    """Envía resultados de Google Shopping a Gemini para estructurarlos"""
+    try:
+        timeout = _model_timeout()
         
-        response = model.generate_content(prompt)
+        t = time.perf_counter()
+        model = get_model(_MODEL_NAME, generation_config=_generation_config(limit))
+        prompt = _build_prompt(query, upc, shopping_results, limit)
+        
+        t = lap('prompt', t)
+        response = GEMINI.call(model.generate_content, prompt, request_options={'timeout': timeout})
         result_text = response.text.strip()
+        t = lap('gemini', t)
+        note(prompt_chars=len(prompt), response_chars=len(result_text))
         
         # Limpiar si viene con ```json
         if result_text.startswith("```"):
@@ -215,54 +463,106 @@ Devuelve ÚNICAMENTE el JSON especificado, sin explicación adicional, sin comen
         parsed = json.loads(result_text)
         
         # Validación MÍNIMA pero permisiva con el precio
-        validated_offers = []
-        for offer in parsed.get('offers', []):
-            # Solo validar campos mínimos obligatorios
-            if not offer.get('title') or not offer.get('link'):
-                continue
-
-            price = offer.get('price')
-            if price is not None and not _validate_price(price):
-                # Conservamos la oferta pero anulamos el precio dudoso
-                offer['price'] = None
-
-            validated_offers.append(offer)
-
-        parsed['offers'] = validated_offers
-        parsed['total_offers'] = len(validated_offers)
-        
-        # Recalcular price_range
-        if validated_offers:
-            valid_prices = [o['price'] for o in validated_offers if o.get('price') is not None]
-            if valid_prices:
-                parsed['price_range'] = {
-                    'min': min(valid_prices),
-                    'max': max(valid_prices)
-                }
+        market_of = _markets_by_link(shopping_results)
+        validated_offers = [o for o in (_validate_offer(offer, market_of) for offer in parsed.get('offers', []))
+                            if o is not None]
+        _finish_analysis(parsed, validated_offers)
         
+        lap('json_repair', t)
         return parsed
     
     except Exception as e:
         print(f"Error con Gemini Shopping: {e}")
         # Fallback - devolver lo scrapeado en formato estándar
-        fallback_offers = []
-        for r in shopping_results[:40]:
-            fallback_offers.append({
-                'title': r['title'],
-                'price': r.get('price'),
-                'currency': r.get('currency', 'MXN'),
-                'seller': r.get('seller', ''),
-                'link': r.get('link'),
-                'origin': 'shopping_fallback',
-                'price_text': r.get('price_text', '')
-            })
+        return _fallback_analysis(query, shopping_results, limit)
+
+def _stream_with_gemini(query: str, upc: str, shopping_results: list, emit,
+                        limit: int = SHOPPING_PROMPT_RESULTS) -> dict:
+    """
+    Como _analyze_with_gemini, pero con la respuesta del modelo en stream:
+    cada oferta validada se pasa a emit(oferta) en cuanto su objeto JSON
+    se cierra. Regresa el análisis completo (mismo formato).
+    Sin single-flight: cada cliente consume su propio stream.
+    """
+    sent = []
+    stream = ItemStream('offers')
+    try:
+        timeout = _model_timeout()
+        t = time.perf_counter()
+        model = get_model(_MODEL_NAME, generation_config=_generation_config(limit))
+        prompt = _build_prompt(query, upc, shopping_results, limit)
+        t = lap('prompt', t)
         
-        return {
-            'offers': fallback_offers,
-            'total_offers': len(fallback_offers),
-            'query_type': 'shopping',
-            'summary': f'Se encontraron {len(shopping_results)} productos para "{query}"'
-        }
+        pieces = GEMINI.stream(model.generate_content, prompt, stream=True, request_options={'timeout': timeout},
+                               read=lambda chunk: chunk.text)
+        market_of = _markets_by_link(shopping_results)
+        first = None
+        for text in pieces:
+            for offer in stream.feed(text):
+                offer = _validate_offer(offer, market_of)
+                if offer is None:
+                    continue
+                if first is None:
+                    first = time.perf_counter()
+                    note(first_offer_ms=round((first - t) * 1000, 1))
+                sent.append(offer)
+                emit(offer)
+        t = lap('gemini', t)
+        note(prompt_chars=len(prompt), response_chars=len(stream.text), streamed_offers=len(sent))
+        
+        parsed = stream.parsed()
+        if parsed is None:
+            # Respuesta cortada: se queda con las ofertas que alcanzaron a cerrarse
+            if not stream.items:
+                raise ValueError(f"Respuesta sin ofertas legibles ({len(stream.text)} caracteres)")
+            parsed = {'query_type': 'shopping', 'partial': True}
+        return _finish_analysis(parsed, sent)
+    
+    except Exception as e:
+        print(f"Error con Gemini Shopping (stream): {e}")
+        if sent:
+            # El stream se cortó a medias: lo que ya salió se queda
+            return _finish_analysis({'query_type': 'shopping', 'partial': True}, sent)
+        analysis = _fallback_analysis(query, shopping_results, limit)
+        for offer in analysis['offers']:
+            emit(offer)
+        return analysis
+
+def _build_final_query(query: str, upc: str) -> str:
+    final_query = query
+    if upc and upc not in query:
+        final_query = f"{query} {upc}" if query else upc
+    return final_query
+
+def _is_cacheable(analysis: dict) -> bool:
+    # Las parciales por deadline y las degradadas (fallback sin modelo) no se
+    # guardan: la próxima petición vuelve a intentar con Gemini
+    return bool(analysis.get('offers')) and not analysis.get('partial') and not analysis.get('degraded')
+
+def _shopping_key(upc: str, query: str, pages: int = 1, markets=DEFAULT_MARKETS) -> str:
+    """Llave de caché; con más páginas / mercados se agregan a la de siempre"""
+    key = cache_key(upc, query)
+    if pages != 1 or markets != DEFAULT_MARKETS:
+        key += f"|p{pages}|" + ','.join(f'{hl}-{gl}' for hl, gl in markets)
+    return key
+
+def _run_shopping(query: str, upc: str, emit=None, pages: int = 1, markets=DEFAULT_MARKETS) -> dict:
+    """
+    Scraping de Google Shopping + análisis; regresa el payload de respuesta.
+    Con emit, el modelo va en stream y cada oferta sale por emit(oferta).
+    """
+    final_query = _build_final_query(query, upc)
+    shopping_results = _scrape_shopping_pages(final_query, markets, pages)
+    limit = SHOPPING_PROMPT_RESULTS
+    if pages > 1 or len(markets) > 1:
+        limit = max(limit, len(shopping_results))
+    if emit is not None:
+        analysis = _stream_with_gemini(final_query, upc, shopping_results, emit, limit)
+    else:
+        analysis = _analyze_with_gemini(final_query, upc, shopping_results, limit)
+    if {'google_shopping', 'gemini'} & set(skipped()):
+        analysis['partial'] = True
+    return analysis
 
 class handler(BaseHTTPRequestHandler):
     
@@ -274,6 +574,7 @@ class handler(BaseHTTPRequestHandler):
         self.end_headers()
     
     def do_POST(self):
+        self._trace = start_trace('shopping', self.headers)
         try:
             content_len = int(self.headers.get('Content-Length', 0))
             if content_len <= 0:
@@ -282,6 +583,7 @@ class handler(BaseHTTPRequestHandler):
             
             body = self.rfile.read(content_len)
             data = json.loads(body.decode('utf-8'))
+            self._trace.request_profile(data.get('profile'))
             
             query = data.get('query', '')
             upc = re.sub(r'\D+', '', data.get('upc', '') or '')
@@ -289,13 +591,33 @@ class handler(BaseHTTPRequestHandler):
             if not query and not upc:
                 self._send_error(400, 'Se requiere query o upc')
                 return
+            try:
+                pages = min(max(int(data.get('pages') or 1), 1), SHOPPING_MAX_PAGES)
+            except (TypeError, ValueError):
+                self._send_error(400, 'pages debe ser un entero')
+                return
+            try:
+                markets = _parse_markets(data.get('markets'))
+            except ValueError as e:
+                self._send_error(400, str(e))
+                return
+            deadline = start_deadline(request_budget_ms(data.get('deadline_ms')))
+            if data.get('stream') or 'application/x-ndjson' in (self.headers.get('Accept') or ''):
+                self._stream_shopping(query, upc, bool(data.get('no_cache')), deadline, pages, markets)
+                return
             
-            final_query = query
-            if upc and upc not in query:
-                final_query = f"{query} {upc}" if query else upc
-            
-            shopping_results = _scrape_google_shopping(final_query)
-            analysis = _analyze_with_gemini(final_query, upc, shopping_results)
+            analysis, cache_info = SHOPPING_CACHE.fetch(
+                _shopping_key(upc, query, pages, markets),
+                lambda: _run_shopping(query, upc, pages=pages, markets=markets),
+                cacheable=_is_cacheable,
+                bypass=bool(data.get('no_cache')),
+            )
+            analysis['cache'] = cache_info
+            analysis['http_pool'] = pool_stats()
+            analysis['upstreams'] = governor_state()
+            analysis['partial'] = bool(analysis.get('partial'))
+            analysis['deadline'] = deadline.info()
+            note(cache=cache_info['status'], offers=len(analysis.get('offers') or []))
             
             self._send_success(analysis)
         
@@ -305,16 +627,78 @@ class handler(BaseHTTPRequestHandler):
             print(f"Error en handler shopping: {e}")
             self._send_error(500, 'Error interno del servidor')
     
-    def _send_success(self, data):
+    def _stream_shopping(self, query, upc, no_cache, deadline, pages=1, markets=DEFAULT_MARKETS):
+        """
+        Respuesta NDJSON: una línea {"type": "offer", "offer": {...}} por
+        oferta en cuanto el modelo la termina, y al final {"type": "done", ...}
+        con el resto del análisis (total_offers, price_range, cache...) sin
+        repetir las ofertas. Desde caché, las ofertas salen de inmediato.
+        """
         self.send_response(200)
-        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-type', 'application/x-ndjson')
         self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Cache-Control', 'no-cache')
+        # Sin Content-Length: el cuerpo termina al cerrar la conexión
+        self.send_header('X-Accel-Buffering', 'no')
         self.end_headers()
-        self.wfile.write(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+        self._sent_bytes = 0
+        emit = lambda offer: self._write_line({'type': 'offer', 'offer': offer})
+        status = 200
+        try:
+            key = _shopping_key(upc, query, pages, markets)
+            compute = lambda: _run_shopping(query, upc, pages=pages, markets=markets)
+            cached = None if no_cache else SHOPPING_CACHE.get(key, compute, _is_cacheable)
+            if cached is not None:
+                analysis, cache_info = cached
+                for offer in analysis.get('offers') or []:
+                    emit(offer)
+            else:
+                analysis = _run_shopping(query, upc, emit, pages, markets)
+                SHOPPING_CACHE.put(key, analysis, _is_cacheable)
+                cache_info = {'status': 'bypass' if no_cache else 'miss', 'age': 0}
+            note(cache=cache_info['status'], offers=len(analysis.get('offers') or []))
+            done = {k: v for k, v in analysis.items() if k != 'offers'}
+            done.update(
+                type='done',
+                cache=cache_info,
+                http_pool=pool_stats(),
+                upstreams=governor_state(),
+                partial=bool(analysis.get('partial')),
+                deadline=deadline.info(),
+                server_timing=self._trace.header(),
+            )
+            self._write_line(done)
+        except (BrokenPipeError, ConnectionResetError):
+            # El cliente cerró a medio stream
+            status = 499
+        except Exception as e:
+            print(f"Error en handler shopping (stream): {e}")
+            status = 500
+            try:
+                self._write_line({'type': 'error', 'error': 'Error interno del servidor'})
+            except OSError:
+                pass
+        self._trace.finish(status, response_bytes=self._sent_bytes, streamed=True)
+
+    def _write_line(self, data):
+        line = dumps(data) + b'\n'
+        self.wfile.write(line)
+        self.wfile.flush()
+        self._sent_bytes += len(line)
+
+    def _send_success(self, data):
+        self._send_json(200, data)
 
     def _send_error(self, code, message):
+        self._send_json(code, {'error': message}, error=message)
+
+    def _send_json(self, code, data, **log_fields):
+        with self._trace.stage('serialize'):
+            body = dumps(data)
         self.send_response(code)
         self.send_header('Content-type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Server-Timing', self._trace.header())
         self.end_headers()
-        self.wfile.write(json.dumps({'error': message}, ensure_ascii=False).encode('utf-8'))
+        self.wfile.write(body)
+        self._trace.finish(code, response_bytes=len(body), **log_fields)
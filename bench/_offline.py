@@ -0,0 +1,280 @@
+"""
+Entorno offline para los benchmarks: nada sale a internet.
+
+- StandIn: servidor HTTP local que responde con el corpus grabado
+    /retail/<página>.html        páginas de tiendas (bench/corpus/retail)
+    /search.json?q=<upc ...>     respuestas grabadas de SerpApi (bench/corpus/serpapi)
+    /search?q=...&tbm=shop       páginas de Google Shopping (bench/corpus/shopping);
+                                 con start / gl distintos de 0 / mx, la misma página
+                                 con links y títulos marcados (resultados nuevos)
+- StubModel: sustituto de genai.GenerativeModel con respuestas deterministas
+  armadas a partir del prompt (mismo formato que pide cada handler).
+- install(): define las llaves falsas, redirige serpapi.com / google.com al
+  StandIn y cambia genai.GenerativeModel por StubModel. Debe llamarse antes
+  de importar los módulos de api/.
+"""
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_DIR = os.path.join(ROOT, 'bench', 'corpus')
+
+
+def load_json(*parts):
+    with open(os.path.join(CORPUS_DIR, *parts), encoding='utf-8') as fh:
+        return json.load(fh)
+
+
+def corpus_files(kind: str, ext: str) -> list:
+    folder = os.path.join(CORPUS_DIR, kind)
+    return sorted(n for n in os.listdir(folder) if n.endswith(ext))
+
+
+# ===================== Servidor local =====================
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Sin Nagle: encabezados y cuerpo van en escrituras separadas y el ACK
+    # retrasado del cliente agregaría ~40 ms por respuesta
+    disable_nagle_algorithm = True
+    shopping_map = {}
+    # Latencia simulada de cada página de Google Shopping
+    google_ms = 0
+
+    def do_GET(self):
+        parsed = urllib.parse.urlparse(self.path)
+        params = urllib.parse.parse_qs(parsed.query)
+        if parsed.path.startswith('/retail/'):
+            return self._send_file(os.path.join('retail', os.path.basename(parsed.path)), 'text/html; charset=utf-8')
+        if parsed.path == '/search.json':
+            upc = (params.get('q', [''])[0].split() or [''])[0]
+            name = os.path.join('serpapi', f'{upc}.json')
+            if not os.path.exists(os.path.join(CORPUS_DIR, name)):
+                return self._send(200, b'{"organic_results": []}', 'application/json')
+            return self._send_file(name, 'application/json')
+        if parsed.path == '/search':
+            query = params.get('q', [''])[0]
+            page = self.shopping_map.get(query) or next(iter(self.shopping_map.values()), None)
+            if page:
+                if self.google_ms:
+                    time.sleep(self.google_ms / 1000)
+                start, gl = params.get('start', ['0'])[0], params.get('gl', ['mx'])[0]
+                if start == '0' and gl == 'mx':
+                    return self._send_file(os.path.join('shopping', page), 'text/html; charset=utf-8')
+                with open(os.path.join(CORPUS_DIR, 'shopping', page), 'rb') as fh:
+                    body = fh.read()
+                tag = f'{gl}{start}'.encode()
+                body = re.sub(rb'(/url\?q=[^&"]+)', rb'\1-' + tag, body)
+                body = re.sub(rb'(<h3[^>]*>)', rb'\1[' + tag + rb'] ', body)
+                return self._send(200, body, 'text/html; charset=utf-8')
+        return self._send(404, b'not found', 'text/plain')
+
+    def _send_file(self, name, content_type):
+        with open(os.path.join(CORPUS_DIR, name), 'rb') as fh:
+            body = fh.read()
+        if not name.startswith('retail'):
+            return self._send(200, body, content_type)
+        # Páginas de tienda con ETag, como las reales (?noetag=1 para no mandarlo)
+        if 'noetag=1' in self.path:
+            return self._send(200, body, content_type)
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()[:16]
+        if self.headers.get('If-None-Match') == etag:
+            return self._send(304, b'', content_type, {'ETag': etag})
+        return self._send(200, body, content_type, {'ETag': etag})
+
+    def _send(self, code, body, content_type, headers=None):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if code != 304:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _QuietServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # El cliente cerró a media respuesta (corte temprano de fetch): normal
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+class StandIn:
+    """Servidor local en un puerto libre; base_url apunta a él"""
+
+    def __init__(self):
+        expected = load_json('shopping', 'expected.json')
+        _StandInHandler.shopping_map = {v['query']: f'{k}.html' for k, v in expected.items()}
+        self.server = _QuietServer(('127.0.0.1', 0), _StandInHandler)
+        self.server.daemon_threads = True
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def rewrite(self, url: str) -> str:
+        """serpapi.com / google.com -> servidor local (misma ruta)"""
+        parsed = urllib.parse.urlparse(url)
+        if parsed.netloc in ('serpapi.com', 'www.google.com'):
+            return self.base_url + parsed.path
+        return url
+
+    def close(self):
+        self.server.shutdown()
+
+
+# ===================== Gemini falso =====================
+class _StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class _StubStream:
+    """
+    Respuesta con stream=True: el texto en pedazos de ~chunk_chars, con la
+    latencia del modelo repartida entre ellos (como tokens que van saliendo).
+    """
+    chunk_chars = 48
+
+    def __init__(self, text, latency_ms, timeout):
+        self.text = text
+        self._latency_ms = latency_ms
+        self._timeout = timeout
+
+    def __iter__(self):
+        pieces = [self.text[i:i + self.chunk_chars] for i in range(0, len(self.text), self.chunk_chars)]
+        step = self._latency_ms / 1000 / max(len(pieces), 1)
+        t0 = time.perf_counter()
+        for piece in pieces:
+            if step:
+                time.sleep(step)
+                if self._timeout is not None and time.perf_counter() - t0 > self._timeout:
+                    raise TimeoutError(f'stub: stream pasó el timeout {self._timeout:.2f} s')
+            yield _StubResponse(piece)
+
+
+def _seller_from_title(title: str) -> str:
+    """'Producto - Walmart' / 'Producto | Soriana en línea' -> tienda"""
+    tail = re.split(r'\s[-|]\s', title or '')[-1]
+    return re.sub(r'\s+en línea$', '', tail).strip()
+
+
+def _stub_offers(items: list) -> list:
+    offers = []
+    seen = set()
+    for item in items:
+        seller = _seller_from_title(item.get('title'))
+        key = seller.lower()
+        if key in seen:
+            continue
+        seen.add(key)
+        price = (item.get('rich_snippet') or {}).get('price')
+        offers.append({'title': item.get('title'), 'price': price, 'currency': 'MXN',
+                       'seller': seller, 'link': item.get('link')})
+    return offers
+
+
+def _json_after(prompt: str, marker: str):
+    start = prompt.index('[', prompt.index(marker))
+    return json.JSONDecoder().raw_decode(prompt, start)[0]
+
+
+class StubModel:
+    """
+    Mismo uso que genai.GenerativeModel: generate_content(prompt).text, o
+    con stream=True un iterable de pedazos con .text.
+    latency_ms simula el tiempo de respuesta del modelo.
+    """
+    latency_ms = 0
+    calls = 0
+    _lock = threading.Lock()
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        with StubModel._lock:
+            StubModel.calls += 1
+        if stream:
+            timeout = (kwargs.get('request_options') or {}).get('timeout')
+            return _StubStream(json.dumps(self._answer(prompt), ensure_ascii=False, indent=2),
+                               self.latency_ms, timeout)
+        if self.latency_ms:
+            # Como el cliente real: request_options timeout corta la llamada
+            timeout = (kwargs.get('request_options') or {}).get('timeout')
+            if timeout is not None and self.latency_ms / 1000 > timeout:
+                time.sleep(timeout)
+                raise TimeoutError(f'stub: {self.latency_ms} ms > timeout {timeout:.2f} s')
+            time.sleep(self.latency_ms / 1000)
+        return _StubResponse(json.dumps(self._answer(prompt), ensure_ascii=False))
+
+    def _answer(self, prompt: str) -> dict:
+        if 'VARIOS productos' in prompt:
+            products = _json_after(prompt, 'DATOS:')
+            return {'products': [{'upc': p['upc'], 'offers': _stub_offers(p['results']), 'summary': 'stub'}
+                                 for p in products]}
+        if 'resultados de búsqueda para UPC' in prompt:
+            return {'offers': _stub_offers(_json_after(prompt, 'DATOS:')), 'summary': 'stub'}
+        if 'Google Shopping' in prompt:
+            offers = []
+            for block in re.findall(r'\n\d+\. Producto: .*?Link: \S+', prompt, re.S):
+                price = re.search(r'Precio numérico detectado: ([\d.]+)', block)
+                seller = re.search(r'Vendedor: (.+)', block)
+                offers.append({
+                    'title': re.search(r'Producto: (.+)', block).group(1),
+                    'price': float(price.group(1)) if price else None,
+                    'currency': 'MXN',
+                    'seller': seller.group(1).strip() if seller else '',
+                    'link': re.search(r'Link: (\S+)', block).group(1),
+                    'origin': 'google_shopping',
+                })
+            return {'offers': offers, 'total_offers': len(offers), 'query_type': 'shopping'}
+        # Página de producto (fetch): sólo campos descriptivos, el precio lo pone regex
+        return {'title': None, 'price': None, 'currency': 'MXN', 'seller': None, 'brand': 'Stub',
+                'category': None, 'availability': 'in_stock', 'rating': None, 'review_count': None,
+                'description': None, 'confidence': 'medium'}
+
+
+# ===================== Instalación =====================
+def install(gemini_ms: int = 0, google_ms: int = 0) -> StandIn:
+    """Levanta el StandIn y parcha api/ para usarlo; regresa el StandIn"""
+    os.environ.setdefault('SERPAPI_KEY', 'offline')
+    os.environ.setdefault('GEMINI_API_KEY', 'offline')
+    # Líneas de traza (api/_trace.py) sólo si se piden con TRACE_LOG=1
+    os.environ.setdefault('TRACE_LOG', '0')
+    # Todas las páginas salen de 127.0.0.1: sin perfiles por dominio
+    os.environ.setdefault('FETCH_PROFILES', '0')
+    # Cada petición del benchmark descarga y extrae (sin historial de precios)
+    os.environ.setdefault('PRICE_HISTORY', '0')
+    # Sin rate limit del gobernador: el throughput medido es el del código
+    for provider in ('SERPAPI', 'GOOGLE', 'GEMINI'):
+        os.environ.setdefault(f'UPSTREAM_{provider}_RPS', '0')
+    import sys
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+
+    import google.generativeai as genai
+    StubModel.latency_ms = gemini_ms
+    genai.GenerativeModel = StubModel
+
+    _StandInHandler.google_ms = google_ms
+    stand_in = StandIn()
+    import api._http
+    import api.search
+    import api.shopping
+    real_get = api._http.http_get
+
+    def local_get(url, *args, **kwargs):
+        return real_get(stand_in.rewrite(url), *args, **kwargs)
+
+    api.search.http_get = local_get
+    api.shopping.http_get = local_get
+    return stand_in
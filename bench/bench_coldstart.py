@@ -0,0 +1,129 @@
+"""
+Presupuesto de arranque en frío de los endpoints (import del módulo en un
+proceso nuevo, como la primera petición de una instancia de Vercel).
+
+Por cada endpoint corre --runs procesos con python -X importtime y reporta:
+la mediana del import total, los módulos más caros (api/* y dependencias) y
+si quedó cargada alguna dependencia pesada que sólo deben importar las
+rutas que la usan (google.generativeai, requests, bs4, lxml). Mide también
+una petición de fetch sólo con regex (import + extracción de una página del
+corpus) y lo que cuesta cada dependencia diferida por sí sola.
+
+Sale con 1 si un endpoint pasa su presupuesto o carga una dependencia
+pesada al importarse. Los presupuestos (COLD_BUDGET_MS) son de una máquina
+de desarrollo; en CI/lambdas más lentas se ajustan con --scale.
+
+Uso:
+    python bench/bench_coldstart.py [--runs 5] [--top 8] [--scale 1.0]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ENDPOINTS = ('fetch', 'search', 'search_batch', 'shopping', 'product')
+# Import total por endpoint (ms); product y search_batch cargan asyncio / futures
+COLD_BUDGET_MS = {'fetch': 90, 'search': 80, 'search_batch': 100, 'shopping': 80, 'product': 120}
+HEAVY = ('google.generativeai', 'requests', 'bs4', 'lxml', 'selectolax')
+DEFERRED = ('google.generativeai', 'requests', 'bs4')
+
+# Módulos cargados al final del import (se imprime en stdout)
+_CHECK = "import sys; print(','.join(m for m in {heavy!r} if m in sys.modules))"
+_FETCH_REQUEST = (
+    "import time; t0 = time.perf_counter(); import api.fetch as f; "
+    "f._extract_with_regex(open({page!r}, encoding='utf-8').read()); "
+    "print(round((time.perf_counter() - t0) * 1000, 1)); "
+)
+
+
+def _run(code: str):
+    """([(módulo con sangría, µs acumulados)] en orden de -X importtime, stdout) de un proceso nuevo"""
+    env = dict(os.environ, GEMINI_API_KEY=os.environ.get('GEMINI_API_KEY', 'cold'),
+               GEMINI_PREWARM='0', TRACE_LOG='0', PYTHONDONTWRITEBYTECODE='1')
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT, env=env,
+                          capture_output=True, text=True, check=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cum, name = line[len('import time:'):].split('|')
+        rows.append((name[1:].rstrip(), int(cum)))
+    return rows, proc.stdout.strip()
+
+
+def _measure(code: str, module: str, runs: int):
+    """(mediana en ms del import de module, última corrida)"""
+    samples, last = [], None
+    for _ in range(runs):
+        rows, out = _run(code)
+        samples.append(next((us for name, us in rows if name == module), 0) / 1000)
+        last = rows, out
+    return statistics.median(samples), last
+
+
+def _top(rows: list, module: str, n: int) -> list:
+    """
+    Los n módulos más caros que cargó el import de module: -X importtime
+    imprime los hijos antes que el padre, así que son las filas entre el
+    módulo de primer nivel anterior (site, encodings...) y module.
+    """
+    end = next(i for i, (name, _) in enumerate(rows) if name == module)
+    start = end
+    while start > 0 and rows[start - 1][0].startswith(' '):
+        start -= 1
+    tree = [(name.strip(), us) for name, us in rows[start:end]]
+    return sorted(tree, key=lambda row: -row[1])[:n]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=8)
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplica los presupuestos')
+    args = parser.parse_args()
+
+    failures = 0
+    check = _CHECK.format(heavy=HEAVY)
+    print(f"{'endpoint':<14}{'import ms':>10}{'presupuesto':>13}  pesadas cargadas")
+    reports = {}
+    for name in ENDPOINTS:
+        ms, (rows, loaded) = _measure(f"import api.{name}; {check}", f'api.{name}', args.runs)
+        budget = COLD_BUDGET_MS[name] * args.scale
+        ok = ms <= budget and not loaded
+        failures += not ok
+        reports[name] = rows
+        print(f"{name:<14}{ms:>10.1f}{budget:>13.0f}  {loaded or '-'}{'' if ok else '   ✗'}")
+
+    page = os.path.join(ROOT, 'bench', 'corpus', 'retail', 'walmart_jsonld.html')
+    samples = []
+    for _ in range(args.runs):
+        _, out = _run(_FETCH_REQUEST.format(page=page) + check)
+        elapsed, _, loaded = out.partition('\n')
+        samples.append(float(elapsed))
+    failures += bool(loaded)
+    print(f"\nfetch sólo regex (import + extracción de {os.path.basename(page)}): "
+          f"{statistics.median(samples):.1f} ms, pesadas cargadas {loaded or '-'}")
+
+    print("\ndependencias diferidas (import aislado, sólo en las rutas que las usan):")
+    for module in DEFERRED:
+        try:
+            ms, _ = _measure(f"import {module}", module, args.runs)
+        except subprocess.CalledProcessError:
+            print(f"  {module:<22} no instalado")
+            continue
+        print(f"  {module:<22}{ms:>8.1f} ms")
+
+    for name, rows in reports.items():
+        print(f"\n{name}: módulos más caros del import (ms acumulados)")
+        for module, us in _top(rows, f'api.{name}', args.top):
+            print(f"  {module:<40}{us / 1000:>8.1f}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Micro-benchmark del extractor de precios de api/fetch.py.
+
+Compara el recorrido patrón por patrón original contra el extractor de un solo
+recorrido (PriceScanner) sobre las páginas guardadas en bench/corpus/retail,
+y verifica que ambos devuelvan exactamente el mismo resultado.
+
+Uso:
+    python bench/bench_extract.py [--repeat 20] [--pad-kb 1500]
+
+--pad-kb infla cada página con ruido HTML (sin precios) antes del contenido
+para simular páginas de 1-3 MB.
+"""
+import argparse
+import html
+import os
+import re
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from api.fetch import PRICE_PATTERNS, _normalize_price, _extract_with_regex  # noqa: E402
+
+CORPUS_DIR = os.path.join(ROOT, 'bench', 'corpus', 'retail')
+
+NOISE_BLOCK = (
+    '<div class="card"><a href="/browse/despensa" class="nav-link">Despensa</a>'
+    '<span class="badge">Envío gratis</span><img src="/i/x.jpg" alt="">'
+    '<script>window.dataLayer=window.dataLayer||[];dataLayer.push({"event":"view"});</script>'
+    '</div>\n'
+)
+
+
+def _extract_legacy(html_text: str) -> dict:
+    """Implementación original: un re.finditer por patrón sobre todo el HTML"""
+    result = {}
+    mtitle = re.search(r'<title[^>]*>(.*?)</title>', html_text, re.I | re.S)
+    result['title'] = html.unescape(mtitle.group(1)).strip() if mtitle else None
+    mseller = re.search(r'"seller"\s*:\s*"?([^",}{]+)"?', html_text, re.I)
+    result['seller'] = mseller.group(1).strip() if mseller else None
+    mcurr = re.search(r'"priceCurrency"\s*:\s*"?([A-Z]{3})"?', html_text, re.I)
+    result['currency'] = (mcurr.group(1).strip() if mcurr else None) or 'MXN'
+    price = None
+    for p in PRICE_PATTERNS:
+        for m in re.finditer(p, html_text, re.I):
+            price = _normalize_price(m.group(1))
+            if price: break
+        if price: break
+    result['price'] = price
+    return result
+
+
+def _load_corpus(pad_kb: int) -> dict:
+    pages = {}
+    for name in sorted(os.listdir(CORPUS_DIR)):
+        if not name.endswith('.html'):
+            continue
+        with open(os.path.join(CORPUS_DIR, name), encoding='utf-8') as fh:
+            text = fh.read()
+        if pad_kb:
+            noise = NOISE_BLOCK * (pad_kb * 1024 // len(NOISE_BLOCK) + 1)
+            cut = text.find('<body>')
+            cut = cut + len('<body>') if cut != -1 else 0
+            text = text[:cut] + noise + text[cut:]
+        pages[name] = text
+    return pages
+
+
+def _time_ms(fn, text: str, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(text)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--pad-kb', type=int, default=0)
+    args = parser.parse_args()
+
+    pages = _load_corpus(args.pad_kb)
+    mismatches = 0
+    total_legacy = total_new = 0.0
+
+    print(f"{'página':<28}{'KB':>8}{'legacy ms':>12}{'scanner ms':>12}{'x':>7}  precio (origen)")
+    for name, text in pages.items():
+        expected = _extract_legacy(text)
+        full = _extract_with_regex(text)
+        got = {k: full[k] for k in expected}
+        if got != expected:
+            mismatches += 1
+            print(f"  DIFERENCIA en {name}:\n    legacy:  {expected}\n    scanner: {got}")
+
+        legacy_ms = statistics.median(_time_ms(_extract_legacy, text, args.repeat))
+        new_ms = statistics.median(_time_ms(_extract_with_regex, text, args.repeat))
+        total_legacy += legacy_ms
+        total_new += new_ms
+        print(f"{name:<28}{len(text) // 1024:>8}{legacy_ms:>12.2f}{new_ms:>12.2f}"
+              f"{legacy_ms / new_ms:>7.1f}  {got['price']} ({full['price_source']})")
+
+    print(f"{'TOTAL':<36}{total_legacy:>12.2f}{total_new:>12.2f}{total_legacy / total_new:>7.1f}")
+    if mismatches:
+        print(f"{mismatches} página(s) con resultados distintos")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+"""
+Benchmark offline y regresión de los tres handlers (fetch, search, shopping).
+
+Todo corre local (ver bench/_offline.py): páginas de tiendas, respuestas de
+SerpApi y páginas de Google Shopping grabadas en bench/corpus, servidas por
+un servidor HTTP local, y un Gemini falso con latencia configurable.
+
+Reporta por handler:
+- latencia por etapa (p50 / p90 / p99 en ms)
+- latencia de punta a punta del handler HTTP y throughput con N clientes
+- pico de memoria de una pasada (tracemalloc)
+- exactitud contra bench/corpus/*/expected.json
+
+Regresión: --record guarda las salidas en bench/corpus/golden.json; sin él,
+las salidas se comparan contra ese archivo y el script sale con 1 si cambian.
+Los casos que no pasan expected.json no se graban (para no fijar un precio
+mal como referencia) y también hacen salir con 1.
+
+Uso:
+    python bench/bench_handlers.py [--repeat 10] [--requests 100] [--concurrency 8]
+                                   [--gemini-ms 0] [--deadline-ms 0] [--only fetch,search,shopping]
+                                   [--record]
+
+--deadline-ms manda ese deadline_ms en cada petición punta a punta (con
+--gemini-ms alto muestra el p99 acotado y cuántas respuestas salen parciales).
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench import _offline  # noqa: E402
+from api._json import dumps  # noqa: E402
+
+GOLDEN_PATH = os.path.join(_offline.CORPUS_DIR, 'golden.json')
+
+
+def _pct(samples: list, p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+class Timer:
+    """Acumula muestras (ms) por etapa"""
+
+    def __init__(self):
+        self.samples = {}
+
+    def run(self, stage, fn, *args):
+        t0 = time.perf_counter()
+        result = fn(*args)
+        self.samples.setdefault(stage, []).append((time.perf_counter() - t0) * 1000)
+        return result
+
+
+# ===================== Casos por handler =====================
+def _fetch_cases(stand_in):
+    from api._http import http_get
+    from api._structured import extract_structured
+    from api._windowing import html_windows
+    from api.fetch import (FETCH_HEADERS, FETCH_CHUNK_SIZE, _stream_extract, _apply_structured,
+                           _enhance_with_gemini)
+    expected = _offline.load_json('retail', 'expected.json')
+
+    def download_extract(url):
+        # Lectura por bloques con corte temprano, como el handler (stream por default)
+        with http_get(url, headers=FETCH_HEADERS, stream=True) as resp:
+            text, regex, _ = _stream_extract(resp.iter_content(FETCH_CHUNK_SIZE))
+        return text, regex
+
+    def run(name, timer):
+        url = f'{stand_in.base_url}/retail/{name}'
+        text, regex = timer.run('download_regex', download_extract, url)
+        structured = timer.run('structured', extract_structured, text)
+        result = _apply_structured(dict(regex), structured)
+        timer.run('windows', html_windows, text)
+        timer.run('gemini', _enhance_with_gemini, text, url, dict(result))
+        timer.run('marshal', lambda: dumps(result))
+        return {k: result.get(k) for k in ('price', 'price_source', 'currency', 'title', 'seller', 'brand',
+                                           'category', 'availability', 'rating', 'review_count')}
+
+    def score(name, output):
+        truth = expected.get(name, {})
+        return [output.get(k) == v for k, v in truth.items()]
+
+    def body(name):
+        return {'url': f'{stand_in.base_url}/retail/{name}'}
+
+    return _offline.corpus_files('retail', '.html'), run, score, body
+
+
+def _search_cases(stand_in):
+    from api.search import (_fetch_serpapi_organic, _analyze_with_gemini, _manual_fallback,
+                            _build_search_query, _search_payload)
+    expected = _offline.load_json('serpapi', 'expected.json')
+
+    def run(upc, timer):
+        raw = timer.run('serpapi', _fetch_serpapi_organic, _build_search_query(upc, ''))
+        offers, summary, degraded = timer.run('gemini', _analyze_with_gemini, raw, upc)
+        timer.run('fallback_dedupe', _manual_fallback, raw)
+        payload = _search_payload(raw, offers, summary, degraded)
+        timer.run('marshal', lambda: dumps(payload))
+        return [{k: o.get(k) for k in ('seller', 'link', 'price')} for o in offers]
+
+    def score(upc, output):
+        sellers = [o['seller'].lower() for o in output]
+        wanted = [s.lower() for s in expected[upc]['sellers']]
+        return [s in sellers for s in wanted] + [len(sellers) == len(set(sellers))]
+
+    def body(upc):
+        return {'upc': upc, 'no_cache': True}
+
+    return [n[:-5] for n in _offline.corpus_files('serpapi', '.json') if n != 'expected.json'], run, score, body
+
+
+def _shopping_cases(stand_in):
+    from api._http import http_get
+    from api.shopping import _scrape_google_shopping, _analyze_with_gemini
+    expected = _offline.load_json('shopping', 'expected.json')
+
+    def run(name, timer):
+        query = expected[name]['query']
+        timer.run('download', lambda: http_get(f'{stand_in.base_url}/search', params={'q': query}).text)
+        results = timer.run('scrape', _scrape_google_shopping, query)
+        analysis = timer.run('gemini', _analyze_with_gemini, query, '', results)
+        timer.run('marshal', lambda: dumps(analysis))
+        return [{k: r.get(k) for k in ('title', 'link', 'price', 'seller')} for r in results]
+
+    def score(name, output):
+        truth = expected[name]['results']
+        checks = [len(output) == len(truth)]
+        for got, want in zip(output, truth):
+            checks += [got[k] == want[k] for k in ('title', 'link', 'price', 'seller')]
+        return checks
+
+    def body(name):
+        return {'query': expected[name]['query'], 'no_cache': True}
+
+    return sorted(expected), run, score, body
+
+
+HANDLERS = {
+    'fetch': ('api.fetch', _fetch_cases),
+    'search': ('api.search', _search_cases),
+    'shopping': ('api.shopping', _shopping_cases),
+}
+
+
+# ===================== Punta a punta =====================
+def _serve(module_name):
+    module = __import__(module_name, fromlist=['handler'])
+    quiet = type('handler', (module.handler,), {
+        'log_message': lambda self, *args: None,
+        'disable_nagle_algorithm': True,
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', 0), quiet)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _post(url, payload):
+    req = urllib.request.Request(url, data=json.dumps(payload).encode('utf-8'),
+                                 headers={'Content-Type': 'application/json'})
+    t0 = time.perf_counter()
+    with urllib.request.urlopen(req, timeout=60) as resp:
+        body = json.loads(resp.read())
+    return (time.perf_counter() - t0) * 1000, bool(body.get('partial'))
+
+
+def _end_to_end(module_name, bodies, total, concurrency):
+    server = _serve(module_name)
+    url = f'http://127.0.0.1:{server.server_port}/'
+    try:
+        payloads = [bodies[i % len(bodies)] for i in range(total)]
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            answers = list(pool.map(lambda p: _post(url, p), payloads))
+        elapsed = time.perf_counter() - t0
+    finally:
+        server.shutdown()
+    return [ms for ms, _ in answers], total / elapsed, sum(partial for _, partial in answers)
+
+
+# ===================== Reporte =====================
+def _print_stages(samples: dict):
+    print(f"  {'etapa':<18}{'p50':>9}{'p90':>9}{'p99':>9}   (ms)")
+    for stage, values in samples.items():
+        print(f"  {stage:<18}{_pct(values, 50):>9.2f}{_pct(values, 90):>9.2f}{_pct(values, 99):>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--gemini-ms', type=int, default=0)
+    parser.add_argument('--deadline-ms', type=int, default=0)
+    parser.add_argument('--only', default=','.join(HANDLERS))
+    parser.add_argument('--record', action='store_true')
+    args = parser.parse_args()
+
+    stand_in = _offline.install(gemini_ms=args.gemini_ms)
+    golden = {}
+    if os.path.exists(GOLDEN_PATH):
+        with open(GOLDEN_PATH, encoding='utf-8') as fh:
+            golden = json.load(fh)
+    changed = []
+
+    for name in args.only.split(','):
+        module_name, factory = HANDLERS[name]
+        cases, run, score, body = factory(stand_in)
+        print(f"\n=== {name} ({len(cases)} casos) ===")
+
+        # Etapas en proceso + exactitud + salidas para regresión
+        _offline.StubModel.calls = 0
+        timer = Timer()
+        outputs = {}
+        checks = []
+        failed = []
+        for _ in range(args.repeat):
+            for case in cases:
+                outputs[case] = run(case, timer)
+        for case in cases:
+            case_checks = score(case, outputs[case])
+            checks += case_checks
+            if not all(case_checks):
+                failed.append(case)
+        _print_stages(timer.samples)
+
+        # Pico de memoria de una pasada por todos los casos
+        tracemalloc.start()
+        for case in cases:
+            run(case, Timer())
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        bodies = [body(c) for c in cases]
+        if args.deadline_ms:
+            bodies = [{**b, 'deadline_ms': args.deadline_ms} for b in bodies]
+        latencies, rps, partial = _end_to_end(module_name, bodies, args.requests, args.concurrency)
+        print(f"  handler HTTP       p50 {_pct(latencies, 50):.2f}  p90 {_pct(latencies, 90):.2f}"
+              f"  p99 {_pct(latencies, 99):.2f} ms  |  {rps:.1f} req/s con {args.concurrency} clientes")
+        if args.deadline_ms:
+            print(f"  deadline           {args.deadline_ms} ms, {partial}/{len(latencies)} respuestas parciales")
+        print(f"  memoria pico       {peak / 1024:.0f} KB")
+        print(f"  llamadas a Gemini  {_offline.StubModel.calls} (stub, {args.gemini_ms} ms c/u)")
+        print(f"  exactitud          {sum(checks)}/{len(checks)} ({100 * sum(checks) / max(1, len(checks)):.1f}%)"
+              + (f"  fallos en: {', '.join(failed)}" if failed else ''))
+
+        outputs = json.loads(json.dumps(outputs))
+        if failed:
+            changed.append(name)
+        if args.record:
+            golden[name] = {c: out for c, out in outputs.items() if c not in failed}
+            if failed:
+                print(f"  ⚠️ sin grabar (no pasan expected.json): {', '.join(failed)}")
+        elif name in golden:
+            diff = [c for c in cases if golden[name].get(c) != outputs.get(c)]
+            if diff:
+                changed.append(name)
+                print(f"  REGRESIÓN: salida distinta a golden.json en {', '.join(diff)}")
+            else:
+                print("  regresión         sin cambios contra golden.json")
+
+    stand_in.close()
+    if args.record:
+        with open(GOLDEN_PATH, 'w', encoding='utf-8') as fh:
+            json.dump(golden, fh, ensure_ascii=False, indent=1, sort_keys=True)
+        print(f"\nsalidas guardadas en {os.path.relpath(GOLDEN_PATH)}")
+    if changed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
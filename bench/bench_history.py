@@ -0,0 +1,85 @@
+"""
+Benchmark del historial de precios (api/_history.py) en /api/fetch.
+
+Pide --rounds veces cada página de bench/corpus/retail al servidor local
+(Gemini falso con --gemini-ms de latencia) en tres modos:
+
+    sin historial   descarga y extracción completas cada vez
+    etag            el servidor manda ETag: desde la 2a vuelta, 304 sin cuerpo
+    hash            sin ETag: se descarga, pero con el mismo hash se reutiliza
+                    la extracción (sin datos estructurados ni Gemini)
+
+Verifica que el precio sea el mismo en todos los modos y mide la consulta
+de último precio conocido (sin red).
+
+Uso:
+    python bench/bench_history.py [--rounds 5] [--gemini-ms 300]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench import _offline  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--gemini-ms', type=int, default=300)
+    args = parser.parse_args()
+
+    stand_in = _offline.install(gemini_ms=args.gemini_ms)
+    import api.fetch as fetch
+    from api._history import PriceHistory
+
+    pages = _offline.corpus_files('retail', '.html')
+    tmp = tempfile.mkdtemp()
+    modes = (
+        ('sin historial', PriceHistory(enabled=False), ''),
+        ('etag', PriceHistory(os.path.join(tmp, 'etag.sqlite3'), enabled=True), ''),
+        ('hash', PriceHistory(os.path.join(tmp, 'hash.sqlite3'), enabled=True), '?noetag=1'),
+    )
+    prices = {}
+    mismatches = 0
+    print(f"{args.rounds} vueltas x {len(pages)} páginas, Gemini {args.gemini_ms} ms\n")
+    print(f"{'modo':<15}{'1a vuelta ms':>14}{'siguientes ms':>15}{'KB leídos':>11}  estados")
+    for mode, history, suffix in modes:
+        fetch.HISTORY = history
+        first, rest, kb, statuses = [], [], 0, {}
+        for round_ in range(args.rounds):
+            for name in pages:
+                url = f'{stand_in.base_url}/retail/{name}{suffix}'
+                t0 = time.perf_counter()
+                result = fetch._fetch_product(url, upc=name.split('_')[0])
+                (first if round_ == 0 else rest).append((time.perf_counter() - t0) * 1000)
+                kb += result['fetch']['bytes_read'] / 1024
+                status = (result.get('history') or {}).get('status', '-')
+                statuses[status] = statuses.get(status, 0) + 1
+                expected = prices.setdefault(name, result['price'])
+                if result['price'] != expected:
+                    mismatches += 1
+                    print(f"  DIFERENCIA en {name} ({mode}): {expected} vs {result['price']}")
+        rest_ms = statistics.median(rest) if rest else 0.0
+        print(f"{mode:<15}{statistics.median(first):>14.2f}{rest_ms:>15.2f}{kb:>11.0f}  "
+              + ', '.join(f'{k} {v}' for k, v in sorted(statuses.items())))
+
+    history = modes[1][1]
+    samples = []
+    for name in pages:
+        t0 = time.perf_counter()
+        history.last_price(f'{stand_in.base_url}/retail/{name}')
+        samples.append((time.perf_counter() - t0) * 1000)
+    print(f"\núltimo precio conocido (sin red): {statistics.median(samples):.3f} ms por URL")
+    stand_in.close()
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+Benchmark de la representación de ofertas de punta a punta (api/_offers.py,
+api/_json.py y el prompt de api/shopping.py).
+
+Con las filas scrapeadas de bench/corpus/shopping (StandIn local) arma
+--offers ofertas y pasa cada una por el camino de /api/shopping:
+
+    filas       la fila del scraper
+    merge       marcar mercado / moneda (varios mercados)
+    prompt      el texto para el modelo (SHOPPING_PROMPT_RESULTS filas)
+    validar     la oferta que regresa el modelo, lista para responder
+    marshal     el cuerpo de la respuesta en bytes
+
+de dos formas:
+
+    antes       dicts (copia por fila en el merge), prompt con +=,
+                json.dumps(...).encode()
+    ahora       Offer con __slots__ sin copias, prompt con join,
+                api._json.dumps (orjson si está instalado)
+
+Reporta ms por fase, memoria retenida (filas + ofertas vivas) y pico con
+tracemalloc, y verifica que el cuerpo y el prompt salgan iguales.
+
+Uso:
+    python bench/bench_offers.py [--offers 1000] [--rounds 7]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench import _offline  # noqa: E402
+
+PHASES = ('filas', 'merge', 'prompt', 'validar', 'marshal')
+
+
+def _seed_rows(shopping):
+    """Campos crudos de las filas del corpus (título, link, precio, vendedor)"""
+    expected = _offline.load_json('shopping', 'expected.json')
+    rows = []
+    for name in sorted(expected):
+        for r in shopping._scrape_google_shopping(expected[name]['query']):
+            rows.append((r['title'], r['link'], r['price_text'], r['price'], r['seller']))
+    return rows
+
+
+def _legacy_prompt(shopping, query, upc, rows):
+    context = shopping._PROMPT_HEADER
+    for idx, result in enumerate(rows[:shopping.SHOPPING_PROMPT_RESULTS], 1):
+        context += f"\n{idx}. Producto: {result['title']}\n"
+        if result.get('price_text'):
+            context += f"   Precio mencionado: {result['price_text']}\n"
+        if result.get('price') is not None:
+            context += f"   Precio numérico detectado: {result['price']}\n"
+        if result.get('seller'):
+            context += f"   Vendedor: {result['seller']}\n"
+        if result.get('market'):
+            context += f"   Mercado: {result['market']} ({result['currency']})\n"
+        context += f"   Link: {result['link']}\n"
+    tail = shopping._build_prompt(query, upc, [])[len(shopping._PROMPT_HEADER):]
+    return context + tail
+
+
+def _legacy(shopping, seeds, timer):
+    rows = timer('filas', lambda: [
+        {'title': t, 'link': link, 'price_text': pt, 'price': p, 'currency': 'MXN', 'seller': s}
+        for t, link, pt, p, s in seeds])
+    rows = timer('merge', lambda: [dict(r, market='us', currency='USD') for r in rows])
+    prompt = timer('prompt', _legacy_prompt, shopping, 'q', '', rows)
+    parsed = [{'title': r['title'], 'price': r['price'], 'currency': 'USD', 'seller': r['seller'],
+               'link': r['link']} for r in rows]
+
+    def validate():
+        offers = []
+        for o in parsed:
+            if o.get('price') is not None and not shopping._validate_price(o['price']):
+                o['price'] = None
+            o['seller'] = shopping.canonical_seller(o.get('seller'), o.get('link'))
+            o['market'] = 'us'
+            offers.append(o)
+        return offers
+    offers = timer('validar', validate)
+    body = timer('marshal', lambda: json.dumps({'offers': offers, 'total_offers': len(offers)},
+                                               ensure_ascii=False).encode('utf-8'))
+    return rows, offers, prompt, body
+
+
+def _current(shopping, seeds, timer):
+    from api._json import dumps
+    from api._offers import Offer
+
+    rows = timer('filas', lambda: [Offer(t, p, 'MXN', s, link, price_text=pt) for t, link, pt, p, s in seeds])
+
+    def merge():
+        for r in rows:
+            r.market = 'us'
+            r.currency = 'USD'
+        return rows
+    rows = timer('merge', merge)
+    prompt = timer('prompt', shopping._build_prompt, 'q', '', rows)
+    parsed = [{'title': r.title, 'price': r.price, 'currency': 'USD', 'seller': r.seller,
+               'link': r.link} for r in rows]
+    market_of = {r.link: 'us' for r in rows}
+    offers = timer('validar', lambda: [shopping._validate_offer(o, market_of) for o in parsed])
+    body = timer('marshal', lambda: dumps({'offers': offers, 'total_offers': len(offers)}))
+    return rows, offers, prompt, body
+
+
+def _measure(fn, shopping, seeds, rounds):
+    """(mediana ms por fase, KB retenidos, KB pico, salida)"""
+    samples = {phase: [] for phase in PHASES}
+
+    def timer(phase, f, *args):
+        t0 = time.perf_counter()
+        value = f(*args)
+        samples[phase].append((time.perf_counter() - t0) * 1000)
+        return value
+
+    for _ in range(rounds):
+        out = fn(shopping, seeds, timer)
+    del out
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    out = fn(shopping, seeds, lambda phase, f, *args: f(*args))
+    rows, offers = out[0], out[1]
+    retained = sum(s.size_diff for s in tracemalloc.take_snapshot().compare_to(before, 'filename'))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del rows, offers
+    return {p: statistics.median(v) for p, v in samples.items()}, retained / 1024, peak / 1024, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--offers', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=7)
+    args = parser.parse_args()
+
+    os.environ.setdefault('SINGLEFLIGHT', 'memory')
+    _offline.install()
+    import api.shopping as shopping
+    from api._json import encoder
+
+    base = _seed_rows(shopping)
+    seeds = [(t, f'{link}#{i}', pt, p, s)
+             for i in range(args.offers // len(base) + 1) for t, link, pt, p, s in base][:args.offers]
+    print(f"{len(seeds)} ofertas ({len(base)} filas del corpus), {args.rounds} vueltas, encoder {encoder()}\n")
+
+    results = {}
+    for label, fn in (('antes', _legacy), ('ahora', _current)):
+        results[label] = _measure(fn, shopping, seeds, args.rounds)
+
+    print(f"{'fase':<12}{'antes ms':>10}{'ahora ms':>10}")
+    for phase in PHASES:
+        print(f"{phase:<12}{results['antes'][0][phase]:>10.2f}{results['ahora'][0][phase]:>10.2f}")
+    total = {label: sum(r[0].values()) for label, r in results.items()}
+    print(f"{'total':<12}{total['antes']:>10.2f}{total['ahora']:>10.2f}")
+    print(f"\n{'memoria':<12}{'antes KB':>10}{'ahora KB':>10}")
+    print(f"{'retenida':<12}{results['antes'][1]:>10.0f}{results['ahora'][1]:>10.0f}")
+    print(f"{'pico':<12}{results['antes'][2]:>10.0f}{results['ahora'][2]:>10.0f}")
+
+    (_, _, old_prompt, old_body), (_, _, new_prompt, new_body) = results['antes'][3], results['ahora'][3]
+    mismatches = 0
+    if json.loads(old_body) != json.loads(new_body):
+        mismatches += 1
+        print("  DIFERENCIA: el cuerpo de la respuesta no coincide")
+    if old_prompt != new_prompt:
+        mismatches += 1
+        print("  DIFERENCIA: el prompt no coincide")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark de los perfiles de extracción por dominio (api/_profiles.py) en
+la lectura por bloques de api/fetch.py.
+
+Cada página de bench/corpus/retail cuenta como un host (prefijo del nombre:
+walmart, chedraui, lacomer...). Se simulan --visits visitas por host: sin
+perfil (recorrido general) y con el perfil aprendido en las visitas
+anteriores. Reporta ms por página, bytes leídos, en qué visita se promovió
+el patrón y la tasa de acierto del primer intento, y verifica que el precio
+sea el mismo.
+
+Uso:
+    python bench/bench_profiles.py [--visits 20] [--pad-kb 1500]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.bench_extract import _load_corpus  # noqa: E402
+from api._profiles import ProfileStore  # noqa: E402
+from api.fetch import FETCH_CHUNK_SIZE, PROFILE_MAX_PROBES, PROFILES, _PATTERN_INDEX, _stream_extract  # noqa: E402
+
+
+def _chunks(data: bytes):
+    for i in range(0, len(data), FETCH_CHUNK_SIZE):
+        yield data[i:i + FETCH_CHUNK_SIZE]
+
+
+def _visit(data: bytes, probes):
+    t0 = time.perf_counter()
+    _, result, info = _stream_extract(_chunks(data), probes=probes)
+    return (time.perf_counter() - t0) * 1000, result, info
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--visits', type=int, default=20)
+    parser.add_argument('--pad-kb', type=int, default=1500)
+    args = parser.parse_args()
+
+    pages = _load_corpus(args.pad_kb)
+    path = os.path.join(tempfile.mkdtemp(), 'profiles.json')
+    store = ProfileStore(path=path, enabled=True, promotable=PROFILES.promotable)
+    mismatches = 0
+    total_plain = total_profiled = 0.0
+
+    print(f"{'host':<12}{'KB':>7}{'sin perfil ms':>15}{'con perfil ms':>15}{'KB leídos':>14}"
+          f"{'promovido':>11}{'acierto':>9}  patrón")
+    for name, text in pages.items():
+        host = name.split('_')[0]
+        data = text.encode('utf-8')
+        plain_ms, profiled_ms = [], []
+        promoted_at = None
+        probed = hits = 0
+        for visit in range(1, args.visits + 1):
+            ms, expected, plain_info = _visit(data, ())
+            plain_ms.append(ms)
+
+            probes = [_PATTERN_INDEX[k] for k in store.preferred(host)][:PROFILE_MAX_PROBES]
+            if probes and promoted_at is None:
+                promoted_at = visit
+            ms, result, info = _visit(data, probes)
+            profiled_ms.append(ms)
+            store.record(host, info['pattern'], probes, info['probe_hit'])
+            probed += bool(probes)
+            hits += info['probe_hit']
+            if result['price'] != expected['price']:
+                mismatches += 1
+                print(f"  DIFERENCIA en {name} (visita {visit}): {expected['price']} vs {result['price']}")
+
+        a, b = statistics.median(plain_ms), statistics.median(profiled_ms)
+        total_plain += a
+        total_profiled += b
+        rate = f"{hits / probed * 100:.0f}%" if probed else '-'
+        print(f"{host:<12}{len(data) // 1024:>7}{a:>15.2f}{b:>15.2f}"
+              f"{plain_info['bytes_read'] // 1024:>7}→{info['bytes_read'] // 1024:<6}"
+              f"{promoted_at or '-':>11}{rate:>9}  {info['pattern']}")
+
+    print(f"{'TOTAL':<19}{total_plain:>15.2f}{total_profiled:>15.2f}")
+    snapshot = store.snapshot()
+    print(f"\nprimer intento: {snapshot['probe_hits']}/{snapshot['probes']} aciertos, "
+          f"{snapshot['promotions']} promociones, {snapshot['demotions']} degradaciones, "
+          f"{snapshot['audits']} auditorías sin perfil")
+    store.flush()
+    print(f"perfiles guardados en {path} ({os.path.getsize(path)} bytes)")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark del scraping de Google Shopping con varias páginas / mercados
+(_scrape_shopping_pages en api/shopping.py).
+
+Con el StandIn local (--google-ms de latencia por página; start / gl
+distintos dan resultados nuevos, ver bench/_offline.py) compara, por caso
+de bench/corpus/shopping y por plan (páginas x mercados):
+
+    serie       una página tras otra y luego el mismo merge
+    paralelo    _scrape_shopping_pages (pool + target + presupuesto)
+
+Verifica que ambos junten los mismos resultados cuando no se llega al
+target (si se llega, que el paralelo dé target resultados, todos del
+merge completo) y muestra el corte por tiempo con --budget-ms.
+
+Uso:
+    python bench/bench_shopping_pages.py [--rounds 3] [--google-ms 400] [--budget-ms 900]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench import _offline  # noqa: E402
+
+PLANS = (
+    ('1 pág x mx', 1, ['mx']),
+    ('3 pág x mx', 3, ['mx']),
+    ('2 pág x mx,us', 2, ['mx', 'us']),
+    ('3 pág x mx,us,co', 3, ['mx', 'us', 'co']),
+)
+
+
+def _serial(shopping, query, markets, pages):
+    """Todas las páginas una tras otra, merge sin tope"""
+    plan = [(hl, gl, page * shopping.SHOPPING_PAGE_STEP) for page in range(pages) for hl, gl in markets]
+    fetched = [(step, shopping._scrape_google_shopping(query, *step)) for step in plan]
+    return shopping._merge_pages(fetched, len(markets) > 1, float('inf'))
+
+
+def _timed(fn, rounds):
+    samples, result = [], None
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--google-ms', type=int, default=400)
+    parser.add_argument('--budget-ms', type=int, default=900)
+    args = parser.parse_args()
+
+    os.environ.setdefault('SINGLEFLIGHT', 'memory')
+    _offline.install(google_ms=args.google_ms)
+    import api.shopping as shopping
+    expected = _offline.load_json('shopping', 'expected.json')
+    mismatches = 0
+
+    print(f"Google {args.google_ms} ms por página, target {shopping.SHOPPING_TARGET_RESULTS} resultados\n")
+    print(f"{'caso':<24}{'plan':<18}{'serie ms':>10}{'paralelo ms':>13}  resultados / sin tope")
+    for name in sorted(expected):
+        query = expected[name]['query']
+        for label, pages, gls in PLANS:
+            markets = shopping._parse_markets(gls)
+            serial_ms, serial = _timed(lambda: _serial(shopping, query, markets, pages), args.rounds)
+            parallel_ms, merged = _timed(lambda: shopping._scrape_shopping_pages(query, markets, pages),
+                                         args.rounds)
+            target = shopping.SHOPPING_TARGET_RESULTS
+            links, union = [r['link'] for r in merged], [r['link'] for r in serial]
+            if len(union) <= target:
+                ok = links == union
+            else:
+                ok = len(links) == target and set(links) <= set(union)
+            if not ok:
+                mismatches += 1
+                print(f"  DIFERENCIA en {name} / {label}: {len(union)} vs {len(links)} resultados")
+            print(f"{name:<24}{label:<18}{serial_ms:>10.0f}{parallel_ms:>13.0f}"
+                  f"{len(merged):>7} / {len(union)}")
+
+    # Corte por tiempo: 9 páginas con 2 workers no caben en el presupuesto;
+    # se regresa lo que llegó (sin tope de resultados)
+    shopping.SHOPPING_SCRAPE_BUDGET_MS = args.budget_ms
+    shopping._PAGE_EXECUTOR = shopping.ThreadPoolExecutor(max_workers=2)
+    query = expected[sorted(expected)[0]]['query']
+    markets = shopping._parse_markets(['mx', 'us', 'co'])
+    ms, merged = _timed(lambda: shopping._scrape_shopping_pages(query, markets, 3, target=10 ** 6), 1)
+    print(f"\npresupuesto {args.budget_ms} ms, 2 workers, 9 páginas: {ms:.0f} ms, {len(merged)} resultados")
+    if ms > args.budget_ms + args.google_ms:
+        mismatches += 1
+        print("  ✗ el presupuesto no cortó la espera")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark del parser de Google Shopping (api/_shopping_parse.py).
+
+Por página de bench/corpus/shopping y por backend instalado (selectolax,
+lxml, bs4), con la página completa y sólo con las tarjetas del grid:
+tiempo de CPU por página (mediana, ms) y si las tarjetas salen idénticas a
+la implementación original (BeautifulSoup + html.parser sobre toda la página).
+
+Uso:
+    python bench/bench_shopping_parse.py [--repeat 20] [--pad-kb 0]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from api._shopping_parse import available_backends, grid_cards, parse_cards  # noqa: E402
+from bench._offline import CORPUS_DIR, corpus_files  # noqa: E402
+from bench.bench_extract import NOISE_BLOCK  # noqa: E402
+
+
+def _load_pages(pad_kb: int) -> dict:
+    pages = {}
+    for name in corpus_files('shopping', '.html'):
+        with open(os.path.join(CORPUS_DIR, 'shopping', name), encoding='utf-8') as fh:
+            text = fh.read()
+        if pad_kb:
+            # Ruido antes del grid, como las barras y scripts de la página real
+            pad = NOISE_BLOCK * (pad_kb * 1024 // len(NOISE_BLOCK))
+            text = text.replace('<body>', '<body>' + pad, 1)
+        pages[name] = text
+    return pages
+
+
+def _cpu_ms(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.process_time()
+        fn()
+        samples.append((time.process_time() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--pad-kb', type=int, default=0)
+    args = parser.parse_args()
+
+    backends = available_backends()
+    pages = _load_pages(args.pad_kb)
+    print(f"backends instalados: {', '.join(backends)}\n")
+    print(f"{'página':<30}{'KB':>6}{'grid KB':>9}  {'backend':<12}{'completa':>10}{'grid':>9}{'x':>8}  salida")
+
+    totals = {}
+    for name, text in pages.items():
+        legacy = parse_cards(text, backend='bs4', grid_only=False)
+        base = _cpu_ms(lambda: parse_cards(text, backend='bs4', grid_only=False), args.repeat)
+        grid_kb = len(grid_cards(text)) / 1024
+        for backend in backends:
+            full_ms = _cpu_ms(lambda: parse_cards(text, backend=backend, grid_only=False), args.repeat)
+            grid_ms = _cpu_ms(lambda: parse_cards(text, backend=backend), args.repeat)
+            same = (parse_cards(text, backend=backend) == legacy
+                    and parse_cards(text, backend=backend, grid_only=False) == legacy)
+            totals.setdefault(backend, []).append(grid_ms)
+            print(f"{name:<30}{len(text) / 1024:>6.0f}{grid_kb:>9.0f}  {backend:<12}{full_ms:>10.2f}{grid_ms:>9.2f}"
+                  f"{base / max(grid_ms, 1e-6):>7.1f}x  {'idéntica' if same else 'DISTINTA'} ({len(legacy)} tarjetas)")
+
+    print(f"\nCPU por página con grid (promedio, ms): "
+          + ', '.join(f"{b} {statistics.mean(v):.2f}" for b, v in totals.items()))
+
+
+if __name__ == '__main__':
+    main()
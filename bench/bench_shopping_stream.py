@@ -0,0 +1,96 @@
+"""
+Benchmark del modo stream (NDJSON) de /api/shopping.
+
+Levanta el handler local (ver bench/_offline.py) y pide cada caso de
+bench/corpus/shopping sin caché de dos formas:
+
+    completo    respuesta JSON cuando el modelo termina
+    stream      "stream": true, una línea por oferta en cuanto se cierra
+
+Reporta la mediana de tiempo a la primera oferta y de la respuesta completa
+(--gemini-ms simula la generación del modelo, repartida en los pedazos del
+stream) y verifica que ambos modos den las mismas ofertas.
+
+Uso:
+    python bench/bench_shopping_stream.py [--rounds 5] [--gemini-ms 3000]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench import _offline  # noqa: E402
+from bench.bench_handlers import _serve  # noqa: E402
+
+_KEYS = ('title', 'link', 'price', 'seller')
+
+
+def _request(url, payload):
+    """(ms a la primera oferta, ms total, ofertas, línea final)"""
+    req = urllib.request.Request(url, data=json.dumps(payload).encode('utf-8'),
+                                 headers={'Content-Type': 'application/json'})
+    t0 = time.perf_counter()
+    first, offers, done = None, [], None
+    with urllib.request.urlopen(req, timeout=60) as resp:
+        if not payload.get('stream'):
+            body = json.loads(resp.read())
+            ms = (time.perf_counter() - t0) * 1000
+            return ms, ms, body.get('offers') or [], body
+        for line in resp:
+            item = json.loads(line)
+            if item['type'] == 'offer':
+                if first is None:
+                    first = (time.perf_counter() - t0) * 1000
+                offers.append(item['offer'])
+            else:
+                done = item
+    total = (time.perf_counter() - t0) * 1000
+    return first if first is not None else total, total, offers, done
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--gemini-ms', type=int, default=3000)
+    args = parser.parse_args()
+
+    _offline.install(gemini_ms=args.gemini_ms)
+    expected = _offline.load_json('shopping', 'expected.json')
+    server = _serve('api.shopping')
+    url = f'http://127.0.0.1:{server.server_port}/'
+    mismatches = 0
+    print(f"{args.rounds} vueltas, Gemini {args.gemini_ms} ms\n")
+    print(f"{'caso':<26}{'modo':<10}{'1a oferta ms':>14}{'total ms':>11}{'ofertas':>9}")
+    try:
+        for name in sorted(expected):
+            base = {'query': expected[name]['query'], 'no_cache': True}
+            outputs = {}
+            for mode, payload in (('completo', base), ('stream', dict(base, stream=True))):
+                firsts, totals = [], []
+                for _ in range(args.rounds):
+                    first, total, offers, done = _request(url, payload)
+                    firsts.append(first)
+                    totals.append(total)
+                outputs[mode] = [{k: o.get(k) for k in _KEYS} for o in offers]
+                if mode == 'stream' and done.get('total_offers') != len(offers):
+                    mismatches += 1
+                    print(f"  {name}: total_offers {done.get('total_offers')} vs {len(offers)} líneas")
+                print(f"{name:<26}{mode:<10}{statistics.median(firsts):>14.0f}"
+                      f"{statistics.median(totals):>11.0f}{len(offers):>9}")
+            if outputs['completo'] != outputs['stream']:
+                mismatches += 1
+                print(f"  DIFERENCIA en {name}: las ofertas del stream no coinciden")
+    finally:
+        server.shutdown()
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
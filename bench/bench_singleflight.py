@@ -0,0 +1,87 @@
+"""
+Benchmark del single-flight (api/_singleflight.py) en /api/search y /api/shopping.
+
+Simula la apertura de tienda: N peticiones simultáneas del mismo UPC, sin
+caché, repartidas en P procesos. Cuenta las llamadas reales a SerpApi /
+Google Shopping / Gemini con SINGLEFLIGHT=off, memory y file.
+
+Uso:
+    python bench/bench_singleflight.py [--requests 32] [--processes 2] [--gemini-ms 300]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODES = ('off', 'memory', 'file')
+
+
+def _worker(requests: int, gemini_ms: int, start_at: float):
+    """Un proceso: requests hilos con el mismo UPC y la misma query de shopping"""
+    from bench import _offline
+    _offline.install(gemini_ms=gemini_ms)
+    import api.search as search
+    import api.shopping as shopping
+
+    upc = _offline.corpus_files('serpapi', '.json')[0][:-5]
+    query = next(iter(_offline.load_json('shopping', 'expected.json').values()))['query']
+
+    def one(i):
+        if i % 2:
+            return search._run_search(upc, '')
+        return shopping._run_shopping(query, '')
+
+    time.sleep(max(0.0, start_at - time.time()))
+    with ThreadPoolExecutor(max_workers=requests) as pool:
+        list(pool.map(one, range(requests)))
+    flights = {
+        'serpapi': search._fetch_serpapi_organic.flight.stats,
+        'google_shopping': shopping._scrape_google_shopping.flight.stats,
+        'gemini_search': search._analyze_with_gemini.flight.stats,
+        'gemini_shopping': shopping._analyze_with_gemini.flight.stats,
+    }
+    print(' '.join(f"{name}={s['calls']}" for name, s in flights.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=32)
+    parser.add_argument('--processes', type=int, default=2)
+    parser.add_argument('--gemini-ms', type=int, default=300)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--start-at', type=float, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return _worker(args.requests, args.gemini_ms, args.start_at)
+
+    per_process = max(1, args.requests // args.processes)
+    print(f"{args.processes} procesos x {per_process} peticiones simultáneas (mitad search, mitad shopping), "
+          f"Gemini {args.gemini_ms} ms\n")
+    print(f"{'modo':<8}{'ms':>8}  llamadas reales")
+    for mode in MODES:
+        env = dict(os.environ, SINGLEFLIGHT=mode, SINGLEFLIGHT_DIR=f'/tmp/upc_singleflight_bench_{os.getpid()}')
+        start_at = time.time() + 2.0
+        t0 = time.perf_counter()
+        procs = [subprocess.Popen(
+            [sys.executable, __file__, '--worker', '--requests', str(per_process),
+             '--gemini-ms', str(args.gemini_ms), '--start-at', str(start_at)],
+            env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+        ) for _ in range(args.processes)]
+        outputs = [p.communicate()[0] for p in procs]
+        elapsed = (time.perf_counter() - t0) * 1000 - 2000
+        totals = {}
+        for out in outputs:
+            for pair in out.split()[-4:]:
+                name, n = pair.split('=')
+                totals[name] = totals.get(name, 0) + int(n)
+        print(f"{mode:<8}{elapsed:>8.0f}  " + '  '.join(f"{k} {v}" for k, v in totals.items()))
+
+
+if __name__ == '__main__':
+    main()
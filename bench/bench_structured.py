@@ -0,0 +1,76 @@
+"""
+Benchmark del parser de datos estructurados (api/_structured.py) contra el
+extractor con regex de api/fetch.py.
+
+Para cada página de bench/corpus/retail mide el tiempo de cada ruta y revisa
+contra bench/corpus/retail/expected.json:
+- precio: regex sola vs. regex + datos estructurados (_apply_structured)
+- campos opcionales (brand, availability, rating, ...) que salen sin modelo
+
+Uso:
+    python bench/bench_structured.py [--repeat 20] [--pad-kb 0]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from api._structured import extract_structured  # noqa: E402
+from api.fetch import _extract_with_regex, _apply_structured  # noqa: E402
+from bench.bench_extract import CORPUS_DIR, _load_corpus, _time_ms  # noqa: E402
+
+
+def _combined(text: str) -> dict:
+    return _apply_structured(_extract_with_regex(text), extract_structured(text))
+
+
+def _mark(price, truth: dict) -> str:
+    return f"{price}{'' if price == truth.get('price') else ' ✗'}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--pad-kb', type=int, default=0)
+    args = parser.parse_args()
+
+    with open(os.path.join(CORPUS_DIR, 'expected.json'), encoding='utf-8') as fh:
+        expected = json.load(fh)
+    pages = _load_corpus(args.pad_kb)
+
+    price_ok = {'regex': 0, 'combinado': 0}
+    fields_ok = fields_total = 0
+    total_regex = total_struct = 0.0
+
+    print(f"{'página':<28}{'regex ms':>10}{'struct ms':>11}  {'precio regex':>13}{'combinado':>11}  campos")
+    for name, text in pages.items():
+        truth = expected.get(name, {})
+        regex = _extract_with_regex(text)
+        combined = _combined(text)
+
+        price_ok['regex'] += regex['price'] == truth.get('price')
+        price_ok['combinado'] += combined['price'] == truth.get('price')
+        extra = [f for f in truth if f != 'price']
+        hits = [f for f in extra if combined.get(f) == truth[f]]
+        fields_ok += len(hits)
+        fields_total += len(extra)
+
+        regex_ms = statistics.median(_time_ms(_extract_with_regex, text, args.repeat))
+        struct_ms = statistics.median(_time_ms(extract_structured, text, args.repeat))
+        total_regex += regex_ms
+        total_struct += struct_ms
+        print(f"{name:<28}{regex_ms:>10.2f}{struct_ms:>11.2f}  {_mark(regex['price'], truth):>13}"
+              f"{_mark(combined['price'], truth):>11}  {len(hits)}/{len(extra)}")
+
+    n = len(pages)
+    print(f"{'TOTAL':<28}{total_regex:>10.2f}{total_struct:>11.2f}")
+    print(f"precio correcto: regex {price_ok['regex']}/{n}, regex + estructurados {price_ok['combinado']}/{n}")
+    print(f"campos opcionales sin modelo: {fields_ok}/{fields_total}")
+
+
+if __name__ == '__main__':
+    main()
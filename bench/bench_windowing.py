@@ -0,0 +1,73 @@
+"""
+Benchmark del recorte de HTML para el prompt de Gemini (api/_windowing.py).
+
+Compara las ventanas relevantes contra el recorte anterior (html_text[:8000])
+sobre bench/corpus/retail: caracteres enviados, razón de compresión, tiempo
+de preparación y si el precio correcto (expected.json) llega al modelo.
+
+Uso:
+    python bench/bench_windowing.py [--repeat 20] [--pad-kb 0] [--tokens 1500]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from api._windowing import html_windows  # noqa: E402
+from bench.bench_extract import CORPUS_DIR, _load_corpus, _time_ms  # noqa: E402
+
+LEGACY_CHARS = 8000
+
+
+def _has_price(text: str, price) -> bool:
+    """El precio aparece en el texto en alguna forma común (89, 89.0, 89.00, 1,199)"""
+    if price is None:
+        return False
+    forms = {f'{price:.2f}', f'{price:.1f}', f'{price:g}', f'{price:,.0f}', f'{price:,.2f}'}
+    return any(f in text for f in forms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--pad-kb', type=int, default=0)
+    parser.add_argument('--tokens', type=int, default=None)
+    args = parser.parse_args()
+
+    with open(os.path.join(CORPUS_DIR, 'expected.json'), encoding='utf-8') as fh:
+        expected = json.load(fh)
+    pages = _load_corpus(args.pad_kb)
+    window = (lambda t: html_windows(t, args.tokens)) if args.tokens else html_windows
+
+    recall = {'legacy': 0, 'ventanas': 0}
+    with_price = 0
+    sent = {'legacy': 0, 'ventanas': 0}
+
+    print(f"{'página':<28}{'KB':>6}{'8000 chars':>12}{'ventanas':>10}{'x':>9}{'ms':>8}  precio en prompt (8000 / ventanas)")
+    for name, text in pages.items():
+        price = expected.get(name, {}).get('price')
+        legacy = text[:LEGACY_CHARS]
+        prompt, stats = window(text)
+        ms = statistics.median(_time_ms(window, text, args.repeat))
+
+        sent['legacy'] += len(legacy)
+        sent['ventanas'] += stats['prompt_chars']
+        if price is not None:
+            with_price += 1
+            recall['legacy'] += _has_price(legacy, price)
+            recall['ventanas'] += _has_price(prompt, price)
+        print(f"{name:<28}{len(text) // 1024:>6}{len(legacy):>12}{stats['prompt_chars']:>10}"
+              f"{stats['compression_ratio']:>9.1f}{ms:>8.2f}  "
+              f"{_has_price(legacy, price)} / {_has_price(prompt, price)}")
+
+    print(f"caracteres enviados: 8000 chars {sent['legacy']}, ventanas {sent['ventanas']}")
+    print(f"precio visible para el modelo: 8000 chars {recall['legacy']}/{with_price}, "
+          f"ventanas {recall['ventanas']}/{with_price}")
+
+
+if __name__ == '__main__':
+    main()
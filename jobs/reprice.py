@@ -0,0 +1,352 @@
+"""
+Repricing masivo del catálogo, local (sin pasar por los endpoints de Vercel).
+
+Lee un CSV o JSONL de UPCs en streaming y los pasa por la misma lógica de
+api/ (search, shopping y fetch de las páginas de oferta sin precio) con un
+pool de hilos acotado. Cada UPC terminado se escribe de inmediato como una
+línea JSONL en la salida; esa misma salida es el checkpoint: al volver a
+correr con el mismo archivo se saltan los UPCs que ya salieron con status
+"ok" (una línea cortada por un crash se descarta). Los que salieron con
+"error" se vuelven a intentar y su nueva línea se agrega al final: si un UPC
+aparece más de una vez, la última línea es la que vale.
+
+Entrada:
+    CSV   con columna upc (y opcional query); sin encabezado, 1a columna = upc
+    JSONL {"upc": "...", "query": "..."} por línea
+
+Reporta cada --report-every segundos y al final: UPCs/s y tasa de error por
+etapa (fallas / intentos). search y shopping no lanzan cuando SerpApi o
+Google fallan (regresan vacío o el fallback), así que también cuentan como
+falla una respuesta sin resultados o degradada.
+
+Uso:
+    python jobs/reprice.py catalogo.csv salida.jsonl [--workers 8] [--stages search,shopping,fetch]
+                           [--max-links 3] [--deadline-ms 0] [--use-cache] [--restart]
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from api._cache import cache_key  # noqa: E402
+from api._deadline import start_deadline  # noqa: E402
+from api._governor import upstream_wait, governor_state  # noqa: E402
+from api.search import SEARCH_CACHE, _clean_upc, _run_search, _is_cacheable as _search_cacheable  # noqa: E402
+from api.shopping import SHOPPING_CACHE, _run_shopping, _is_cacheable as _shopping_cacheable  # noqa: E402
+from api.product import _merge_offers, _fetch_page  # noqa: E402
+
+STAGES = ('search', 'shopping', 'fetch')
+
+
+# ===================== Entrada =====================
+def read_items(path: str):
+    """(upc, query) en streaming desde CSV o JSONL; los UPCs inválidos se saltan"""
+    with open(path, encoding='utf-8-sig', newline='') as fh:
+        first = fh.readline()
+        if first.lstrip().startswith('{'):
+            for line in _chain(first, fh):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue
+                upc = _clean_upc(str(row.get('upc') or ''))
+                if upc:
+                    yield upc, (row.get('query') or '').strip()
+            return
+
+        header = next(csv.reader(io.StringIO(first)), [])
+        names = [h.strip().lower() for h in header]
+        if 'upc' in names:
+            upc_col = names.index('upc')
+            query_col = names.index('query') if 'query' in names else None
+            rows = csv.reader(fh)
+        else:
+            upc_col, query_col = 0, None
+            rows = csv.reader(_chain(first, fh))
+        for row in rows:
+            if len(row) <= upc_col:
+                continue
+            upc = _clean_upc(row[upc_col])
+            if upc:
+                query = row[query_col].strip() if query_col is not None and len(row) > query_col else ''
+                yield upc, query
+
+
+def _chain(first, fh):
+    yield first
+    yield from fh
+
+
+# ===================== Checkpoint =====================
+def load_done(path: str) -> set:
+    """
+    UPCs ya escritos en la salida con status "ok" (los de "error" se
+    reintentan). Una línea ilegible a media salida sólo se salta; una última
+    línea incompleta (sin salto de línea) se recorta.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    good_end = 0
+    with open(path, 'rb') as fh:
+        for raw in fh:
+            if not raw.endswith(b'\n'):
+                break
+            good_end += len(raw)
+            try:
+                record = json.loads(raw)
+                if record.get('status') == 'ok':
+                    done.add(record['upc'])
+            except (ValueError, KeyError, TypeError, AttributeError):
+                print(f"⚠️ Línea ilegible en {path} (byte {good_end - len(raw)}), se ignora")
+    if good_end < os.path.getsize(path):
+        with open(path, 'r+b') as fh:
+            fh.truncate(good_end)
+    return done
+
+
+class Output:
+    """Salida JSONL: una línea por UPC, flush por línea y fsync periódico"""
+
+    def __init__(self, path: str, fsync_every: int = 50):
+        self._fh = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.fsync_every = fsync_every
+
+    def write(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._fh.write(line)
+            self._fh.flush()
+            self._pending += 1
+            if self._pending >= self.fsync_every:
+                os.fsync(self._fh.fileno())
+                self._pending = 0
+
+    def close(self):
+        with self._lock:
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+            self._fh.close()
+
+
+# ===================== Pipeline por UPC =====================
+class Stats:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+        self.attempts = {s: 0 for s in STAGES}
+        self.errors = {s: 0 for s in STAGES}
+        self.stage_ms = {s: 0.0 for s in STAGES}
+        self._lock = threading.Lock()
+
+    def stage(self, name, ms, ok):
+        with self._lock:
+            self.attempts[name] += 1
+            self.stage_ms[name] += ms
+            if not ok:
+                self.errors[name] += 1
+
+    def finish(self, ok):
+        with self._lock:
+            self.done += 1
+            if not ok:
+                self.failed += 1
+
+    def report(self) -> dict:
+        with self._lock:
+            elapsed = time.monotonic() - self.started
+            return {
+                'done': self.done,
+                'failed': self.failed,
+                'resumed_skip': self.skipped,
+                'elapsed_s': round(elapsed, 1),
+                'upcs_per_s': round(self.done / elapsed, 2) if elapsed else 0.0,
+                'stages': {
+                    s: {
+                        'attempts': self.attempts[s],
+                        'error_rate': round(self.errors[s] / self.attempts[s], 3) if self.attempts[s] else 0.0,
+                        'avg_ms': round(self.stage_ms[s] / self.attempts[s], 1) if self.attempts[s] else 0.0,
+                    }
+                    for s in STAGES
+                },
+            }
+
+
+def _search_problem(payload):
+    if not payload.get('organic_results'):
+        return 'SerpApi sin resultados'
+    if payload.get('degraded'):
+        return payload.get('gemini_summary') or 'degradada'
+    return None
+
+
+def _shopping_problem(analysis):
+    if not analysis.get('offers'):
+        return 'Google Shopping sin resultados'
+    if analysis.get('degraded'):
+        return 'shopping_fallback (sin modelo)'
+    return None
+
+
+def _timed(stats, timing, errors, name, fn, *args, check=None):
+    """
+    fn(*args) medido; falla si lanza o si check(resultado) regresa el motivo
+    (el resultado se usa de todos modos)
+    """
+    t0 = time.perf_counter()
+    try:
+        result = fn(*args)
+        problem = check(result) if check is not None and result is not None else None
+        ok = problem is None
+        if problem:
+            errors[name] = problem
+        return result
+    except Exception as e:
+        ok = False
+        errors[name] = str(e)
+        return None
+    finally:
+        ms = (time.perf_counter() - t0) * 1000
+        timing[name] = int(ms)
+        stats.stage(name, ms, ok)
+
+
+def reprice(upc, query, args, stats):
+    """Un UPC por search / shopping / fetch; regresa la línea de salida"""
+    if args.deadline_ms:
+        start_deadline(args.deadline_ms)
+    timing = {}
+    errors = {}
+    search = shopping = None
+    with upstream_wait(None):
+        if 'search' in args.stages:
+            search = _timed(stats, timing, errors, 'search', _cached_search, upc, query, args.use_cache,
+                            check=_search_problem)
+        if 'shopping' in args.stages:
+            shopping = _timed(stats, timing, errors, 'shopping', _cached_shopping, upc, query, args.use_cache,
+                              check=_shopping_problem)
+
+    offers = _merge_offers(search, shopping)
+    if 'fetch' in args.stages:
+        targets = [o for o in offers if o.get('price') is None
+                   and (o.get('link') or '').startswith(('http://', 'https://'))][:args.max_links]
+        for offer in targets:
+            page = _timed(stats, timing, errors, 'fetch', _fetch_page, offer['link'], upc)
+            if page and page.get('price') is not None:
+                offer['price'] = page['price']
+                offer['price_source'] = 'page'
+
+    prices = [o['price'] for o in offers if isinstance(o.get('price'), (int, float))]
+    ok = bool(offers) or not errors
+    stats.finish(ok)
+    return {
+        'upc': upc,
+        'query': query,
+        'status': 'ok' if ok else 'error',
+        'offers': offers,
+        'total_offers': len(offers),
+        'min_price': min(prices) if prices else None,
+        'max_price': max(prices) if prices else None,
+        'partial': bool((search or {}).get('partial') or (shopping or {}).get('partial')),
+        'errors': errors,
+        'timing_ms': timing,
+        'repriced_at': int(time.time()),
+    }
+
+
+def _cached_search(upc, query, use_cache):
+    if not use_cache:
+        return _run_search(upc, query)
+    payload, _ = SEARCH_CACHE.fetch(cache_key(upc, query), lambda: _run_search(upc, query),
+                                    cacheable=_search_cacheable)
+    return payload
+
+
+def _cached_shopping(upc, query, use_cache):
+    if not use_cache:
+        return _run_shopping(query, upc)
+    payload, _ = SHOPPING_CACHE.fetch(cache_key(upc, query), lambda: _run_shopping(query, upc),
+                                      cacheable=_shopping_cacheable)
+    return payload
+
+
+# ===================== Main =====================
+def run(args) -> dict:
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+    done = load_done(args.output)
+    stats = Stats()
+    out = Output(args.output)
+    last_report = time.monotonic()
+    seen = set(done)
+
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            running = set()
+            for upc, query in read_items(args.input):
+                if upc in seen:
+                    if upc in done:
+                        stats.skipped += 1
+                    continue
+                seen.add(upc)
+                # Pocas tareas en vuelo: la entrada se lee a la par del avance
+                while len(running) >= args.workers * 2:
+                    finished, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        out.write(future.result())
+                running.add(pool.submit(reprice, upc, query, args, stats))
+                if time.monotonic() - last_report >= args.report_every:
+                    _print_report(stats)
+                    last_report = time.monotonic()
+            for future in running:
+                out.write(future.result())
+    finally:
+        out.close()
+
+    report = stats.report()
+    report['upstreams'] = governor_state()
+    return report
+
+
+def _print_report(stats):
+    r = stats.report()
+    rates = '  '.join(f"{s} {v['error_rate'] * 100:.1f}%" for s, v in r['stages'].items() if v['attempts'])
+    print(f"[{r['elapsed_s']:>7.1f}s] {r['done']} UPCs ({r['upcs_per_s']:.2f}/s), "
+          f"{r['failed']} con error | errores por etapa: {rates or '-'}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('input')
+    parser.add_argument('output')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--stages', default=','.join(STAGES))
+    parser.add_argument('--max-links', type=int, default=3)
+    parser.add_argument('--deadline-ms', type=int, default=0)
+    parser.add_argument('--use-cache', action='store_true')
+    parser.add_argument('--restart', action='store_true')
+    parser.add_argument('--report-every', type=float, default=10)
+    args = parser.parse_args()
+    args.stages = [s for s in args.stages.split(',') if s in STAGES]
+
+    report = run(args)
+    print(json.dumps(report, ensure_ascii=False, indent=1))
+
+
+if __name__ == '__main__':
+    main()